@@ -1,5 +1,6 @@
 import asyncio
-from collections.abc import Awaitable
+from collections.abc import Awaitable, Callable
+from typing import Any
 
 
 async def bind(future: asyncio.Future, awaitable: Awaitable):
@@ -84,3 +85,37 @@ class DelayedCallback:
             await task
         except asyncio.CancelledError:
             pass
+
+
+class OrderedTasks:
+    """
+    Runs tasks concurrently, but finishes them in the order they were added,
+    e.g. so results are published in order even if a later one is ready first.
+
+    Each task awaits its `prepare` awaitable right away, then waits for the
+    previous task to be done, then calls `finish` with the result. References
+    to the tasks are kept, so they aren't garbage collected.
+    """
+
+    def __init__(self):
+        self._last: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def add(self, prepare: Awaitable, finish: Callable[[Any], Awaitable]) -> asyncio.Task:
+        task = asyncio.create_task(self._run(prepare, finish, self._last))
+        self._last = task
+
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return task
+
+    @staticmethod
+    async def _run(prepare: Awaitable, finish: Callable[[Any], Awaitable], previous: asyncio.Task | None) -> None:
+        result = await prepare
+
+        # Only wait for it to be done; whether it failed is its own concern
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        await finish(result)
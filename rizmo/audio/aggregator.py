@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class FrameAggregator:
+    """
+    Concatenates consecutive small audio frames into larger messages, so
+    frames can be captured with low latency without sending a message for
+    every frame.
+
+    A message is complete once it has `frames_per_message` frames. If
+    `onset_ratio` is set, a message is also completed early by a frame whose
+    peak rises above `onset_ratio` times the noise floor, so the start of
+    speech isn't held back waiting for the rest of the message.
+    """
+
+    def __init__(
+            self,
+            frame_size: int,
+            frames_per_message: int,
+            channels: int = 1,
+            onset_ratio: float = None,
+            noise_floor_alpha: float = 0.01,
+    ):
+        """
+        Args:
+            frame_size: Maximum number of samples per frame.
+            frames_per_message: Number of frames per message.
+            channels: Number of channels per sample.
+            onset_ratio: Peak to noise floor ratio of an onset frame.
+                None to disable completing messages early on onsets.
+            noise_floor_alpha: How quickly the noise floor rises towards
+                the peak of louder frames. It falls immediately to the peak
+                of quieter frames.
+        """
+
+        self.frames_per_message = frames_per_message
+        self.onset_ratio = onset_ratio
+        self.noise_floor_alpha = noise_floor_alpha
+
+        self._buffer = np.zeros((frame_size * frames_per_message, channels), dtype=np.float32)
+        self._size = 0
+        self._frames = 0
+        self._timestamp = 0.
+
+        self._noise_floor: float | None = None
+        self._in_onset = False
+
+        self.onsets = 0
+
+    def add(self, frame: np.ndarray, timestamp: float) -> tuple[np.ndarray, float] | None:
+        """
+        Adds the frame, and returns the completed message and the timestamp
+        of its first frame, or None if the message is not complete yet.
+        """
+
+        if not self._frames:
+            self._timestamp = timestamp
+
+        size = self._size + len(frame)
+        self._buffer[self._size:size] = frame
+        self._size = size
+        self._frames += 1
+
+        onset = self.onset_ratio is not None and self._is_onset(frame)
+
+        if self._frames < self.frames_per_message and not onset:
+            return None
+
+        message = self._buffer[:self._size].copy()
+        self._size = 0
+        self._frames = 0
+
+        return message, self._timestamp
+
+    def _is_onset(self, frame: np.ndarray) -> bool:
+        peak = float(np.abs(frame).max())
+
+        if self._noise_floor is None or peak < self._noise_floor:
+            self._noise_floor = peak
+        else:
+            self._noise_floor += self.noise_floor_alpha * (peak - self._noise_floor)
+
+        # Only the first loud frame is an onset
+        loud = peak > self.onset_ratio * self._noise_floor
+        onset = loud and not self._in_onset
+        self._in_onset = loud
+
+        self.onsets += onset
+        return onset
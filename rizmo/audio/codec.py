@@ -0,0 +1,158 @@
+import zlib
+from dataclasses import dataclass, field
+from typing import Literal
+
+import numpy as np
+
+Encoding = Literal['float32', 'pcm16', 'mulaw', 'lossless']
+
+MU = 255
+
+
+@dataclass
+class EncodedAudio:
+    """
+    Audio signal in a compact wire format, decoded lazily on first access to
+    `signal`. It has the same `signal` and `sample_rate` attributes as
+    `voicebox.audio.Audio`, so it can be used in its place.
+
+    Encodings:
+    - "float32": Uncompressed 32-bit floats.
+    - "pcm16": 16-bit PCM; half the size of float32.
+    - "mulaw": 8-bit μ-law; a quarter of the size of float32, but lossy.
+    - "lossless": 16-bit PCM, losslessly compressed FLAC-style with a
+      fixed second-order predictor, and zlib on the byte planes of the
+      residuals.
+    """
+
+    data: bytes
+    sample_rate: int
+    sequence: int
+    """Incremented by the sender for every message, so receivers can detect dropped messages."""
+
+    encoding: Encoding = 'pcm16'
+    channels: int = 1
+
+    _signal: np.ndarray | None = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def encode(
+            cls,
+            signal: np.ndarray,
+            sample_rate: int,
+            sequence: int,
+            encoding: Encoding = 'pcm16',
+    ) -> 'EncodedAudio':
+        """
+        Args:
+            signal: Samples in range [-1, 1], of shape (samples,) or (samples, channels).
+            sample_rate: Samples per second.
+            sequence: Sequence number of the message.
+            encoding: Wire format to encode the signal as.
+        """
+
+        channels = signal.shape[1] if signal.ndim > 1 else 1
+        data = ENCODERS[encoding](signal.reshape(-1))
+
+        # Keep the signal, so it doesn't need decoding if used before sending
+        return cls(data, sample_rate, sequence, encoding, channels, _signal=signal)
+
+    @property
+    def signal(self) -> np.ndarray:
+        """The decoded float32 signal, of shape (samples, channels)."""
+
+        if self._signal is None:
+            signal = DECODERS[self.encoding](self.data)
+            self._signal = signal.reshape(-1, self.channels)
+
+        return self._signal
+
+    def to_pcm16_bytes(self) -> bytes:
+        """Returns the signal as 16-bit PCM, without re-encoding it if it already is."""
+        return self.data if self.encoding == 'pcm16' else encode_pcm16(self.signal)
+
+    @property
+    def len_seconds(self) -> float:
+        return len(self) / self.sample_rate
+
+    def __len__(self) -> int:
+        return len(self.signal)
+
+    def __getstate__(self) -> dict:
+        # Only send the encoded data
+        state = self.__dict__.copy()
+        state['_signal'] = None
+        return state
+
+
+def encode_float32(signal: np.ndarray) -> bytes:
+    return signal.astype(np.float32, copy=False).tobytes()
+
+
+def decode_float32(data: bytes) -> np.ndarray:
+    # Copied, since arrays over bytes are read-only
+    return np.frombuffer(data, dtype=np.float32).copy()
+
+
+def to_pcm16(signal: np.ndarray) -> np.ndarray:
+    return np.round(np.clip(signal, -1, 1) * 32767).astype(np.int16)
+
+
+def encode_pcm16(signal: np.ndarray) -> bytes:
+    return to_pcm16(signal).tobytes()
+
+
+def decode_pcm16(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.int16) * np.float32(1 / 32767)
+
+
+def encode_mulaw(signal: np.ndarray) -> bytes:
+    signal = np.clip(signal, -1, 1).astype(np.float32, copy=False)
+    companded = np.sign(signal) * np.log1p(MU * np.abs(signal)) / np.log1p(MU)
+    return np.round(companded * 127).astype(np.int8).tobytes()
+
+
+def decode_mulaw(data: bytes) -> np.ndarray:
+    companded = np.frombuffer(data, dtype=np.int8) * np.float32(1 / 127)
+    return np.sign(companded) * np.expm1(np.abs(companded) * np.float32(np.log1p(MU))) / np.float32(MU)
+
+
+def encode_lossless(signal: np.ndarray) -> bytes:
+    samples = to_pcm16(signal).astype(np.int32)
+
+    # Fixed second-order prediction, like FLAC: x[n] - (2 x[n-1] - x[n-2]),
+    # i.e. the second difference, with zeros before the first sample.
+    residuals = np.diff(samples, n=2, prepend=[0, 0])
+
+    # Zigzag-encode, so small negative residuals are small too,
+    # and group the bytes by significance, which compresses much better.
+    zigzag = ((residuals << 1) ^ (residuals >> 31)).astype(np.uint32)
+    planes = zigzag.view(np.uint8).reshape(-1, 4).T
+
+    return zlib.compress(planes.tobytes(), level=1)
+
+
+def decode_lossless(data: bytes) -> np.ndarray:
+    planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(4, -1)
+    zigzag = np.ascontiguousarray(planes.T).view(np.uint32).reshape(-1)
+    residuals = (zigzag >> 1).astype(np.int32) ^ -(zigzag & 1).astype(np.int32)
+
+    # Undo the second difference
+    samples = np.cumsum(np.cumsum(residuals, dtype=np.int32), dtype=np.int32)
+
+    return samples.astype(np.int16) * np.float32(1 / 32767)
+
+
+ENCODERS = {
+    'float32': encode_float32,
+    'pcm16': encode_pcm16,
+    'mulaw': encode_mulaw,
+    'lossless': encode_lossless,
+}
+
+DECODERS = {
+    'float32': decode_float32,
+    'pcm16': decode_pcm16,
+    'mulaw': decode_mulaw,
+    'lossless': decode_lossless,
+}
@@ -0,0 +1,179 @@
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class BlockInfo:
+    """Info about the block being processed, shared between processors."""
+
+    sample_rate: int
+    samples: int
+
+    input_peak: float
+    """Peak absolute value of the block before any processing."""
+
+    peak: float
+    """
+    Peak absolute value of the block after the processors so far.
+    Processors that change the block must keep this up to date.
+    """
+
+
+class AudioProcessor(ABC):
+    @abstractmethod
+    def process(self, block: np.ndarray, info: BlockInfo) -> None:
+        """Processes the float32 block in place."""
+        ...
+
+
+class ProcessingChain:
+    """
+    Runs audio processors on each block in order, in place.
+
+    The peak of each block is only computed once, and is shared with all
+    processors, which keep it up to date, so they don't have to compute it.
+    """
+
+    def __init__(self, processors: Sequence[AudioProcessor]):
+        self.processors = processors
+        self._scratch = np.empty(0, dtype=np.float32)
+
+    def __call__(self, block: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Processes the block in place and returns it. The block must be float32."""
+
+        if self._scratch.size < block.size:
+            self._scratch = np.empty(max(block.size, 2 * self._scratch.size), dtype=np.float32)
+
+        input_peak = peak(block, self._scratch[:block.size].reshape(block.shape))
+        info = BlockInfo(sample_rate, len(block), input_peak, input_peak)
+
+        for processor in self.processors:
+            processor.process(block, info)
+
+        return block
+
+
+def peak(block: np.ndarray, scratch: np.ndarray = None) -> float:
+    """
+    Returns the peak absolute value of the block. If given a scratch array
+    of the same shape to compute the absolute values into, does not allocate.
+    """
+
+    return float(np.abs(block, out=scratch).max()) if block.size else 0.
+
+
+class GainControl(ABC):
+    @abstractmethod
+    def get_gain(self, info: BlockInfo) -> float:
+        ...
+
+
+class FixedGain(GainControl):
+    def __init__(self, gain: float = 1.):
+        self.gain = gain
+
+    def get_gain(self, info: BlockInfo) -> float:
+        return self.gain
+
+
+class LimitedMaxPowerGainControl(GainControl):
+    """
+    Increases the gain exponentially until the max power of the signal
+    reaches the target power.
+    """
+
+    def __init__(
+            self,
+            target_power: float = 1.,
+            max_gain: float = 100.,
+            alpha: float = 2.,
+    ):
+        self.target_power = target_power
+        self.max_gain = max_gain
+        self.alpha = alpha
+
+        self._dt = 0.
+
+    def get_gain(self, info: BlockInfo) -> float:
+        self._dt += info.samples / info.sample_rate
+
+        # Calculate max_exp instead of limiting gain post-calc to avoid overflows
+        max_exp = np.log2(self.max_gain + 1)
+        exp = min(self.alpha * self._dt, max_exp)
+        gain = 2 ** exp - 1
+
+        power = info.peak
+
+        gained_power = gain * power
+        if gained_power > self.target_power:
+            gain = self.target_power / (power + 1e-6)
+            self._dt = np.log2(gain + 1) / self.alpha
+
+        return gain
+
+
+class Gain(AudioProcessor):
+    def __init__(self, gain_control: GainControl):
+        self.gain_control = gain_control
+
+    def process(self, block: np.ndarray, info: BlockInfo) -> None:
+        gain = self.gain_control.get_gain(info)
+
+        block *= np.float32(gain)
+        info.peak *= gain
+
+
+class Limiter(AudioProcessor):
+    """Clips the signal to the range [-limit, limit]."""
+
+    def __init__(self, limit: float = 1.):
+        self.limit = limit
+
+    def process(self, block: np.ndarray, info: BlockInfo) -> None:
+        # Nothing to do most of the time
+        if info.peak <= self.limit:
+            return
+
+        np.clip(block, -self.limit, self.limit, out=block)
+        info.peak = self.limit
+
+
+class Gate(AudioProcessor):
+    """
+    Attenuates the signal exponentially while the input peak is below
+    the threshold, and opens immediately once it is above it.
+    """
+
+    def __init__(
+            self,
+            threshold: float,
+            attack: float,
+            debug: bool = False,
+    ):
+        self.threshold = threshold
+        self.attack = attack
+        self.debug = debug
+
+        self._gate_closed_time = 0.
+
+    def process(self, block: np.ndarray, info: BlockInfo) -> None:
+        if info.input_peak >= self.threshold:
+            if self.debug:
+                print(f'Gate open; threshold={self.threshold}')
+
+            self._gate_closed_time = 0.
+            return
+
+        self._gate_closed_time += info.samples / info.sample_rate
+
+        # Negative exponent, so a long-closed gate underflows to 0 instead of overflowing
+        gain = 2. ** -(self._gate_closed_time * self.attack)
+
+        if self.debug:
+            print(f'Gate closed; threshold={self.threshold}; gain={gain}')
+
+        block *= np.float32(gain)
+        info.peak *= gain
@@ -0,0 +1,106 @@
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class Block:
+    signal: np.ndarray
+    timestamp: float
+    """Timestamp given by the producer, e.g. the ADC time of the block."""
+
+    write_time: float
+    """When the block was written, from `time.monotonic()`."""
+
+
+class BlockRingBuffer:
+    """
+    Single-producer, single-consumer ring buffer of audio blocks,
+    preallocated so writing a block is only a copy.
+
+    The producer (e.g. a PortAudio callback thread) only advances the write
+    count, and the consumer (e.g. an asyncio task) only advances the read
+    count, so neither needs a lock. If the consumer falls behind and the
+    buffer is full, new blocks are dropped and counted as overflows.
+    """
+
+    def __init__(self, capacity: int, max_block_size: int, channels: int = 1, dtype: np.dtype = np.float32):
+        """
+        Args:
+            capacity: Maximum number of blocks in the buffer.
+            max_block_size: Maximum number of frames per block.
+            channels: Number of channels per frame.
+            dtype: Sample type of the blocks.
+        """
+
+        self.capacity = capacity
+
+        self._signals = np.zeros((capacity, max_block_size, channels), dtype=dtype)
+        self._sizes = np.zeros(capacity, dtype=np.int64)
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._write_times = np.zeros(capacity, dtype=np.float64)
+
+        # Total number of blocks ever written and read;
+        # each is only changed by one side.
+        self._write_count = 0
+        self._read_count = 0
+
+        self.overflows = 0
+        """Blocks dropped because the buffer was full. Only changed by the producer."""
+
+    def __len__(self) -> int:
+        return self._write_count - self._read_count
+
+    def write(self, signal: np.ndarray, timestamp: float) -> bool:
+        """
+        Copies the block into the buffer. Returns false, and counts an
+        overflow, if the buffer was full. Only call from the producer.
+        """
+
+        if len(self) >= self.capacity:
+            self.overflows += 1
+            return False
+
+        i = self._write_count % self.capacity
+        size = len(signal)
+
+        self._signals[i, :size] = signal
+        self._sizes[i] = size
+        self._timestamps[i] = timestamp
+        self._write_times[i] = time.monotonic()
+
+        # Only make the block visible to the consumer once it is written
+        self._write_count += 1
+        return True
+
+    def read_all(self) -> list[Block]:
+        """
+        Returns copies of all blocks in the buffer, oldest first.
+        Only call from the consumer.
+
+        Finding the buffer empty is normal, e.g. when several writes wake the
+        consumer once and it already read their blocks, so it is not counted;
+        input underflows are counted from the PortAudio status instead.
+        """
+
+        blocks = []
+        for _ in range(len(self)):
+            i = self._read_count % self.capacity
+
+            blocks.append(Block(
+                self._signals[i, :self._sizes[i]].copy(),
+                float(self._timestamps[i]),
+                float(self._write_times[i]),
+            ))
+
+            # Only free the slot for the producer once it is copied
+            self._read_count += 1
+
+        return blocks
+
+    def __str__(self) -> str:
+        return (
+            f'Ring buffer: size={len(self)}/{self.capacity} '
+            f'overflows={self.overflows}'
+        )
@@ -0,0 +1,383 @@
+"""
+Collecting, queueing, and incrementally committing the transcriptions of
+utterances for the ASR node, without the model, so the `vad_asr` node and
+the benchmarks can share it.
+"""
+
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Condition
+
+import numpy as np
+from voicebox.audio import Audio
+
+from rizmo.audio.utterance import UtteranceBuffer
+from rizmo.metrics import Histogram
+
+PRE_BUFFER_DURATION_S = 1.
+"""How much previous audio to prepend to the audio buffer when voice is detected."""
+
+
+@dataclass
+class TranscriptionRequest:
+    audio: Audio
+    """Audio of the utterance so far, or all of it if final."""
+
+    utterance: int
+    """Number of the utterance, so partial results of different utterances aren't mixed."""
+
+    final: bool = True
+    """False for a partial transcription of an utterance that is still going."""
+
+    pre_roll: int = 0
+    """Number of samples at the start of the audio from before voice was detected."""
+
+    start: int | None = None
+    """
+    Position of the first sample of the audio in the audio stream, so
+    utterances can be merged without repeating the audio they share, e.g.
+    when the pre-roll of one overlaps the end of the previous one.
+    Utterances without it are not merged.
+    """
+
+    created: float = field(default_factory=time.monotonic)
+    """When the request was made, from `time.monotonic()`."""
+
+
+class TranscriptionQueue:
+    """
+    Bounded queue of transcription requests for the ASR thread, which keeps
+    the transcripts timely when transcription falls behind, e.g. with long
+    utterances, or the GPU shared with other nodes:
+
+    - Final transcriptions come before partial ones, and only the latest
+      partial transcription is kept.
+    - Utterances waiting longer than `max_age` seconds are dropped, as are
+      the oldest ones if more than `max_size` are waiting.
+    - Consecutive waiting utterances are merged into one transcription of
+      up to `merge_duration` seconds of audio, since Whisper encodes 30 s
+      of audio per call, however short the utterance. The audio they share,
+      if any, is only included once.
+    """
+
+    def __init__(self, max_size: int = 4, max_age: float = 10., merge_duration: float = 10.):
+        """
+        Args:
+            max_size: Maximum number of utterances waiting to be transcribed.
+            max_age: Maximum time an utterance can wait to be transcribed, in seconds.
+            merge_duration: Maximum duration of merged utterances, in seconds. 0 to disable.
+        """
+
+        self.max_size = max_size
+        self.max_age = max_age
+        self.merge_duration = merge_duration
+
+        self._finals: deque[TranscriptionRequest] = deque()
+        self._partial: TranscriptionRequest | None = None
+        self._stopped = False
+        self._condition = Condition()
+
+        self.stale_drops = 0
+        self.overflow_drops = 0
+        self.merges = 0
+        self.max_depth = 0
+
+        self.wait_times = Histogram('ASR wait', [100, 200, 500, 1000, 2000, 5000], unit='ms')
+        """Time from each utterance ending to it being transcribed."""
+
+    def __len__(self) -> int:
+        return len(self._finals) + (self._partial is not None)
+
+    def put(self, request: TranscriptionRequest) -> None:
+        with self._condition:
+            if request.final:
+                # Partial transcriptions are superseded by the final one
+                self._partial = None
+                self._finals.append(request)
+
+                while len(self._finals) > self.max_size:
+                    self._finals.popleft()
+                    self.overflow_drops += 1
+                    print('[ASR queue full; dropped utterance]')
+            else:
+                self._partial = request
+
+            self.max_depth = max(self.max_depth, len(self))
+            self._condition.notify()
+
+    def get(self) -> TranscriptionRequest | None:
+        """Waits for the next request to transcribe, and returns it, or None once stopped."""
+
+        with self._condition:
+            while not self._stopped:
+                self._drop_stale()
+
+                if self._finals:
+                    return self._pop_final()
+
+                if self._partial is not None:
+                    request, self._partial = self._partial, None
+                    return request
+
+                self._condition.wait()
+
+            return None
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def reset(self) -> None:
+        """Resets the max depth, so each report only covers the last interval."""
+        self.max_depth = len(self)
+
+    def _drop_stale(self) -> None:
+        now = time.monotonic()
+
+        while self._finals and now - self._finals[0].created > self.max_age:
+            self._finals.popleft()
+            self.stale_drops += 1
+            print('[ASR behind; dropped stale utterance]')
+
+    def _pop_final(self) -> TranscriptionRequest:
+        request = self._finals.popleft()
+        self._add_wait_time(request)
+
+        while self._finals and self._can_merge(request, self._finals[0]):
+            next_request = self._finals.popleft()
+            self._add_wait_time(next_request)
+
+            next_signal = next_request.audio.signal[self._get_overlap(request, next_request):]
+            request = TranscriptionRequest(
+                Audio(np.concatenate((request.audio.signal, next_signal)), request.audio.sample_rate),
+                request.utterance,
+                pre_roll=request.pre_roll,
+                start=request.start,
+                created=request.created,
+            )
+
+            self.merges += 1
+
+        return request
+
+    def _can_merge(self, request: TranscriptionRequest, next_request: TranscriptionRequest) -> bool:
+        if request.start is None or next_request.start is None:
+            return False
+
+        audio, next_audio = request.audio, next_request.audio
+        if audio.sample_rate != next_audio.sample_rate:
+            return False
+
+        samples = len(audio.signal) + len(next_audio.signal) - self._get_overlap(request, next_request)
+        return samples / audio.sample_rate <= self.merge_duration
+
+    @staticmethod
+    def _get_overlap(request: TranscriptionRequest, next_request: TranscriptionRequest) -> int:
+        """Returns the number of samples at the start of the next request that end the first."""
+
+        overlap = request.start + len(request.audio.signal) - next_request.start
+        return min(max(0, overlap), len(next_request.audio.signal))
+
+    def _add_wait_time(self, request: TranscriptionRequest) -> None:
+        self.wait_times.add(1000 * (time.monotonic() - request.created))
+
+    def __str__(self) -> str:
+        return (
+            f'ASR queue: depth={len(self)}/{self.max_size} max_depth={self.max_depth} '
+            f'stale_drops={self.stale_drops} overflow_drops={self.overflow_drops} '
+            f'merges={self.merges}'
+        )
+
+
+@dataclass
+class Word:
+    text: str
+    end: float
+    """End of the word, in seconds from the start of the transcribed audio."""
+
+
+class LocalAgreement:
+    """
+    Commits the start of the transcript of a growing utterance, once two
+    successive partial transcriptions agree on it, i.e. the "local agreement"
+    policy. The audio of the committed words doesn't need to be transcribed
+    again, so each transcription, and the final one in particular, only
+    covers the audio after them.
+    """
+
+    def __init__(self, utterance: int):
+        self.utterance = utterance
+
+        self.committed_text = ''
+        self.committed_time = 0.
+        """End of the last committed word, in seconds from the start of the utterance."""
+
+        self._previous_words: list[Word] = []
+
+    def update(self, words: list[Word]) -> str:
+        """
+        Commits the words agreed on with the previous transcription, and
+        returns the partial transcript.
+
+        Args:
+            words: Transcription of the audio after `committed_time`,
+                with the ends of the words relative to it.
+        """
+
+        # The last word is never committed, since it may be cut off
+        agreed = 0
+        for previous, word in zip(self._previous_words, words[:-1]):
+            if _normalize(previous.text) != _normalize(word.text):
+                break
+            agreed += 1
+
+        if agreed:
+            end = words[agreed - 1].end
+            self.committed_text += ''.join(w.text for w in words[:agreed])
+            self.committed_time += end
+
+            # Kept relative to the new commit time, for the next comparison
+            words = [Word(w.text, w.end - end) for w in words[agreed:]]
+
+        self._previous_words = words
+
+        return (self.committed_text + ''.join(w.text for w in words)).strip()
+
+    def finalize(self, text: str) -> str:
+        """Returns the final transcript, given the transcription of the audio after `committed_time`."""
+        return (self.committed_text + ' ' + text).strip()
+
+
+def _normalize(word: str) -> str:
+    return ''.join(c for c in word.lower() if c.isalnum())
+
+
+class MaxDurationAudioBuffer:
+    def __init__(self, max_duration: float):
+        self.max_duration = max_duration
+        self._buffer = deque()
+
+    def __iter__(self):
+        return iter(self._buffer)
+
+    def append(self, audio: Audio) -> None:
+        self._buffer.append(audio)
+
+        duration = sum(a.len_seconds for a in self._buffer)
+        while duration > self.max_duration:
+            removed_audio = self._buffer.popleft()
+            duration -= removed_audio.len_seconds
+
+
+class UtteranceCollector:
+    """
+    Collects the audio of each utterance from `VOICE_DETECTED` messages,
+    starting with the audio from just before voice was detected.
+
+    A message with the same sequence number as the previous one, e.g. one
+    passed again to end the voice, only updates whether voice is detected;
+    its audio is not added again, so utterances never repeat audio.
+    """
+
+    def __init__(
+            self,
+            min_duration: float,
+            pre_buffer_duration: float = PRE_BUFFER_DURATION_S,
+            partial_interval: float = 0.,
+    ):
+        """
+        Args:
+            min_duration: Minimum duration of an utterance to transcribe, in seconds.
+            pre_buffer_duration: How much audio from before voice was detected to include.
+            partial_interval: How often to request a partial transcription of
+                the utterance while it continues, in seconds. 0 to disable.
+        """
+
+        self.min_duration = min_duration
+        self.partial_interval = partial_interval
+
+        self.self_speaking = False
+        """Set while the robot is speaking, so it doesn't transcribe itself."""
+
+        self._most_recent_audios = MaxDurationAudioBuffer(max_duration=pre_buffer_duration)
+        self._buffer = UtteranceBuffer()
+        self._sample_rate: int | None = None
+        self._utterance = 0
+        self._pre_roll = 0
+        self._start = 0
+        self._position = 0
+        """Number of samples added so far, i.e. the position in the audio stream."""
+        self._last_sequence: int | None = None
+        self._next_partial = 0.
+
+    def add(self, audio: Audio, voice_detected: bool) -> TranscriptionRequest | None:
+        """
+        Adds the next message, and returns the request to transcribe the
+        utterance if it just ended, or if a partial transcription is due.
+        """
+
+        # Only `EncodedAudio` messages have a sequence number
+        sequence = getattr(audio, 'sequence', None)
+        repeated = sequence is not None and sequence == self._last_sequence
+
+        if not repeated:
+            self._most_recent_audios.append(audio)
+            self._position += audio.signal.size
+            self._last_sequence = sequence
+
+        collecting = self._sample_rate is not None
+
+        # Do not transcribe while speaking
+        if self.self_speaking:
+            if collecting:
+                print('[Speaking; ASR disabled]')
+                self._clear()
+
+            return None
+
+        if voice_detected:
+            if not collecting:
+                print('Transcribing... ')
+                self._sample_rate = audio.sample_rate
+                self._utterance += 1
+                self._next_partial = max(self.min_duration, self.partial_interval)
+
+                for recent_audio in self._most_recent_audios:
+                    self._buffer.append(recent_audio.signal)
+
+                # The most recent audio is this message, the first with voice
+                self._pre_roll = len(self._buffer) - audio.signal.size
+                self._start = self._position - len(self._buffer)
+            elif not repeated:
+                self._buffer.append(audio.signal)
+
+            duration = len(self._buffer) / self._sample_rate
+            if not self.partial_interval or duration < self._next_partial:
+                return None
+
+            self._next_partial = duration + self.partial_interval
+            return TranscriptionRequest(
+                Audio(self._buffer.copy(), self._sample_rate),
+                self._utterance,
+                final=False,
+                pre_roll=self._pre_roll,
+                start=self._start,
+            )
+
+        if not collecting:
+            return None
+
+        utterance = Audio(self._buffer.take(), self._sample_rate)
+        self._sample_rate = None
+
+        if utterance.len_seconds >= self.min_duration:
+            return TranscriptionRequest(utterance, self._utterance, pre_roll=self._pre_roll, start=self._start)
+
+        print('[Too short]')
+        return None
+
+    def _clear(self) -> None:
+        self._buffer.clear()
+        self._sample_rate = None
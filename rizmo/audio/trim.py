@@ -0,0 +1,117 @@
+import numpy as np
+from voicebox.audio import Audio
+
+
+class SpeechTrimmer:
+    """
+    Trims the silence at the edges of an utterance before it is transcribed,
+    and rejects utterances with too little speech, e.g. noise bursts the VAD
+    flickered on, which cost a full decode, and often make Whisper
+    hallucinate text.
+
+    A frame is speech if its energy is at least `threshold_db` above the
+    noise floor, i.e. the `noise_percentile` percentile of the energies of
+    the frames from before voice was detected, if the utterance starts with
+    enough of them. Otherwise, it is the percentile of the whole utterance,
+    but at most `max_noise_floor_db`, so an utterance that is all speech,
+    e.g. the tail of one whose start was already transcribed, is not taken
+    for noise.
+    """
+
+    def __init__(
+            self,
+            frame_duration: float = 0.02,
+            threshold_db: float = 9.,
+            noise_percentile: float = 10.,
+            margin: float = 0.2,
+            min_speech: float = 0.1,
+            min_speech_ratio: float = 0.1,
+            max_noise_floor_db: float = -50.,
+            min_noise_duration: float = 0.2,
+    ):
+        """
+        Args:
+            frame_duration: Duration of the analysis frames, in seconds.
+            threshold_db: Energy above the noise floor of a speech frame, in dB.
+            noise_percentile: Percentile of the frame energies used as the noise floor.
+            margin: Audio to keep before the first and after the last speech frame, in seconds.
+            min_speech: Minimum duration of the speech frames, in seconds.
+            min_speech_ratio: Minimum fraction of the frames that are speech.
+            max_noise_floor_db: Maximum noise floor, in dB relative to full scale,
+                when it is estimated from the whole utterance.
+            min_noise_duration: Minimum duration of the audio from before voice
+                was detected to estimate the noise floor from, in seconds.
+        """
+
+        self.frame_duration = frame_duration
+        self.threshold_db = threshold_db
+        self.noise_percentile = noise_percentile
+        self.margin = margin
+        self.min_speech = min_speech
+        self.min_speech_ratio = min_speech_ratio
+        self.max_noise_floor_db = max_noise_floor_db
+        self.min_noise_duration = min_noise_duration
+
+        self.accepted = 0
+        self.rejected = 0
+        self.trimmed_seconds = 0.
+        """Seconds of audio trimmed from the edges of the accepted utterances."""
+        self.rejected_seconds = 0.
+        """Seconds of audio in the rejected utterances."""
+
+    def __call__(self, audio: Audio, noise: int = 0, reject: bool = True) -> Audio | None:
+        """
+        Returns the audio trimmed to the speech, or None if it has too little speech.
+
+        Args:
+            audio: Audio of the utterance.
+            noise: Number of samples at the start of the audio from before voice was detected.
+            reject: If false, the audio is never rejected; if it has no speech
+                frames at all, it is returned untrimmed.
+        """
+
+        signal = audio.signal.reshape(-1)
+        frame_size = max(1, round(self.frame_duration * audio.sample_rate))
+        frame_count = len(signal) // frame_size
+
+        frames = signal[:frame_count * frame_size].reshape(frame_count, frame_size)
+        energies_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+
+        if frame_count:
+            noise_floor_db = self._get_noise_floor_db(energies_db, noise // frame_size)
+            speech_frames = np.flatnonzero(energies_db >= noise_floor_db + self.threshold_db)
+        else:
+            speech_frames = np.empty(0, dtype=np.int64)
+
+        speech_duration = len(speech_frames) * frame_size / audio.sample_rate
+        too_little_speech = speech_duration < self.min_speech or len(speech_frames) < self.min_speech_ratio * frame_count
+        if reject and too_little_speech:
+            self.rejected += 1
+            self.rejected_seconds += audio.len_seconds
+            return None
+
+        if not len(speech_frames):
+            self.accepted += 1
+            return audio
+
+        margin = round(self.margin * audio.sample_rate)
+        start = max(0, speech_frames[0] * frame_size - margin)
+        end = min(len(signal), (speech_frames[-1] + 1) * frame_size + margin)
+
+        self.accepted += 1
+        self.trimmed_seconds += (len(signal) - (end - start)) / audio.sample_rate
+
+        return Audio(signal[start:end], audio.sample_rate)
+
+    def _get_noise_floor_db(self, energies_db: np.ndarray, noise_frames: int) -> float:
+        if noise_frames * self.frame_duration >= self.min_noise_duration:
+            return np.percentile(energies_db[:noise_frames], self.noise_percentile)
+
+        return min(np.percentile(energies_db, self.noise_percentile), self.max_noise_floor_db)
+
+    def __str__(self) -> str:
+        return (
+            f'Speech trimmer: rejected={self.rejected}/{self.accepted + self.rejected}; '
+            f'saved={self.trimmed_seconds + self.rejected_seconds:.1f}s '
+            f'(trimmed={self.trimmed_seconds:.1f}s, rejected={self.rejected_seconds:.1f}s)'
+        )
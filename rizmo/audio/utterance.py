@@ -0,0 +1,50 @@
+import numpy as np
+
+
+class UtteranceBuffer:
+    """
+    Buffer of the audio of an utterance, preallocated and grown by doubling,
+    so adding each message is only a copy into it, instead of keeping every
+    message and concatenating them when the utterance ends.
+    """
+
+    def __init__(self, initial_duration: float = 10., sample_rate: int = 16000):
+        """
+        Args:
+            initial_duration: Duration of audio to preallocate, in seconds.
+            sample_rate: Sample rate of the audio.
+        """
+
+        self._buffer = np.empty(round(initial_duration * sample_rate), dtype=np.float32)
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def append(self, signal: np.ndarray) -> None:
+        """Appends the signal, flattened, like `np.concatenate(...).flatten()`."""
+
+        signal = signal.reshape(-1)
+        end = self._len + len(signal)
+
+        if end > len(self._buffer):
+            buffer = np.empty(max(end, 2 * len(self._buffer)), dtype=np.float32)
+            buffer[:self._len] = self._buffer[:self._len]
+            self._buffer = buffer
+
+        self._buffer[self._len:end] = signal
+        self._len = end
+
+    def copy(self) -> np.ndarray:
+        """Returns a copy of the audio so far."""
+        return self._buffer[:self._len].copy()
+
+    def take(self) -> np.ndarray:
+        """Returns a copy of the audio, and clears the buffer for the next utterance."""
+
+        signal = self._buffer[:self._len].copy()
+        self._len = 0
+        return signal
+
+    def clear(self) -> None:
+        self._len = 0
@@ -0,0 +1,326 @@
+"""
+Voice activity detectors (VADs).
+
+- `EnergyVad` runs on the CPU with negligible cost, so it can run anywhere,
+  e.g. inline in the mic node.
+- `FsmnVad` runs the `funasr` `fsmn-vad` model, which is more accurate,
+  but needs a GPU to keep up. Setup: `pip install funasr modelscope torchaudio`
+"""
+
+from abc import ABC, abstractmethod
+from typing import Literal
+
+import numpy as np
+
+from rizmo.metrics import get_memory_size
+
+VadBackend = Literal['energy', 'fsmn']
+
+
+class VoiceActivityDetector(ABC):
+    @abstractmethod
+    def detect(self, signal: np.ndarray, sample_rate: int) -> bool:
+        """
+        Processes the next block of the audio stream, and returns whether
+        voice is present at the end of it.
+
+        Args:
+            signal: Block of shape (samples,) or (samples, channels).
+            sample_rate: Sample rate of the signal.
+        """
+        ...
+
+
+class EnergyVad(VoiceActivityDetector):
+    """
+    Detects voice from the energy of the signal above the noise floor,
+    and the spectral flux of the signal, in short frames.
+
+    A frame is voiced if its energy is at least `threshold_db` above the
+    noise floor. Voice starts once `min_voice_frames` consecutive frames are
+    voiced, or immediately on a voiced frame with spectral flux of at least
+    `onset_flux`, i.e. whose spectrum changed sharply from the frame before,
+    like at the start of speech. Voice stops once no frame has been voiced
+    for `hangover` seconds, so it doesn't stop in short pauses.
+
+    The noise floor falls immediately to quieter frames, and rises slowly
+    towards louder frames, so it adapts to steady background noise.
+    """
+
+    def __init__(
+            self,
+            frame_duration: float = 0.02,
+            threshold_db: float = 9.,
+            min_voice_frames: int = 3,
+            onset_flux: float = 0.5,
+            hangover: float = 0.3,
+            noise_floor_time_constant: float = 3.,
+    ):
+        """
+        Args:
+            frame_duration: Duration of the analysis frames, in seconds.
+            threshold_db: Energy above the noise floor of a voiced frame, in dB.
+            min_voice_frames: Consecutive voiced frames needed for voice to start.
+            onset_flux: Spectral flux, in range [0, 2], of a voiced frame that
+                starts voice immediately. 2 to disable.
+            hangover: How long voice continues after the last voiced frame, in seconds.
+            noise_floor_time_constant: How quickly the noise floor rises
+                towards the energy of louder frames, in seconds.
+        """
+
+        self.frame_duration = frame_duration
+        self.threshold_db = threshold_db
+        self.min_voice_frames = min_voice_frames
+        self.onset_flux = onset_flux
+        self.hangover = hangover
+        self.noise_floor_time_constant = noise_floor_time_constant
+
+        self.voice_detected = False
+
+        self._sample_rate: int | None = None
+        self._frame_size = 0
+        self._window = np.empty(0, dtype=np.float32)
+        self._remainder = np.empty(0, dtype=np.float32)
+
+        self._noise_floor_db: float | None = None
+        self._prev_spectrum: np.ndarray | None = None
+        self._voiced_frames = 0
+        self._unvoiced_time = 0.
+
+    def detect(self, signal: np.ndarray, sample_rate: int) -> bool:
+        if sample_rate != self._sample_rate:
+            self._set_sample_rate(sample_rate)
+
+        # Mix down to mono, and prepend the incomplete frame of the last block
+        signal = signal.reshape(len(signal), -1).mean(axis=1, dtype=np.float32)
+        if len(self._remainder):
+            signal = np.concatenate((self._remainder, signal))
+
+        frame_count = len(signal) // self._frame_size
+        frames_end = frame_count * self._frame_size
+        self._remainder = signal[frames_end:].copy()
+
+        if not frame_count:
+            return self.voice_detected
+
+        frames = signal[:frames_end].reshape(frame_count, self._frame_size)
+        energies_db, fluxes = self._get_features(frames)
+
+        for energy_db, flux in zip(energies_db, fluxes):
+            self._update(float(energy_db), float(flux))
+
+        return self.voice_detected
+
+    def __str__(self) -> str:
+        noise_floor = 'n/a' if self._noise_floor_db is None else f'{self._noise_floor_db:.1f}dB'
+        return f'Energy VAD: noise_floor={noise_floor}'
+
+    def _set_sample_rate(self, sample_rate: int) -> None:
+        self._sample_rate = sample_rate
+        self._frame_size = max(1, round(self.frame_duration * sample_rate))
+        self._window = np.hanning(self._frame_size).astype(np.float32)
+        self._remainder = np.empty(0, dtype=np.float32)
+        self._prev_spectrum = None
+
+    def _get_features(self, frames: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the energy in dB, and the spectral flux, of each frame."""
+
+        energies_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+
+        # Flux is the distance between consecutive unit-norm magnitude spectra,
+        # so it measures the change of the shape of the spectrum, not the level.
+        spectra = np.abs(np.fft.rfft(frames * self._window, axis=1))
+        spectra /= np.linalg.norm(spectra, axis=1, keepdims=True) + 1e-10
+
+        prev_spectra = np.empty_like(spectra)
+        prev_spectra[1:] = spectra[:-1]
+        prev_spectra[0] = self._prev_spectrum if self._prev_spectrum is not None else spectra[0]
+        self._prev_spectrum = spectra[-1]
+
+        fluxes = np.linalg.norm(spectra - prev_spectra, axis=1)
+
+        return energies_db, fluxes
+
+    def _update(self, energy_db: float, flux: float) -> None:
+        if self._noise_floor_db is None or energy_db < self._noise_floor_db:
+            self._noise_floor_db = energy_db
+        else:
+            alpha = self.frame_duration / self.noise_floor_time_constant
+            self._noise_floor_db += alpha * (energy_db - self._noise_floor_db)
+
+        voiced = energy_db - self._noise_floor_db >= self.threshold_db
+
+        if not voiced:
+            self._voiced_frames = 0
+            self._unvoiced_time += self.frame_duration
+
+            if self._unvoiced_time > self.hangover:
+                self.voice_detected = False
+
+            return
+
+        self._voiced_frames += 1
+        self._unvoiced_time = 0.
+
+        if self._voiced_frames >= self.min_voice_frames or flux >= self.onset_flux:
+            self.voice_detected = True
+
+
+class FsmnVad(VoiceActivityDetector):
+    """
+    Runs the `funasr` `fsmn-vad` streaming model.
+
+    The model keeps the history of the stream in its cache, i.e. the audio,
+    and the energy and scores of every frame, and only drops it at the end
+    of each speech segment, so it grows without bound through long stretches
+    of silence, noise, or speech.
+
+    Once the cache holds more than `max_history` seconds, it is trimmed to
+    half of that, keeping the frames the model may still need, the same way
+    the model drops frames itself. So memory stays bounded without resetting
+    the model. If the cache doesn't have the expected structure, e.g. with
+    a different version of funasr, it is cleared when voice stops instead.
+    """
+
+    def __init__(self, device: str = 'cuda', max_history: float = 10.):
+        """
+        Args:
+            device: Device to run the model on.
+            max_history: Maximum seconds of history to keep in the model cache.
+        """
+
+        from funasr import AutoModel
+
+        self.model = AutoModel(model='fsmn-vad', device=device)
+        self.max_history = max_history
+
+        self.model_cache = {}
+        self.voice_detected = False
+
+        self.trimmed_frames = 0
+        self.cache_clears = 0
+        self.max_cache_size = 0
+        """Largest size of the model cache before it was trimmed or cleared, in bytes."""
+
+    def detect(self, signal: np.ndarray, sample_rate: int) -> bool:
+        # Not rounded, so the block is exactly one chunk; otherwise, the model
+        # keeps most of the block in `cache['prev_samples']`, which then grows.
+        chunk_size_ms = 1000 * len(signal) / sample_rate
+
+        res = self.model.generate(
+            input=signal.squeeze(),
+            cache=self.model_cache,
+            is_final=False,
+            chunk_size=chunk_size_ms,
+        )
+
+        voice_detected = self.voice_detected
+        for detection in res[0]['value']:
+            if detection[0] != -1:
+                voice_detected = True
+            elif detection[1] != -1:
+                voice_detected = False
+
+        if not self._trim_cache() and self.voice_detected and not voice_detected:
+            self._measure_cache()
+
+            # Re-initialized on the next call
+            self.model_cache.clear()
+            self.cache_clears += 1
+
+        self.voice_detected = voice_detected
+        return voice_detected
+
+    @property
+    def history_frames(self) -> int:
+        """Number of frames in the model cache."""
+
+        stats = self.model_cache.get('stats')
+        return stats.frm_cnt - getattr(stats, 'last_drop_frames', 0) if stats else 0
+
+    def _trim_cache(self) -> bool:
+        """
+        Drops the oldest frames from the model cache if it holds more than
+        `max_history` seconds. Returns False if the cache can't be trimmed.
+        """
+
+        stats = self.model_cache.get('stats')
+        if stats is None:
+            return True
+        if not all(hasattr(stats, a) for a in _TRIMMED_STATS_ATTRS):
+            return False
+        if stats.data_buf_all is None or stats.scores is None:
+            return True
+
+        vad_opts = self.model.model.vad_opts
+        frame_shift = int(vad_opts.frame_in_ms * vad_opts.sample_rate / 1000)
+        frame_length = int(vad_opts.frame_length_ms * vad_opts.sample_rate / 1000)
+        max_frames = round(1000 * self.max_history / vad_opts.frame_in_ms)
+
+        if self.history_frames <= max_frames:
+            return True
+
+        # Frames before the start of the data buffer have been decided,
+        # and the model's own drop at the end of a segment never goes back
+        # before it, so they can be dropped the same way.
+        drop_frames = min(stats.data_buf_start_frame, stats.frm_cnt - max_frames // 2)
+        new_drop_frames = drop_frames - stats.last_drop_frames
+        if new_drop_frames <= 0:
+            return True
+
+        self._measure_cache()
+        stats.last_drop_frames = drop_frames
+
+        # The audio of each block overlaps the previous block, so the audio
+        # buffer drifts ahead of the frame count; keep the audio of the kept
+        # frames only, which also realigns it.
+        kept_samples = (stats.frm_cnt - drop_frames) * frame_shift + frame_length
+        stats.data_buf_all = stats.data_buf_all[-kept_samples:].clone()
+        stats.data_buf = stats.data_buf_all[(stats.data_buf_start_frame - drop_frames) * frame_shift:]
+        stats.decibel = stats.decibel[new_drop_frames:]
+        stats.scores = stats.scores[:, new_drop_frames:, :].clone()
+
+        # Segments before the offset have already been returned
+        del stats.output_data_buf[:stats.output_data_buf_offset]
+        stats.output_data_buf_offset = 0
+
+        self.trimmed_frames += new_drop_frames
+        return True
+
+    def _measure_cache(self) -> None:
+        # Measured here, rather than when printed, since the cache is only
+        # safe to traverse from the thread running the model.
+        self.max_cache_size = max(self.max_cache_size, get_memory_size(self.model_cache))
+
+    def __str__(self) -> str:
+        frame_ms = self.model.model.vad_opts.frame_in_ms
+
+        return (
+            f'VAD model cache: max_size={self.max_cache_size / 1024:.0f}KiB; '
+            f'history={self.history_frames * frame_ms / 1000:.1f}s; '
+            f'trimmed_frames={self.trimmed_frames}; '
+            f'clears={self.cache_clears}'
+        )
+
+
+_TRIMMED_STATS_ATTRS = (
+    'frm_cnt',
+    'last_drop_frames',
+    'data_buf_start_frame',
+    'data_buf',
+    'data_buf_all',
+    'decibel',
+    'scores',
+    'output_data_buf',
+    'output_data_buf_offset',
+)
+"""Attributes of the `fsmn-vad` cache stats that are trimmed, or used to trim."""
+
+
+def build_vad(backend: VadBackend) -> VoiceActivityDetector:
+    if backend == 'energy':
+        return EnergyVad()
+    elif backend == 'fsmn':
+        return FsmnVad()
+    else:
+        raise ValueError(f'Unknown VAD backend: {backend!r}')
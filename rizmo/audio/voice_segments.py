@@ -0,0 +1,175 @@
+"""
+Compact voice segment events, published by a VAD instead of republishing
+every audio message on the `VOICE_DETECTED` topic, so the audio only crosses
+the mesh once, on the `AUDIO` topic.
+
+Consumers combine the events with the audio messages they receive
+themselves with a `VoiceSegmentReceiver`.
+"""
+
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from rizmo.audio.codec import EncodedAudio
+
+VoiceDetectedHandler = Callable[[str, tuple[EncodedAudio, float, bool]], Awaitable[None]]
+"""Handler of `VOICE_DETECTED` messages, i.e. `(topic, (audio, timestamp, voice_detected))`."""
+
+
+@dataclass(frozen=True)
+class VoiceSegmentEvent:
+    """Start or stop of voice in the audio stream, published on the `VOICE_SEGMENT` topic."""
+
+    voice_detected: bool
+    """True if voice started, or False if it stopped."""
+
+    sequence: int
+    """Sequence number of the audio message that voice started or stopped in."""
+
+    offset: int
+    """
+    Sample offset in the audio message where voice started or stopped:
+    0 for the start of the message, or its length for the end.
+    """
+
+    timestamp: float
+    """Timestamp of the audio message, i.e. the capture time of its first sample."""
+
+
+class VoiceSegmentReceiver:
+    """
+    Keeps a ring buffer of recent `AUDIO` messages, and combines them with
+    `VOICE_SEGMENT` events into the same messages the `VOICE_DETECTED` topic
+    would have, so consumers can handle them the same way.
+
+    Messages are passed to the handler in order, once it is known whether
+    they have voice: those from the start of voice, with `voice_detected`
+    true, until the message voice stopped in, with it false. Up to
+    `pre_roll` seconds of the messages before voice started are passed
+    first, with it false, like a VAD passes messages without voice.
+
+    A VAD sends each message before its event, so the message voice stopped
+    in has usually been passed with voice by the time its event arrives. An
+    empty message with its sequence number is then passed, with
+    `voice_detected` false, so the voice ends right away instead of when
+    the next message arrives, which it may never do, e.g. if the VAD only
+    sends audio with voice. It is empty, so its audio isn't repeated.
+
+    Events and audio messages may arrive in any order, since they are on
+    different topics, so messages are kept for `max_delay` seconds after
+    they arrive, waiting for the event that covers them.
+    """
+
+    def __init__(
+            self,
+            handler: VoiceDetectedHandler,
+            pre_roll: float = 1.,
+            max_delay: float = 2.,
+            topic: str = 'voice_detected',
+    ):
+        """
+        Args:
+            handler: Handler of `VOICE_DETECTED`-style messages.
+            pre_roll: Seconds of audio from before voice started to pass to the handler.
+            max_delay: Maximum delay of events behind their audio, in seconds.
+            topic: Topic passed to the handler.
+        """
+
+        self.handler = handler
+        self.pre_roll = pre_roll
+        self.max_delay = max_delay
+        self.topic = topic
+
+        self._buffer: deque[tuple[EncodedAudio, float]] = deque()
+        self._buffer_duration = 0.
+
+        self._voice_start: int | None = None
+        self._voice_stop: int | None = None
+        self._last_passed = -1
+
+    async def handle_audio(self, topic, data: tuple[EncodedAudio, float]) -> None:
+        audio, timestamp = data
+
+        # The sequence restarts from 0 when the mic node restarts
+        if self._buffer and audio.sequence <= self._buffer[-1][0].sequence:
+            self._reset()
+
+        self._buffer.append((audio, timestamp))
+        self._buffer_duration += audio.len_seconds
+
+        while self._buffer_duration - self._buffer[0][0].len_seconds >= self.pre_roll + self.max_delay:
+            old_audio, _ = self._buffer.popleft()
+            self._buffer_duration -= old_audio.len_seconds
+
+        await self._pass_voice()
+
+    async def handle_event(self, topic, event: VoiceSegmentEvent) -> None:
+        if event.voice_detected:
+            self._voice_start = event.sequence
+            self._voice_stop = None
+            await self._pass_pre_roll()
+        elif self._voice_start is not None:
+            self._voice_stop = event.sequence
+
+            if self._voice_start <= self._last_passed and event.sequence <= self._last_passed:
+                await self._pass_stop()
+                return
+
+        await self._pass_voice()
+
+    async def _pass_pre_roll(self) -> None:
+        pre_roll = []
+        duration = 0.
+
+        for audio, timestamp in reversed(self._buffer):
+            if audio.sequence >= self._voice_start or audio.sequence <= self._last_passed:
+                continue
+            if duration >= self.pre_roll:
+                break
+
+            pre_roll.append((audio, timestamp))
+            duration += audio.len_seconds
+
+        for audio, timestamp in reversed(pre_roll):
+            await self._pass(audio, timestamp, voice_detected=False)
+
+    async def _pass_voice(self) -> None:
+        """Passes the buffered messages with voice that haven't been passed yet."""
+
+        if self._voice_start is None:
+            return
+
+        for audio, timestamp in list(self._buffer):
+            sequence = audio.sequence
+            if sequence < self._voice_start or sequence <= self._last_passed:
+                continue
+
+            # If the message voice stopped in was lost, the next one ends the voice instead
+            if self._voice_stop is not None and sequence >= self._voice_stop:
+                await self._pass(audio, timestamp, voice_detected=False)
+                self._voice_start = self._voice_stop = None
+                return
+
+            await self._pass(audio, timestamp, voice_detected=True)
+
+    async def _pass_stop(self) -> None:
+        """Passes an empty message after the last passed one, with voice stopped."""
+
+        for audio, timestamp in reversed(self._buffer):
+            if audio.sequence == self._last_passed:
+                end = EncodedAudio(b'', audio.sample_rate, audio.sequence, 'float32', audio.channels)
+                await self._pass(end, timestamp + audio.len_seconds, voice_detected=False)
+                break
+
+        self._voice_start = self._voice_stop = None
+
+    async def _pass(self, audio: EncodedAudio, timestamp: float, voice_detected: bool) -> None:
+        self._last_passed = audio.sequence
+        await self.handler(self.topic, (audio, timestamp, voice_detected))
+
+    def _reset(self) -> None:
+        self._buffer.clear()
+        self._buffer_duration = 0.
+        self._voice_start = self._voice_stop = None
+        self._last_passed = -1
@@ -0,0 +1,26 @@
+"""
+Micro-benchmarks of performance-sensitive code.
+
+Run one with e.g. `python -m rizmo.benchmarks.vector_db`.
+"""
+
+import time
+from collections.abc import Callable
+
+
+def benchmark(func: Callable[[], object], min_time: float = 1., warmup: int = 3) -> float:
+    """
+    Calls `func` repeatedly for at least `min_time` seconds,
+    and returns the mean time per call, in seconds.
+    """
+
+    for _ in range(warmup):
+        func()
+
+    calls = 0
+    t0 = time.perf_counter()
+    while (dt := time.perf_counter() - t0) < min_time:
+        func()
+        calls += 1
+
+    return dt / calls
@@ -0,0 +1,93 @@
+"""
+Benchmarks the CPU cost and size of each audio wire format,
+per block of audio.
+"""
+
+import wave
+from argparse import ArgumentParser, Namespace
+
+import numpy as np
+
+from rizmo.audio.codec import DECODERS, ENCODERS
+from rizmo.benchmarks import benchmark
+
+
+def main(args: Namespace) -> None:
+    signal = load_wav(args.wav) if args.wav else synthesize_speech(args.sample_rate)
+
+    print(f'{"Encoding":<10} {"Block":>6} {"Size (%)":>9} {"Encode (us)":>12} {"Decode (us)":>12}')
+
+    for block_size in args.block_sizes:
+        block = signal[:block_size]
+        float32_size = 4 * len(block)
+
+        for encoding, encode in ENCODERS.items():
+            decode = DECODERS[encoding]
+            data = encode(block)
+
+            encode_us = 1e6 * benchmark(lambda: encode(block), min_time=args.min_time)
+            decode_us = 1e6 * benchmark(lambda: decode(data), min_time=args.min_time)
+
+            size = 100 * len(data) / float32_size
+            print(f'{encoding:<10} {block_size:>6} {size:>9.1f} {encode_us:>12.1f} {decode_us:>12.1f}')
+
+
+def synthesize_speech(sample_rate: int, duration: float = 2.) -> np.ndarray:
+    """Harmonics of a wavering pitch with a syllable-like envelope, over background noise."""
+
+    rng = np.random.default_rng(0)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+
+    pitch = 150 + 30 * np.sin(2 * np.pi * 1.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 10))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+
+    signal = 0.2 * envelope * voice + 0.003 * rng.standard_normal(len(t))
+    return signal.astype(np.float32)
+
+
+def load_wav(path: str) -> np.ndarray:
+    with wave.open(path, 'rb') as wav_file:
+        frames = wav_file.readframes(wav_file.getnframes())
+        channels = wav_file.getnchannels()
+
+    return np.frombuffer(frames, dtype=np.int16)[::channels] / np.float32(32767)
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        '--block-sizes',
+        type=int,
+        nargs='+',
+        default=[320, 1600, 4096],
+        help='Block sizes to benchmark, in samples. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--wav',
+        help='16-bit wave file to take the blocks from, e.g. made by the recorder node. '
+             'Defaults to synthetic speech.',
+    )
+
+    parser.add_argument(
+        '--sample-rate',
+        type=int,
+        default=16000,
+        help='Sample rate of the synthetic speech. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--min-time',
+        type=float,
+        default=0.5,
+        help='Minimum time to run each benchmark, in seconds. Default: %(default)s',
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,159 @@
+"""
+Benchmarks filtering a stream of audio blocks with the streaming SOS filter
+against the previous approach of filtering each block on its own with
+`voicebox.effects.Filter`, like the VAD node did.
+
+Also checks that filtering consecutive blocks with the streaming filter
+gives the same result as filtering the whole signal at once, and shows the
+error of filtering each block on its own, from the transients at the block
+boundaries. Exits with an error if the streaming filter's error is above
+`--tolerance`.
+
+"sosfilt (streaming)" is the public `sosfilt` with the filter state kept
+across blocks, and nothing else, so comparing it with "streaming (out)"
+shows the cost of copying the output into the caller's array.
+"""
+
+import sys
+from argparse import ArgumentParser, Namespace
+
+import numpy as np
+from scipy.signal import sosfilt
+
+from rizmo.audio.filter import StreamingSosFilter
+from rizmo.benchmarks import benchmark
+from rizmo.benchmarks.audio_codec import load_wav, synthesize_speech
+
+
+def main(args: Namespace) -> None:
+    signal = load_wav(args.wav) if args.wav else synthesize_speech(args.sample_rate)
+
+    def build_filter() -> StreamingSosFilter:
+        return StreamingSosFilter.build(args.btype, args.freq, args.sample_rate, order=args.order)
+
+    expected = sosfilt(build_filter().sos.astype(np.float64), signal)
+
+    print(f'{"Method":<22} {"Block":>6} {"Time (us)":>10} {"Max error":>10}')
+
+    ok = True
+    for block_size in args.block_sizes:
+        blocks = [signal[i:i + block_size] for i in range(0, len(signal) - block_size + 1, block_size)]
+        expected_ = expected[:len(blocks) * block_size]
+
+        methods = {
+            'voicebox (per block)': voicebox_filter(args),
+            'sosfilt (per block)': lambda b, sos=build_filter().sos: sosfilt(sos, b),
+            'sosfilt (streaming)': sosfilt_streaming(build_filter().sos),
+            'streaming': build_filter(),
+            'streaming (out)': in_place(build_filter()),
+        }
+
+        for name, filter_ in methods.items():
+            if filter_ is None:
+                continue
+
+            filtered = np.concatenate([np.array(filter_(b.copy())) for b in blocks])
+            error = float(np.abs(filtered - expected_).max())
+
+            if 'streaming' in name and error > args.tolerance:
+                ok = False
+
+            block = blocks[0].copy()
+            time_us = 1e6 * benchmark(lambda: filter_(block), min_time=args.min_time)
+            print(f'{name:<22} {block_size:>6} {time_us:>10.2f} {error:>10.2e}')
+
+    if not ok:
+        sys.exit(f'Streaming filter error is above the tolerance of {args.tolerance}')
+
+
+def voicebox_filter(args: Namespace):
+    try:
+        from voicebox.audio import Audio
+        from voicebox.effects import Filter
+    except ImportError:
+        return None
+
+    filter_ = Filter.build(args.btype, freq=args.freq, order=args.order)
+    return lambda block: filter_(Audio(block, args.sample_rate)).signal
+
+
+def sosfilt_streaming(sos: np.ndarray):
+    zi = np.zeros((len(sos), 2), dtype=np.float32)
+
+    def filter_(block: np.ndarray) -> np.ndarray:
+        nonlocal zi
+        filtered, zi = sosfilt(sos, block, zi=zi)
+        return filtered
+
+    return filter_
+
+
+def in_place(filter_: StreamingSosFilter):
+    return lambda block: filter_(block, out=block)
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        '--block-sizes',
+        type=int,
+        nargs='+',
+        default=[320, 1600, 4096],
+        help='Block sizes to benchmark, in samples. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--btype',
+        default='lowpass',
+        choices=('lowpass', 'highpass'),
+        help='Type of filter. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--freq',
+        type=float,
+        default=3000.,
+        help='Cutoff frequency of the filter, in Hz. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--order',
+        type=int,
+        default=6,
+        help='Order of the filter. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=1e-4,
+        help='Maximum error of the streaming filter vs. filtering the whole '
+             'signal at once. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--wav',
+        help='16-bit wave file to filter, e.g. made by the recorder node. '
+             'Defaults to synthetic speech.',
+    )
+
+    parser.add_argument(
+        '--sample-rate',
+        type=int,
+        default=16000,
+        help='Sample rate of the synthetic speech. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--min-time',
+        type=float,
+        default=0.5,
+        help='Minimum time to run each benchmark, in seconds. Default: %(default)s',
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
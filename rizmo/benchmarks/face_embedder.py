@@ -0,0 +1,105 @@
+"""
+Benchmarks face embedding preprocessing at different batch sizes:
+per-face `preprocess_face` + `cv2.dnn.blobFromImages` (what `get_feat` does),
+against `preprocess_faces` into a preallocated batch.
+
+If an embedding model is given, also benchmarks the whole embedding,
+with `model.get_feat`, and with the ONNX session directly.
+"""
+
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from rizmo.benchmarks import benchmark
+from rizmo.face_rec.face_embedder import InsightFaceEmbeddingGenerator, preprocess_face, preprocess_faces
+
+
+def main(args: Namespace) -> None:
+    rng = np.random.default_rng(0)
+
+    embedder = None
+    if args.model:
+        embedder = InsightFaceEmbeddingGenerator.from_model_zoo(str(args.model), ctx_id=args.ctx_id)
+
+    header = f'{"Batch":>5} {"Preprocess (ms)":>16} {"Batched (ms)":>13}'
+    if embedder:
+        header += f' {"get_feat (ms)":>14} {"Session (ms)":>13} {"IO binding (ms)":>16}'
+    print(header)
+
+    for batch_size in args.batch_sizes:
+        # Face crops of varying sizes, like from the object detector
+        sizes = rng.integers(40, 200, size=(batch_size, 2))
+        imgs = [rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8) for h, w in sizes]
+
+        out = np.empty((batch_size, 3, 112, 112), dtype=np.float32)
+        scratch = np.empty(112 * 112 * 3, dtype=np.uint8)
+
+        def preprocess() -> np.ndarray:
+            faces = [preprocess_face(img) for img in imgs]
+            return cv2.dnn.blobFromImages(faces, 1 / 127.5, (112, 112), (127.5, 127.5, 127.5), swapRB=True)
+
+        preprocess_ms = 1000 * benchmark(preprocess, min_time=args.min_time)
+        batched_ms = 1000 * benchmark(
+            lambda: preprocess_faces(imgs, out, scratch=scratch),
+            min_time=args.min_time,
+        )
+
+        line = f'{batch_size:>5} {preprocess_ms:>16.3f} {batched_ms:>13.3f}'
+
+        if embedder:
+            get_feat_ms = 1000 * benchmark(
+                lambda: embedder.model.get_feat([preprocess_face(img) for img in imgs]),
+                min_time=args.min_time,
+            )
+
+            embedder.use_io_binding = False
+            session_ms = 1000 * benchmark(lambda: embedder.get_embeddings(imgs), min_time=args.min_time)
+
+            embedder.use_io_binding = True
+            io_binding_ms = 1000 * benchmark(lambda: embedder.get_embeddings(imgs), min_time=args.min_time)
+
+            line += f' {get_feat_ms:>14.3f} {session_ms:>13.3f} {io_binding_ms:>16.3f}'
+
+        print(line)
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        '--batch-sizes',
+        type=int,
+        nargs='+',
+        default=[1, 2, 4, 8, 16, 32],
+        help='Batch sizes to benchmark. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--model',
+        type=Path,
+        help='Optional ONNX embedding model file, e.g. '
+             'resources/insightface/models/w600k_mbf.onnx, to also benchmark embedding.',
+    )
+
+    parser.add_argument(
+        '--ctx-id',
+        type=int,
+        default=0,
+        help='InsightFace context ID; -1 for CPU. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--min-time',
+        type=float,
+        default=1.,
+        help='Minimum time to run each benchmark, in seconds. Default: %(default)s',
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
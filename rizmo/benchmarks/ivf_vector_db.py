@@ -0,0 +1,123 @@
+"""
+Benchmarks recall and latency of the IVF face vector database
+against the brute-force baseline, on synthetic face embeddings.
+"""
+
+from argparse import ArgumentParser, Namespace
+
+import numpy as np
+
+from rizmo.benchmarks import benchmark
+from rizmo.face_rec.ivf_vector_db import IVFCosineVectorDatabase
+from rizmo.face_rec.vector_db import NumpyCosineVectorDatabase
+
+
+def main(args: Namespace) -> None:
+    rng = np.random.default_rng(0)
+
+    n_identities = args.size // args.samples_per_identity
+    centers = rng.standard_normal((n_identities, args.dim), dtype=np.float32)
+
+    def sample(identities: np.ndarray) -> np.ndarray:
+        noise = rng.standard_normal((len(identities), args.dim), dtype=np.float32)
+        return centers[identities] + args.noise * noise
+
+    identities = np.repeat(np.arange(n_identities), args.samples_per_identity)
+    vectors = sample(identities)
+    items = list(zip(vectors, identities.tolist()))
+
+    query_identities = rng.integers(n_identities, size=args.queries)
+    queries = list(sample(query_identities))
+
+    brute_force = NumpyCosineVectorDatabase()
+    brute_force.add_all(items)
+    expected = [label for label, _ in brute_force.search(queries)]
+
+    def print_result(name: str, db) -> None:
+        # Search one face at a time, like the face_rec node usually does
+        latency_ms = 1000 * benchmark(
+            lambda: [db.search([query]) for query in queries],
+            min_time=args.min_time,
+        )
+
+        labels = [label for label, _ in db.search(queries)]
+        recall = np.mean(np.array(labels) == expected)
+        accuracy = np.mean(np.array(labels) == query_identities)
+
+        print(f'{name:<28} {latency_ms / len(queries):>12.3f} {recall:>8.3f} {accuracy:>9.3f}')
+
+    print(f'Size: {args.size}; identities: {n_identities}; queries: {args.queries}')
+    print(f'{"Database":<28} {"Latency (ms)":>12} {"Recall":>8} {"Accuracy":>9}')
+
+    print_result('brute force', brute_force)
+
+    for aggregation in ('max', 'top_k_mean', 'centroid'):
+        ivf = IVFCosineVectorDatabase(aggregation=aggregation)
+        ivf.add_all(items)
+
+        probes = args.probes if aggregation != 'centroid' else args.probes[:1]
+        for n_probe in probes:
+            ivf.n_probe = n_probe
+            name = f'ivf {aggregation}' + (f' probe={n_probe}' if aggregation != 'centroid' else '')
+            print_result(name, ivf)
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        '--size',
+        type=int,
+        default=100_000,
+        help='Number of vectors in the database. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--samples-per-identity',
+        type=int,
+        default=10,
+        help='Number of vectors per identity. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--noise',
+        type=float,
+        default=1.,
+        help='Standard deviation of the noise added to the identity centers '
+             'to make samples. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--probes',
+        type=int,
+        nargs='+',
+        default=[1, 2, 4, 8, 16, 32],
+        help='Probe counts to benchmark. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--dim',
+        type=int,
+        default=512,
+        help='Embedding dimension. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--queries',
+        type=int,
+        default=100,
+        help='Number of query vectors. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--min-time',
+        type=float,
+        default=1.,
+        help='Minimum time to run each benchmark, in seconds. Default: %(default)s',
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
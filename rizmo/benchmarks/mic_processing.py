@@ -0,0 +1,120 @@
+"""
+Benchmarks each stage of the mic processing chain, and the whole chain,
+per block, against the previous allocating implementation.
+
+Stages change the block in place, so every benchmark first restores it;
+subtract the "restore block" time for the time of the stage alone.
+"""
+
+from argparse import ArgumentParser, Namespace
+from collections.abc import Callable
+
+import numpy as np
+
+from rizmo.audio.processing import (
+    BlockInfo,
+    FixedGain,
+    Gain,
+    Gate,
+    LimitedMaxPowerGainControl,
+    Limiter,
+    ProcessingChain,
+    peak,
+)
+from rizmo.benchmarks import benchmark
+
+
+def main(args: Namespace) -> None:
+    rng = np.random.default_rng(0)
+
+    print(f'{"Stage":<24} {"Block":>6} {"Time (us)":>10}')
+
+    for block_size in args.block_sizes:
+        source = (0.1 * rng.standard_normal((block_size, 1))).astype(np.float32)
+        block = source.copy()
+        scratch = np.empty_like(block)
+
+        def info() -> BlockInfo:
+            block_peak = peak(block)
+            return BlockInfo(args.sample_rate, block_size, block_peak, block_peak)
+
+        stages: dict[str, Callable[[], object]] = {
+            'restore block': lambda: np.copyto(block, source),
+            'peak': lambda: peak(block, scratch),
+            'np.abs(...).max()': lambda: np.abs(block).max(),
+            'gain (fixed)': bind(Gain(FixedGain(1.)), block, source, info()),
+            'gain (auto)': bind(Gain(LimitedMaxPowerGainControl()), block, source, info()),
+            'limiter (no clipping)': bind(Limiter(), block, source, info()),
+            'limiter (clipping)': bind(Limiter(limit=0.05), block, source, info()),
+            'gate (open)': bind(Gate(threshold=0., attack=16.), block, source, info()),
+            'gate (closed)': bind(Gate(threshold=1., attack=16.), block, source, info()),
+        }
+
+        chain = ProcessingChain([
+            Gain(LimitedMaxPowerGainControl()),
+            Limiter(),
+            Gate(threshold=0., attack=16.),
+        ])
+        stages['chain'] = lambda: chain(np.copyto(block, source) or block, args.sample_rate)
+
+        gain_control = LimitedMaxPowerGainControl()
+
+        def allocating_chain():
+            # The previous implementation, which computed the peak twice,
+            # and allocated for the gain and limiter
+            np.copyto(block, source)
+            input_peak = np.abs(block).max()
+            transformed = block * gain_control.get_gain(info())
+            transformed = np.clip(transformed, -1, 1)
+            return input_peak >= 0., transformed
+
+        stages['chain (allocating)'] = allocating_chain
+
+        for name, func in stages.items():
+            time_us = 1e6 * benchmark(func, min_time=args.min_time)
+            print(f'{name:<24} {block_size:>6} {time_us:>10.2f}')
+
+
+def bind(processor, block: np.ndarray, source: np.ndarray, info: BlockInfo) -> Callable[[], None]:
+    input_peak = info.peak
+
+    def process() -> None:
+        # Processors change the block and its peak, so restore them first;
+        # see the "restore block" time.
+        np.copyto(block, source)
+        info.peak = input_peak
+        processor.process(block, info)
+
+    return process
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        '--block-sizes',
+        type=int,
+        nargs='+',
+        default=[320, 1600, 4096],
+        help='Block sizes to benchmark, in samples. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--sample-rate',
+        type=int,
+        default=16000,
+        help='Sample rate of the audio. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--min-time',
+        type=float,
+        default=0.5,
+        help='Minimum time to run each benchmark, in seconds. Default: %(default)s',
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,231 @@
+"""
+Benchmarks the latency from the end of speech to the utterance being ready
+to transcribe, or to the transcript with `--transcribe`, of the split `vad`
+and `asr` nodes vs. the fused `vad_asr` node.
+
+In the split nodes, every message of the utterance is sent from the VAD to
+the ASR: pickled like the mesh does, sent over a local socket, unpickled,
+and decoded again. "split (concatenate)" also rebuilds the utterance from a
+list of messages, like the ASR node used to. In the fused node, the decoded
+messages are handed straight to the utterance buffer.
+
+The latency is measured from the VAD deciding that voice stopped, so the
+VAD itself, which is the same for both, is not included.
+
+Needs the ASR node requirements, and a GPU, for `--transcribe`.
+"""
+
+import pickle
+import socket
+import struct
+import time
+from argparse import ArgumentParser, Namespace
+from contextlib import redirect_stdout
+from io import StringIO
+from threading import Event
+
+import numpy as np
+from voicebox.audio import Audio
+
+from rizmo.audio.codec import EncodedAudio
+from rizmo.benchmarks.audio_codec import load_wav, synthesize_speech
+from rizmo.audio.transcription import (
+    PRE_BUFFER_DURATION_S,
+    MaxDurationAudioBuffer,
+    TranscriptionRequest,
+    UtteranceCollector,
+)
+
+
+class FusedPath:
+    """Hands each message straight to the utterance collector, like the fused node."""
+
+    def __init__(self):
+        self.collector = UtteranceCollector(min_duration=0.)
+
+    def send(self, audio: EncodedAudio, voice_detected: bool) -> TranscriptionRequest | None:
+        return self.collector.add(audio, voice_detected)
+
+
+class SplitPath(FusedPath):
+    """Sends each message over a local socket first, like the mesh between the split nodes."""
+
+    def __init__(self):
+        super().__init__()
+        self._sender, self._receiver = socket.socketpair()
+
+    def send(self, audio: EncodedAudio, voice_detected: bool) -> TranscriptionRequest | None:
+        data = pickle.dumps(('voice_detected', (audio, time.time(), voice_detected)))
+        self._sender.sendall(struct.pack('!I', len(data)) + data)
+
+        size, = struct.unpack('!I', self._recv(4))
+        _, (audio, _, voice_detected) = pickle.loads(self._recv(size))
+
+        return super().send(audio, voice_detected)
+
+    def _recv(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            data += self._receiver.recv(size - len(data))
+        return bytes(data)
+
+
+class ConcatenatingCollector:
+    """Keeps a list of the messages of the utterance, and concatenates them at the end, like the ASR node used to."""
+
+    def __init__(self):
+        self._most_recent_audios = MaxDurationAudioBuffer(PRE_BUFFER_DURATION_S)
+        self._audio_buffer = []
+
+    def add(self, audio: EncodedAudio, voice_detected: bool) -> TranscriptionRequest | None:
+        self._most_recent_audios.append(audio)
+
+        if voice_detected:
+            if not self._audio_buffer:
+                self._audio_buffer.extend(self._most_recent_audios)
+            else:
+                self._audio_buffer.append(audio)
+            return None
+
+        if not self._audio_buffer:
+            return None
+
+        signal = np.concatenate([a.signal for a in self._audio_buffer]).flatten()
+        sample_rate = self._audio_buffer[0].sample_rate
+        self._audio_buffer.clear()
+
+        return TranscriptionRequest(Audio(signal, sample_rate), utterance=0)
+
+
+class SplitConcatenatePath(SplitPath):
+    def __init__(self):
+        super().__init__()
+        self.collector = ConcatenatingCollector()
+
+
+PATHS = {
+    'split (concatenate)': SplitConcatenatePath,
+    'split': SplitPath,
+    'fused': FusedPath,
+}
+
+
+def main(args: Namespace) -> None:
+    rng = np.random.default_rng(0)
+    speech = load_wav(args.wav) if args.wav else synthesize_speech(args.sample_rate)
+    transcribe = build_transcriber() if args.transcribe else None
+
+    print(f'{"Path":<20} {"Speech (s)":>10} {"Mean (ms)":>10} {"Max (ms)":>10}')
+
+    for duration in args.durations:
+        voice = np.resize(speech, round(duration * args.sample_rate))
+        noise = (0.01 * rng.standard_normal(round(PRE_BUFFER_DURATION_S * args.sample_rate))).astype(np.float32)
+
+        messages = [
+            *((block, False) for block in split_blocks(noise, args.block_size)),
+            *((block, True) for block in split_blocks(voice, args.block_size)),
+            (np.zeros((args.block_size, 1), dtype=np.float32), False),
+        ]
+
+        for name, path_type in PATHS.items():
+            latencies = []
+
+            for _ in range(args.repeats):
+                path = path_type()
+                latencies.append(measure_latency(path, messages, args, transcribe))
+
+            print(f'{name:<20} {duration:>10.1f} {1000 * np.mean(latencies):>10.3f} {1000 * np.max(latencies):>10.3f}')
+
+
+def split_blocks(signal: np.ndarray, block_size: int) -> list[np.ndarray]:
+    return [
+        signal[i:i + block_size].reshape(-1, 1)
+        for i in range(0, len(signal) - block_size + 1, block_size)
+    ]
+
+
+def measure_latency(path: FusedPath, messages: list[tuple[np.ndarray, bool]], args: Namespace, transcribe) -> float:
+    """Sends the messages, and returns the time from the last one being sent to the utterance being ready."""
+
+    # Encoded like the mic node, which keeps the decoded signal
+    audios = [
+        (EncodedAudio.encode(block, args.sample_rate, sequence), voice_detected)
+        for sequence, (block, voice_detected) in enumerate(messages)
+    ]
+
+    # The collector prints progress
+    with redirect_stdout(StringIO()):
+        for audio, voice_detected in audios[:-1]:
+            path.send(audio, voice_detected)
+
+        t0 = time.perf_counter()
+
+        request = path.send(*audios[-1])
+        if transcribe:
+            transcribe(request)
+
+        return time.perf_counter() - t0
+
+
+def build_transcriber():
+    from rizmo.nodes.asr import build_asr_thread
+
+    transcribed = Event()
+    asr = build_asr_thread(lambda transcript: transcribed.set())
+
+    def transcribe(request: TranscriptionRequest) -> None:
+        transcribed.clear()
+        asr.queue.put(request)
+        transcribed.wait()
+
+    return transcribe
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        '--durations',
+        type=float,
+        nargs='+',
+        default=[2., 5., 15.],
+        help='Durations of speech to benchmark, in seconds. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--block-size',
+        type=int,
+        default=1600,
+        help='Number of samples per audio message. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--repeats',
+        type=int,
+        default=20,
+        help='Number of utterances to measure per duration. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--transcribe',
+        action='store_true',
+        help='Include transcribing the utterance with the ASR model.',
+    )
+
+    parser.add_argument(
+        '--wav',
+        help='16-bit wave file of speech. Defaults to synthetic speech.',
+    )
+
+    parser.add_argument(
+        '--sample-rate',
+        type=int,
+        default=16000,
+        help='Sample rate of the audio. Default: %(default)s',
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,162 @@
+"""
+Benchmarks the CPU cost and detection delay of the voice activity detectors,
+per block of audio.
+
+The test signal is background noise, then speech starting at `--onset`
+seconds, then background noise again. The onset delay is the time from the
+start of the speech to the end of the first block it is detected in, and the
+offset delay is the time from the end of the speech to the end of the first
+block after it that it is no longer detected in, which includes the hangover.
+"""
+
+from argparse import ArgumentParser, Namespace
+
+import numpy as np
+
+from rizmo.audio.vad import VoiceActivityDetector, build_vad
+from rizmo.benchmarks import benchmark
+from rizmo.benchmarks.audio_codec import load_wav, synthesize_speech
+
+
+def main(args: Namespace) -> None:
+    rng = np.random.default_rng(0)
+    speech = load_wav(args.wav) if args.wav else synthesize_speech(args.sample_rate)
+
+    print(
+        f'{"VAD":<8} {"Block":>6} {"SNR (dB)":>9} {"Time (us)":>10} '
+        f'{"CPU (%)":>8} {"Onset (ms)":>11} {"Offset (ms)":>12} {"False (%)":>10}'
+    )
+
+    for backend in args.backends:
+        for block_size in args.block_sizes:
+            for snr_db in args.snrs:
+                signal, onset, offset = build_signal(speech, snr_db, args, rng)
+                blocks = [signal[i:i + block_size] for i in range(0, len(signal) - block_size + 1, block_size)]
+                block_ends = (np.arange(len(blocks)) + 1) * block_size / args.sample_rate
+
+                vad = build_vad(backend)
+                detections = np.array([vad.detect(block, args.sample_rate) for block in blocks])
+
+                onset_delay = get_delay(detections, block_ends, onset, detected=True)
+                offset_delay = get_delay(detections, block_ends, offset, detected=False)
+
+                # Detections in the noise before the speech
+                false_detections = 100 * detections[block_ends <= onset].mean()
+
+                time_us = 1e6 * benchmark_detect(vad, blocks, args)
+                cpu = 100 * (time_us / 1e6) / (block_size / args.sample_rate)
+
+                print(
+                    f'{backend:<8} {block_size:>6} {snr_db:>9.0f} {time_us:>10.1f} '
+                    f'{cpu:>8.2f} {format_ms(onset_delay):>11} {format_ms(offset_delay):>12} '
+                    f'{false_detections:>10.1f}'
+                )
+
+
+def build_signal(
+        speech: np.ndarray,
+        snr_db: float,
+        args: Namespace,
+        rng: np.random.Generator,
+) -> tuple[np.ndarray, float, float]:
+    """Returns the noisy signal, and the start and end times of the speech in it."""
+
+    onset = round(args.onset * args.sample_rate)
+    signal = np.zeros(onset + len(speech) + round(args.tail * args.sample_rate), dtype=np.float32)
+    signal[onset:onset + len(speech)] = speech
+
+    speech_rms = np.sqrt(np.mean(speech ** 2))
+    noise_rms = speech_rms / 10 ** (snr_db / 20)
+    signal += (noise_rms * rng.standard_normal(len(signal))).astype(np.float32)
+
+    return signal, args.onset, args.onset + len(speech) / args.sample_rate
+
+
+def get_delay(detections: np.ndarray, block_ends: np.ndarray, t: float, detected: bool) -> float | None:
+    """Returns the delay from `t` to the end of the first block after it with the given detection."""
+
+    matches = np.flatnonzero((block_ends > t) & (detections == detected))
+    return float(block_ends[matches[0]] - t) if len(matches) else None
+
+
+def benchmark_detect(vad: VoiceActivityDetector, blocks: list[np.ndarray], args: Namespace) -> float:
+    i = 0
+
+    def detect() -> None:
+        nonlocal i
+        vad.detect(blocks[i % len(blocks)], args.sample_rate)
+        i += 1
+
+    return benchmark(detect, min_time=args.min_time)
+
+
+def format_ms(delay: float | None) -> str:
+    return 'never' if delay is None else f'{1000 * delay:.0f}'
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        '--backends',
+        nargs='+',
+        default=['energy'],
+        choices=('energy', 'fsmn'),
+        help='VADs to benchmark. "fsmn" needs funasr and a GPU. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--block-sizes',
+        type=int,
+        nargs='+',
+        default=[320, 1600],
+        help='Block sizes to benchmark, in samples. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--snrs',
+        type=float,
+        nargs='+',
+        default=[30., 20., 10.],
+        help='Signal to noise ratios of the speech, in dB. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--onset',
+        type=float,
+        default=2.,
+        help='Duration of the noise before the speech, in seconds. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--tail',
+        type=float,
+        default=2.,
+        help='Duration of the noise after the speech, in seconds. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--wav',
+        help='16-bit wave file of speech, without leading or trailing silence. '
+             'Defaults to synthetic speech.',
+    )
+
+    parser.add_argument(
+        '--sample-rate',
+        type=int,
+        default=16000,
+        help='Sample rate of the audio. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--min-time',
+        type=float,
+        default=0.5,
+        help='Minimum time to run each benchmark, in seconds. Default: %(default)s',
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,104 @@
+"""
+Benchmarks adding to and searching the face vector databases
+at different gallery sizes.
+"""
+
+import time
+from argparse import ArgumentParser, Namespace
+from collections.abc import Callable
+
+import numpy as np
+
+from rizmo.benchmarks import benchmark
+from rizmo.face_rec.vector_db import NumpyCosineVectorDatabase, VectorDatabase
+
+
+def main(args: Namespace) -> None:
+    rng = np.random.default_rng(0)
+
+    print(f'{"Database":<24} {"Size":>8} {"Add all (ms)":>14} {"Add one (ms)":>14} {"Search (ms)":>14}')
+
+    for size in args.sizes:
+        vectors = rng.standard_normal((size, args.dim), dtype=np.float32)
+        queries = list(rng.standard_normal((args.queries, args.dim), dtype=np.float32))
+        labels = range(size)
+
+        for name, build_db in get_db_builders().items():
+            db = build_db()
+
+            t0 = time.perf_counter()
+            db.add_all(zip(vectors, labels))
+            add_all_ms = 1000 * (time.perf_counter() - t0)
+
+            search_ms = 1000 * benchmark(
+                lambda: db.search(queries),
+                min_time=args.min_time,
+            )
+
+            # Last, since it grows the database
+            add_one_ms = 1000 * benchmark(
+                lambda: db.add_all([(vectors[0], -1)]),
+                min_time=args.min_time,
+            )
+
+            print(f'{name:<24} {size:>8} {add_all_ms:>14.3f} {add_one_ms:>14.3f} {search_ms:>14.3f}')
+
+
+def get_db_builders() -> dict[str, Callable[[], VectorDatabase]]:
+    builders = {
+        'numpy float32': lambda: NumpyCosineVectorDatabase(np.float32),
+        'numpy int8': lambda: NumpyCosineVectorDatabase(np.int8),
+    }
+
+    try:
+        import torch
+        from rizmo.face_rec.torch_vector_db import BruteForceCosineVectorDatabase
+    except ImportError:
+        return builders
+
+    builders['torch cpu float32'] = lambda: BruteForceCosineVectorDatabase(torch.float32, 'cpu')
+    builders['torch cpu float16'] = lambda: BruteForceCosineVectorDatabase(torch.float16, 'cpu')
+
+    if torch.cuda.is_available():
+        builders['torch cuda float16'] = lambda: BruteForceCosineVectorDatabase(torch.float16, 'cuda')
+
+    return builders
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=[10, 1_000, 100_000],
+        help='Gallery sizes to benchmark. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--dim',
+        type=int,
+        default=512,
+        help='Embedding dimension. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--queries',
+        type=int,
+        default=2,
+        help='Number of query vectors per search. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--min-time',
+        type=float,
+        default=1.,
+        help='Minimum time to run each benchmark, in seconds. Default: %(default)s',
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
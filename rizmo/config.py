@@ -16,7 +16,9 @@ class Config:
     speaker_mixer: str = 'PCM'
     microphone_mixer: str = 'Headset'
     mic_sample_rate: int = 16000
-    mic_block_size: int = 4096
+    mic_block_size: int = 320
+    """Samples per captured block; 20 ms at 16 kHz."""
+    mic_blocks_per_message: int = 5
 
     memory_file_path: Path = Path('var/memories.json')
     reminders_file_path: Path = Path('var/reminders.json')
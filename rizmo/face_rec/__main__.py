@@ -1,13 +1,26 @@
+"""
+Recognizes faces in a camera stream or video file, with capture,
+face detection, and face recognition each running in their own thread.
+
+Stages are connected by small queues which, for a camera, drop the oldest
+frames when full, so results are always about the latest frames a stage
+could keep up with. For a video file, the queues wait for room instead,
+so every frame is processed. Per-stage throughput and latency are printed
+periodically.
+"""
+
 import time
+from argparse import ArgumentParser, Namespace
 
 import cv2
 import numpy as np
 from insightface.app import FaceAnalysis
 
 from rizmo.face_rec.face_finder import build_face_finder
+from rizmo.face_rec.pipeline import LatestQueue, PipelineStage
 
 
-def main():
+def main(args: Namespace) -> None:
     face_detector = FaceAnalysis(
         name='buffalo_sc',
         providers=[
@@ -22,33 +35,66 @@ def main():
     )
     face_detector.prepare(ctx_id=0, det_size=(640, 640))
 
-    similar_face_finder = build_face_finder()
+    similar_face_finder = build_face_finder(embedding_model=args.embedding_model)
+
+    is_camera = args.input.isdigit()
+    video = cv2.VideoCapture(int(args.input) if is_camera else args.input)
+
+    t_next_frame = time.monotonic()
 
-    def get_face_recs(img: np.ndarray) -> list[tuple[str, float]]:
+    def capture() -> np.ndarray | None:
+        nonlocal t_next_frame
+
+        if args.max_fps > 0:
+            time.sleep(max(0., t_next_frame - time.monotonic()))
+            t_next_frame = time.monotonic() + 1 / args.max_fps
+
+        ret, img = video.read()
+        return img if ret else None
+
+    def detect_faces(img: np.ndarray) -> list[np.ndarray]:
         faces = face_detector.get(img)
 
         face_imgs = (extract_face(img, face.bbox) for face in faces)
-        face_imgs = list(filter(is_valid_face_img, face_imgs))
+        return list(filter(is_valid_face_img, face_imgs))
 
-        return similar_face_finder.find_faces(face_imgs) if face_imgs else []
+    def recognize_faces(face_imgs: list[np.ndarray]) -> list[tuple[str, float]]:
+        face_recs = similar_face_finder.find_faces(face_imgs) if face_imgs else []
 
-    video = cv2.VideoCapture(0)
-    try:
-        while True:
-            ret, img = video.read()
-            if not ret:
-                break
-
-            face_recs = get_face_recs(img)
-            face_recs = [(str(name), round(sim, 3)) for name, sim in face_recs]
-            face_recs = sorted(face_recs)
+        face_recs = [(str(name), round(sim, 3)) for name, sim in face_recs]
+        face_recs = sorted(face_recs)
+        if not args.quiet:
             print('Face recognitions:', face_recs)
 
-            time.sleep(1 / 5)
+        return face_recs
+
+    frames = LatestQueue(args.queue_size, block=not is_camera)
+    detections = LatestQueue(args.queue_size, block=not is_camera)
+
+    stages = [
+        PipelineStage('Capture', capture, output_queue=frames),
+        PipelineStage('Detect', detect_faces, frames, detections),
+        PipelineStage('Recognize', recognize_faces, detections),
+    ]
+
+    try:
+        for stage in stages:
+            stage.start()
+
+        # The last stage stops once the input runs out
+        while stages[-1].is_alive():
+            stages[-1].join(timeout=args.stats_interval)
+            print_stats(stages)
     finally:
         video.release()
 
 
+def print_stats(stages: list[PipelineStage]) -> None:
+    for stage in stages:
+        print(stage)
+        stage.reset()
+
+
 def extract_face(img: np.ndarray, bbox: np.ndarray) -> np.ndarray:
     bbox = bbox.round().astype(int)
     return img[bbox[1]:bbox[3], bbox[0]:bbox[2], :]
@@ -59,5 +105,53 @@ def is_valid_face_img(face_img: np.ndarray, min_size: int = 10) -> bool:
     return h >= min_size and w >= min_size
 
 
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        '--input',
+        default='0',
+        help='Camera index, or path of a video file to read frames from. '
+             'Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--embedding-model',
+        default='w600k_r50',
+        choices=('w600k_r50', 'w600k_mbf'),
+        help='Face embedding model to use for face recognition. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--max-fps',
+        type=float,
+        default=0.,
+        help='Maximum rate to capture frames at, e.g. the frame rate of a video '
+             'file to play it in real time. 0 for no limit. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=1,
+        help='Maximum number of frames waiting between stages. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--stats-interval',
+        type=float,
+        default=5.,
+        help='How often to print stage stats, in seconds. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--quiet',
+        action='store_true',
+        help='Do not print the face recognitions of every frame.',
+    )
+
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
-    main()
+    main(parse_args())
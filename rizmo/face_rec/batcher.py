@@ -0,0 +1,127 @@
+import asyncio
+import time
+from asyncio import Future, Queue
+
+import numpy as np
+
+from rizmo.face_rec.face_finder import SimilarFaceFinder
+from rizmo.metrics import Histogram
+
+FaceRecs = list[tuple[str | None, float]]
+
+
+class FaceFinderBatcher:
+    """
+    Gathers face images from multiple `find_faces` requests into a single
+    batch, so the face embedding model runs once per batch instead of once
+    per request.
+
+    A batch is run once it has at least `max_batch_size` images, or
+    `max_delay` seconds after its first request arrived, whichever is first.
+    """
+
+    def __init__(
+            self,
+            face_finder: SimilarFaceFinder,
+            max_batch_size: int = 16,
+            max_delay: float = 0.005,
+            max_queue_size: int = 64,
+    ):
+        self.face_finder = face_finder
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self.batch_sizes = Histogram('Batch size', [1, 2, 4, 8, 16, 32, 64])
+        self.latencies = Histogram('Latency', [5, 10, 20, 50, 100, 200, 500, 1000], unit='ms')
+
+        self._queue: Queue[tuple[list[np.ndarray], Future, float]] = Queue(max_queue_size)
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name='FaceFinderBatcher')
+
+    async def stop(self) -> None:
+        task = self._task
+        if task is None or task.done():
+            return
+
+        task.cancel()
+        self._task = None
+
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def find_faces(self, imgs: list[np.ndarray]) -> FaceRecs:
+        return await (await self.submit(imgs))
+
+    async def submit(self, imgs: list[np.ndarray]) -> Future[FaceRecs]:
+        """
+        Queues the images to be included in the next batch, and returns
+        a future of their face recognitions.
+
+        Waits if the queue is full.
+        """
+
+        future = asyncio.get_running_loop().create_future()
+
+        if not imgs:
+            future.set_result([])
+        else:
+            await self._queue.put((imgs, future, time.monotonic()))
+
+        return future
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._get_batch()
+            await self._run_batch(batch)
+
+    async def _get_batch(self) -> list[tuple[list[np.ndarray], Future, float]]:
+        batch = [await self._queue.get()]
+        batch_size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_delay
+
+        while batch_size < self.max_batch_size:
+            if not self._queue.empty():
+                item = self._queue.get_nowait()
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except TimeoutError:
+                    break
+
+            batch.append(item)
+            batch_size += len(item[0])
+
+        return batch
+
+    async def _run_batch(self, batch: list[tuple[list[np.ndarray], Future, float]]) -> None:
+        imgs = [img for item_imgs, _, _ in batch for img in item_imgs]
+
+        try:
+            face_recs = await asyncio.to_thread(self.face_finder.find_faces, imgs)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batch_sizes.add(len(imgs))
+
+        now = time.monotonic()
+        start = 0
+        for item_imgs, future, t_submit in batch:
+            end = start + len(item_imgs)
+
+            if not future.done():
+                future.set_result(face_recs[start:end])
+
+            self.latencies.add(1000 * (now - t_submit))
+            start = end
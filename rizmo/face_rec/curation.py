@@ -0,0 +1,39 @@
+import numpy as np
+
+from rizmo.face_rec.vector_db import normalize
+
+
+def max_similarity(embedding: np.ndarray, embeddings: np.ndarray) -> float:
+    """Returns the highest cosine similarity between the embedding and any of the embeddings."""
+
+    if not len(embeddings):
+        return float('-inf')
+
+    embedding, *_ = normalize([embedding])
+    return float((normalize(embeddings) @ embedding).max())
+
+
+def k_center_select(embeddings: np.ndarray, k: int) -> list[int]:
+    """
+    Greedily selects `k` diverse embeddings using k-center selection:
+    starts with the embedding most similar to the mean, then repeatedly adds
+    the embedding that is least similar to all of those already selected.
+
+    Returns the indices of the selected embeddings.
+    """
+
+    if k >= len(embeddings):
+        return list(range(len(embeddings)))
+
+    embeddings = normalize(embeddings)
+    mean, *_ = normalize([embeddings.mean(axis=0)])
+
+    selected = [int((embeddings @ mean).argmax())]
+    max_similarities = embeddings @ embeddings[selected[0]]
+
+    while len(selected) < k:
+        i = int(max_similarities.argmin())
+        selected.append(i)
+        np.maximum(max_similarities, embeddings @ embeddings[i], out=max_similarities)
+
+    return selected
@@ -0,0 +1,239 @@
+import hashlib
+import os
+from collections.abc import Callable, Iterable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+from rosy.utils import require
+
+from rizmo.json import JsonFile
+
+Name = str
+
+FileEmbedder = Callable[[list[Path]], Iterable[np.ndarray | None]]
+"""
+Takes a list of image file paths and returns their embeddings, in order,
+or `None` for images that could not be read.
+"""
+
+
+@dataclass
+class IndexEntry:
+    file: str
+    """Path of the image file, relative to the image store root."""
+
+    name: Name
+
+    hash: str
+    """Hash of the image file contents."""
+
+    mtime_ns: int
+    size: int
+
+
+class EmbeddingIndex:
+    """
+    Persisted embeddings of the images in an image store, so images only
+    need to be embedded once, instead of on every startup.
+
+    The embeddings are stored as a raw matrix file which is memory-mapped
+    when loaded, plus a JSON manifest with the image file, name, and content
+    hash of each row. There is one index per embedding model.
+    """
+
+    def __init__(
+            self,
+            root: str | Path,
+            model_name: str,
+            dtype: np.dtype = np.float16,
+    ):
+        self.root = Path(root)
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self._manifest_file = JsonFile(self.root / f'{model_name}.json')
+        self._matrix_path = self.root / f'{model_name}.{self.dtype.name}'
+
+        self.entries: list[IndexEntry] = []
+        self.embeddings: np.ndarray | None = None
+        self.dim: int | None = None
+
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def items(self) -> Iterable[tuple[np.ndarray, Name]]:
+        if self.embeddings is None:
+            return []
+
+        return zip(self.embeddings, (entry.name for entry in self.entries))
+
+    def get_names(self) -> set[Name]:
+        return {entry.name for entry in self.entries}
+
+    def get_rows(self, name: Name) -> list[int]:
+        """Returns the rows of the embeddings of the name's images."""
+        return [row for row, entry in enumerate(self.entries) if entry.name == name]
+
+    def _load(self) -> None:
+        try:
+            manifest = self._manifest_file.read()
+        except (OSError, ValueError):
+            return
+
+        entries = [IndexEntry(**entry) for entry in manifest['entries']]
+        dim = manifest['dim']
+        if not entries:
+            return
+
+        expected_size = len(entries) * dim * self.dtype.itemsize
+        if not self._matrix_path.exists() or self._matrix_path.stat().st_size < expected_size:
+            print(f'WARNING: Embedding index is incomplete; rebuilding: {self._matrix_path}')
+            return
+
+        self.entries = entries
+        self.dim = dim
+        self._map_embeddings()
+
+    def _map_embeddings(self) -> None:
+        self.embeddings = np.memmap(
+            self._matrix_path,
+            dtype=self.dtype,
+            mode='r',
+            shape=(len(self.entries), self.dim),
+        )
+
+    def sync(
+            self,
+            root: Path,
+            files: Iterable[tuple[Path, Name]],
+            embed_files: FileEmbedder,
+    ) -> None:
+        """
+        Updates the index to contain exactly the given image files.
+
+        Unchanged files reuse their stored embedding; only new or changed
+        files are passed to `embed_files`. Files are considered unchanged if
+        their mtime and size match, or else if their content hash matches.
+        """
+
+        cached_by_file = {entry.file: entry for entry in self.entries}
+        row_by_hash = {entry.hash: row for row, entry in enumerate(self.entries)}
+
+        entries: list[IndexEntry] = []
+        embeddings: list[np.ndarray] = []
+        missing: list[tuple[Path, IndexEntry]] = []
+
+        for path, name in files:
+            stat = path.stat()
+            file = path.relative_to(root).as_posix()
+
+            cached = cached_by_file.get(file)
+            if cached and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+                file_hash = cached.hash
+            else:
+                file_hash = hash_file(path)
+
+            entry = IndexEntry(file, name, file_hash, stat.st_mtime_ns, stat.st_size)
+
+            row = row_by_hash.get(file_hash)
+            if row is None:
+                missing.append((path, entry))
+            else:
+                entries.append(entry)
+                embeddings.append(self.embeddings[row])
+
+        missing_embeddings = embed_files([path for path, _ in missing]) if missing else []
+        embedded = 0
+        for (_, entry), embedding in zip(missing, missing_embeddings):
+            if embedding is not None:
+                entries.append(entry)
+                embeddings.append(embedding)
+                embedded += 1
+
+        if missing:
+            print(f'Embedded {embedded} new or changed face images.')
+
+        if entries != self.entries:
+            self._write(entries, embeddings)
+
+    def append(self, root: Path, path: Path, name: Name, embedding: np.ndarray) -> None:
+        """Adds the embedding of a newly stored image file to the index."""
+
+        embedding = np.asarray(embedding, dtype=self.dtype).reshape(-1)
+        self._check_dim(embedding)
+
+        stat = path.stat()
+        entry = IndexEntry(
+            path.relative_to(root).as_posix(),
+            name,
+            hash_file(path),
+            stat.st_mtime_ns,
+            stat.st_size,
+        )
+
+        # Overwrite any rows left over from an interrupted append
+        row_size = embedding.nbytes
+        with self._matrix_path.open('ab') as file:
+            file.truncate(len(self.entries) * row_size)
+            file.write(embedding.tobytes())
+
+        self.entries.append(entry)
+        self._write_manifest()
+        self._map_embeddings()
+
+    def remove(self, files: set[str]) -> None:
+        """Removes the embeddings of the image files, given relative to the image store root."""
+
+        rows = [row for row, entry in enumerate(self.entries) if entry.file not in files]
+        if len(rows) == len(self.entries):
+            return
+
+        self._write(
+            [self.entries[row] for row in rows],
+            [self.embeddings[row] for row in rows],
+        )
+
+    def _write(self, entries: list[IndexEntry], embeddings: list[np.ndarray]) -> None:
+        if embeddings:
+            matrix = np.stack(embeddings).astype(self.dtype)
+            self._check_dim(matrix[0])
+        else:
+            matrix = np.empty((0, self.dim or 0), dtype=self.dtype)
+
+        tmp_path = self._matrix_path.with_suffix('.tmp')
+        matrix.tofile(tmp_path)
+        os.replace(tmp_path, self._matrix_path)
+
+        self.entries = entries
+        self._write_manifest()
+
+        if entries:
+            self._map_embeddings()
+        else:
+            self.embeddings = None
+
+    def _write_manifest(self) -> None:
+        self._manifest_file.write(dict(
+            model_name=self.model_name,
+            dim=self.dim,
+            entries=[asdict(entry) for entry in self.entries],
+        ))
+
+    def _check_dim(self, embedding: np.ndarray) -> None:
+        if self.dim is None:
+            self.dim = embedding.shape[-1]
+
+        require(
+            embedding.shape[-1] == self.dim,
+            f'Expected embedding dimension {self.dim}; got {embedding.shape[-1]}',
+        )
+
+
+def hash_file(path: Path) -> str:
+    with path.open('rb') as file:
+        return hashlib.file_digest(file, 'sha1').hexdigest()
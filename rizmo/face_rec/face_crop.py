@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+
+from rizmo.nodes.messages_py36 import Box
+
+
+def extract_aligned_face(
+        image: np.ndarray,
+        box: Box,
+        size: int = 112,
+        margin: float = 0.,
+) -> np.ndarray:
+    """
+    Crops the face in the box out of the image, and resizes and pads it to
+    a square `size`x`size` image ready for the face embedding model.
+
+    The crop is resampled only once, straight from the full image, with the
+    same scale and padding as cropping the box and calling `preprocess_face`
+    on it, so the embedding model uses it as-is. The pixels can differ
+    slightly, since it downscales with `INTER_AREA`, which is sharper than
+    the `INTER_LINEAR` of `preprocess_face`.
+
+    Args:
+        image: The full image.
+        box: Box of the face in the image.
+        size: Width and height of the output image. Must be even.
+        margin: Fraction of the box width/height to add around each side
+            of the box. The expanded box is clipped to the image bounds.
+    """
+
+    assert size % 2 == 0, f'Size must be an even number; got {size}'
+
+    img_h, img_w = image.shape[:2]
+    margin_w, margin_h = round(box.width * margin), round(box.height * margin)
+    x0, x1 = max(0, box.x - margin_w), min(img_w, box.x + box.width + margin_w)
+    y0, y1 = max(0, box.y - margin_h), min(img_h, box.y + box.height + margin_h)
+
+    face_img = image[y0:y1, x0:x1]
+    h, w = face_img.shape[:2]
+
+    output = np.zeros((size, size) + image.shape[2:], dtype=image.dtype)
+    if h <= 0 or w <= 0:
+        return output
+
+    scale = .5 * size / max(h, w)
+    new_w, new_h = 2 * int(w * scale), 2 * int(h * scale)
+    if new_w <= 0 or new_h <= 0:
+        return output
+
+    pad_w = (size - new_w) // 2
+    pad_h = (size - new_h) // 2
+    interpolation = cv2.INTER_AREA if new_w < w else cv2.INTER_LINEAR
+
+    output[pad_h:pad_h + new_h, pad_w:pad_w + new_w] = cv2.resize(
+        face_img,
+        (new_w, new_h),
+        interpolation=interpolation,
+    )
+
+    return output
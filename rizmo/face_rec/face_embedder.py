@@ -1,8 +1,14 @@
+import time
 from abc import ABC, abstractmethod
+from pathlib import Path
+from threading import Lock
 
 import cv2
 import insightface
 import numpy as np
+from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+
+from rizmo.face_rec.onnx_session import OnnxSessionConfig, build_onnx_session
 
 
 class FaceEmbeddingGenerator(ABC):
@@ -15,9 +21,23 @@ class FaceEmbeddingGenerator(ABC):
 
 
 class InsightFaceEmbeddingGenerator(FaceEmbeddingGenerator):
-    def __init__(self, model, img_size: int):
+    """
+    Embeds faces with an InsightFace ArcFace ONNX model.
+
+    Faces are resized, padded and normalized straight into a preallocated
+    NCHW batch, which is fed to the ONNX Runtime session directly
+    (with IO binding, if the session supports it), instead of going through
+    `model.get_feat`, which copies and normalizes the whole batch again.
+    """
+
+    def __init__(self, model, img_size: int, use_io_binding: bool = True):
         self.model = model
         self.img_size = img_size
+        self.use_io_binding = use_io_binding and hasattr(model.session, 'io_binding')
+
+        self._batch: np.ndarray | None = None
+        self._scratch = np.empty(img_size * img_size * 3, dtype=np.uint8)
+        self._lock = Lock()
 
     @classmethod
     def from_model_zoo(
@@ -33,22 +53,88 @@ class InsightFaceEmbeddingGenerator(FaceEmbeddingGenerator):
         model.prepare(ctx_id=ctx_id, **prepare_kwargs)
         return cls(model, img_size)
 
+    @classmethod
+    def from_onnx_file(
+            cls,
+            model_file: str | Path,
+            img_size: int = 112,
+            session_config: OnnxSessionConfig = None,
+    ) -> 'InsightFaceEmbeddingGenerator':
+        """Loads the model with an ONNX Runtime session built from `session_config`."""
+
+        session = build_onnx_session(model_file, session_config)
+        model = ArcFaceONNX(model_file=str(model_file), session=session)
+        return cls(model, img_size)
+
+    def warmup(self, batch_size: int = 1) -> float:
+        """
+        Runs the model once on blank faces, so the first real run isn't slowed
+        down by lazy initialization. Returns the time it took, in seconds.
+        """
+
+        imgs = [np.zeros((self.img_size, self.img_size, 3), dtype=np.uint8)] * batch_size
+
+        t0 = time.perf_counter()
+        self.get_embeddings(imgs)
+        return time.perf_counter() - t0
+
     def get_embedding(self, img: np.ndarray) -> np.ndarray:
         return self.get_embeddings([img])[0]
 
     def get_embeddings(self, imgs: list[np.ndarray]) -> list[np.ndarray]:
-        imgs = [preprocess_face(img, size=self.img_size) for img in imgs]
-        return self.model.get_feat(imgs)
+        # The batch buffer is shared, and this may be called from several threads
+        with self._lock:
+            batch = self._get_batch(len(imgs))
+
+            preprocess_faces(
+                imgs,
+                batch,
+                mean=self.model.input_mean,
+                std=self.model.input_std,
+                scratch=self._scratch,
+            )
+
+            return self._run(batch)
+
+    def _get_batch(self, size: int) -> np.ndarray:
+        """Returns the first `size` items of the batch buffer, growing it by doubling."""
+
+        capacity = 0 if self._batch is None else len(self._batch)
+        if size > capacity:
+            capacity = max(size, 2 * capacity)
+            dtype = getattr(self.model, 'input_dtype', np.float32)
+            self._batch = np.empty((capacity, 3, self.img_size, self.img_size), dtype=dtype)
+
+        return self._batch[:size]
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        session = self.model.session
+        input_name, output_name = self.model.input_name, self.model.output_names[0]
+
+        if not self.use_io_binding:
+            return session.run([output_name], {input_name: batch})[0]
+
+        binding = session.io_binding()
+        binding.bind_cpu_input(input_name, batch)
+        binding.bind_output(output_name)
+        session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()[0]
 
 
 def preprocess_face(face_img: np.ndarray, size: int = 112) -> np.ndarray:
     """
     Resizes the input face image to 112x112 pixels and applies padding if necessary.
+
+    Images that are already `size`x`size` (e.g. from `extract_aligned_face`)
+    are returned as-is.
     """
 
     assert size % 2 == 0, f'Size must be an even number; got {size}'
 
     h, w = face_img.shape[:2]
+    if h == size and w == size:
+        return face_img
+
     scale = .5 * size / max(h, w)
     new_w, new_h = 2 * int(w * scale), 2 * int(h * scale)
 
@@ -67,3 +153,59 @@ def preprocess_face(face_img: np.ndarray, size: int = 112) -> np.ndarray:
         f"Expected output shape {(size, size)}, got {padded.shape[:2]}"
 
     return padded
+
+
+def preprocess_faces(
+        face_imgs: list[np.ndarray],
+        out: np.ndarray,
+        mean: float = 127.5,
+        std: float = 127.5,
+        scratch: np.ndarray = None,
+) -> np.ndarray:
+    """
+    Resizes and pads the BGR face images like `preprocess_face`, and writes
+    them into the NCHW batch `out` as normalized RGB, i.e. `(rgb - mean) / std`,
+    the same as `cv2.dnn.blobFromImages(..., swapRB=True)` would.
+
+    Args:
+        face_imgs: BGR face images.
+        out: Batch to write into, of shape (len(face_imgs), 3, size, size).
+        mean: Value subtracted from every pixel.
+        std: Value every pixel is divided by, after subtracting the mean.
+        scratch: Optional flat uint8 buffer of at least size * size * 3 items
+            to resize into, so resizing does not allocate.
+    """
+
+    size = out.shape[2]
+    assert size % 2 == 0, f'Size must be an even number; got {size}'
+    assert out.shape == (len(face_imgs), 3, size, size), \
+        f'Expected output shape {(len(face_imgs), 3, size, size)}, got {out.shape}'
+
+    if scratch is None:
+        scratch = np.empty(size * size * 3, dtype=np.uint8)
+
+    out.fill(-mean / std)
+
+    for face_img, face_out in zip(face_imgs, out):
+        h, w = face_img.shape[:2]
+
+        if h == size and w == size:
+            new_w, new_h = size, size
+            resized = face_img
+        else:
+            scale = .5 * size / max(h, w)
+            new_w, new_h = 2 * int(w * scale), 2 * int(h * scale)
+
+            # A contiguous view of the scratch buffer, so cv2 writes into it
+            resized = scratch[:new_h * new_w * 3].reshape(new_h, new_w, 3)
+            cv2.resize(face_img, (new_w, new_h), dst=resized, interpolation=cv2.INTER_LINEAR)
+
+        pad_w = (size - new_w) // 2
+        pad_h = (size - new_h) // 2
+        face_out = face_out[:, pad_h:pad_h + new_h, pad_w:pad_w + new_w]
+
+        # HWC BGR -> CHW RGB
+        np.subtract(resized.transpose(2, 0, 1)[::-1], np.float32(mean), out=face_out)
+        face_out *= np.float32(1 / std)
+
+    return out
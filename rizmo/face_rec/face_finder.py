@@ -1,31 +1,57 @@
+import copy
+import time
 from abc import ABC, abstractmethod
+from itertools import islice
 from typing import Iterable, Literal
 
 import numpy as np
-import torch
+from rosy.utils import require
 
 from rizmo.face_rec.face_embedder import FaceEmbeddingGenerator, InsightFaceEmbeddingGenerator
-from rizmo.face_rec.vector_db import BruteForceCosineVectorDatabase, VectorDatabase
+from rizmo.face_rec.ivf_vector_db import Aggregation, IVFCosineVectorDatabase
+from rizmo.face_rec.onnx_session import OnnxSessionConfig
+from rizmo.face_rec.vector_db import NumpyCosineVectorDatabase, VectorDatabase
 
 ModelName = Literal['w600k_r50', 'w600k_mbf']
+FaceDbDtype = Literal['auto', 'float32', 'float16', 'int8']
+FaceDbBackend = Literal['auto', 'torch', 'numpy']
+FaceDbIndex = Literal['brute_force', 'ivf']
 
 
 def build_face_finder(
         embedding_model: ModelName = 'w600k_r50',
         embedding_model_root: str = './resources/insightface/models',
         face_db_device: str = 'auto',
+        face_db_dtype: FaceDbDtype = 'auto',
+        face_db_backend: FaceDbBackend = 'auto',
+        face_db_index: FaceDbIndex = 'brute_force',
+        face_db_probes: int = 8,
+        face_db_aggregation: Aggregation = 'max',
         min_similarity: float = 0.001,
-) -> 'SimilarFaceFinder':
+        session_config: OnnxSessionConfig = None,
+) -> 'SimilarFaceEmbeddingFinder':
     model_file = f'{embedding_model_root}/{embedding_model}.onnx'
-    face_embedder = InsightFaceEmbeddingGenerator.from_model_zoo(model_file)
+    session_config = session_config or OnnxSessionConfig()
 
-    if face_db_device == 'auto':
-        face_db_device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    face_db = BruteForceCosineVectorDatabase(
-        dtype=torch.float16,
-        device=face_db_device,
+    t0 = time.perf_counter()
+    face_embedder = InsightFaceEmbeddingGenerator.from_onnx_file(model_file, session_config=session_config)
+    load_time = time.perf_counter() - t0
+    warmup_time = face_embedder.warmup()
+
+    print(
+        f'Loaded face embedding model {embedding_model} in {1000 * load_time:.0f} ms: '
+        f'providers={face_embedder.model.session.get_providers()} {session_config}; '
+        f'warmup: {1000 * warmup_time:.0f} ms'
     )
 
+    if face_db_index == 'ivf':
+        face_db = IVFCosineVectorDatabase(
+            n_probe=face_db_probes,
+            aggregation=face_db_aggregation,
+        )
+    else:
+        face_db = build_face_db(face_db_device, face_db_dtype, face_db_backend)
+
     similar_face_finder = SimilarFaceEmbeddingFinder(
         face_embedder,
         face_db,
@@ -35,6 +61,60 @@ def build_face_finder(
     return similar_face_finder
 
 
+def build_face_db(
+        device: str = 'auto',
+        dtype: FaceDbDtype = 'auto',
+        backend: FaceDbBackend = 'auto',
+) -> VectorDatabase:
+    """
+    Builds the face vector database with a dtype and implementation suited
+    to the device: float16 with torch on CUDA, and float32 (or int8) on CPU,
+    where float16 matmul is slow.
+
+    The "numpy" backend only supports CPU, but does not import torch at all.
+    The "auto" backend uses torch if it is installed, unless dtype is int8.
+    """
+
+    if backend == 'auto':
+        backend = 'numpy' if dtype == 'int8' or not _is_torch_available() else 'torch'
+
+    if device == 'auto':
+        device = 'cuda' if backend == 'torch' and _is_cuda_available() else 'cpu'
+
+    if dtype == 'auto':
+        dtype = 'float32' if device == 'cpu' else 'float16'
+
+    if backend == 'numpy':
+        require(device == 'cpu', f'The numpy backend only supports CPU; got device {device}')
+        require(dtype in ('float32', 'int8'), f'dtype must be float32 or int8 with numpy; got {dtype}')
+
+        return NumpyCosineVectorDatabase(dtype=np.dtype(dtype))
+
+    import torch
+    from rizmo.face_rec.torch_vector_db import BruteForceCosineVectorDatabase
+
+    require(dtype in ('float16', 'float32'), f'dtype must be float16 or float32 with torch; got {dtype}')
+
+    return BruteForceCosineVectorDatabase(
+        dtype=getattr(torch, dtype),
+        device=device,
+    )
+
+
+def _is_torch_available() -> bool:
+    try:
+        import torch
+    except ImportError:
+        return False
+
+    return True
+
+
+def _is_cuda_available() -> bool:
+    import torch
+    return torch.cuda.is_available()
+
+
 class SimilarFaceFinder(ABC):
     @abstractmethod
     def add_face(self, face: np.ndarray, name: str) -> None:
@@ -65,20 +145,44 @@ class SimilarFaceEmbeddingFinder(SimilarFaceFinder):
     def add_face(self, face: np.ndarray, name: str) -> None:
         self.add_faces([(face, name)])
 
-    def add_faces(self, faces: Iterable[tuple[np.ndarray, str]]) -> None:
-        faces = list(faces)
-        if not faces:
-            return
+    def add_faces(self, faces: Iterable[tuple[np.ndarray, str]], batch_size: int = 32) -> None:
+        """
+        Embeds and adds the faces in batches, so lazily-loaded faces can be
+        loaded while the previous batch is embedded.
+        """
 
-        imgs, names = zip(*faces)
-        embeddings = self._get_embeddings(imgs)
-        self.vector_db.add_all(zip(embeddings, names))
+        faces = iter(faces)
+        while batch := list(islice(faces, batch_size)):
+            imgs, names = zip(*batch)
+            embeddings = self.get_embeddings(imgs)
+            self.add_face_embeddings(zip(embeddings, names))
+
+    def add_face_embeddings(self, items: Iterable[tuple[np.ndarray, str]]) -> None:
+        items = list(items)
+        if items:
+            self.vector_db.add_all(items)
+
+    def set_face_embeddings(self, items: Iterable[tuple[np.ndarray, str]]) -> None:
+        """
+        Replaces all the face embeddings, e.g. after images were deleted from the store.
+        The new database is built before it is swapped in, so concurrent searches
+        see either all the old faces or all the new ones.
+        """
+
+        vector_db = copy.copy(self.vector_db)
+        vector_db.clear()
+
+        items = list(items)
+        if items:
+            vector_db.add_all(items)
+
+        self.vector_db = vector_db
 
     def find_faces(self, imgs: Iterable[np.ndarray]) -> list[tuple[str | None, float]]:
         if not len(self.vector_db):
             return [self.not_found_result for _ in imgs]
 
-        embeddings = self._get_embeddings(imgs)
+        embeddings = self.get_embeddings(imgs)
 
         faces: list[tuple[str, float]] = self.vector_db.search(embeddings)
 
@@ -87,5 +191,89 @@ class SimilarFaceEmbeddingFinder(SimilarFaceFinder):
             for face in faces
         ]
 
-    def _get_embeddings(self, imgs: Iterable[np.ndarray]) -> list[np.ndarray]:
+    def get_embeddings(self, imgs: Iterable[np.ndarray]) -> list[np.ndarray]:
         return self.face_embedder.get_embeddings(list(imgs))
+
+
+class CascadeFaceFinder(SimilarFaceFinder):
+    """
+    Recognizes faces with a fast face finder first, and only re-recognizes
+    the faces whose fast result is ambiguous with an accurate face finder.
+    Each face finder has its own embedding model and face database.
+
+    A fast result is ambiguous if its similarity is within `margin` of the
+    fast finder's threshold, or if the second most similar identity is
+    within `min_gap` of it.
+    """
+
+    def __init__(
+            self,
+            fast: SimilarFaceEmbeddingFinder,
+            accurate: SimilarFaceEmbeddingFinder,
+            margin: float = 0.05,
+            min_gap: float = 0.05,
+    ):
+        self.fast = fast
+        self.accurate = accurate
+        self.margin = margin
+        self.min_gap = min_gap
+
+        self.fast_path = 0
+        self.slow_path = 0
+
+    def add_face(self, face: np.ndarray, name: str) -> None:
+        self.add_faces([(face, name)])
+
+    def add_faces(self, faces: Iterable[tuple[np.ndarray, str]]) -> None:
+        faces = list(faces)
+        self.fast.add_faces(faces)
+        self.accurate.add_faces(faces)
+
+    def find_faces(self, imgs: Iterable[np.ndarray]) -> list[tuple[str | None, float]]:
+        imgs = list(imgs)
+        fast = self.fast
+
+        if not len(fast.vector_db) or not imgs:
+            return [fast.not_found_result for _ in imgs]
+
+        results = fast.vector_db.search_identities(fast.get_embeddings(imgs), top_n=2)
+
+        face_recs = []
+        ambiguous = []
+        for i, ((name, sim), *others) in enumerate(results):
+            second_sim = others[0][1] if others else float('-inf')
+
+            if self._is_ambiguous(sim, second_sim):
+                ambiguous.append(i)
+                face_recs.append(None)
+            else:
+                face_recs.append((name, sim) if sim >= fast.threshold else fast.not_found_result)
+
+        if ambiguous:
+            accurate_recs = self.accurate.find_faces([imgs[i] for i in ambiguous])
+            for i, face_rec in zip(ambiguous, accurate_recs):
+                face_recs[i] = face_rec
+
+        self.fast_path += len(imgs) - len(ambiguous)
+        self.slow_path += len(ambiguous)
+
+        return face_recs
+
+    def _is_ambiguous(self, sim: float, second_sim: float) -> bool:
+        # Faces clearly below the threshold are unknown, however close the second best is
+        if sim < self.fast.threshold - self.margin:
+            return False
+
+        return sim < self.fast.threshold + self.margin or sim - second_sim < self.min_gap
+
+    def reset(self) -> None:
+        self.fast_path = 0
+        self.slow_path = 0
+
+    def __str__(self) -> str:
+        total = self.fast_path + self.slow_path
+        fast_ratio = self.fast_path / total if total else 0.
+        return (
+            f'Face cascade: fast={self.fast_path} slow={self.slow_path} '
+            f'fast_ratio={fast_ratio:.1%}'
+        )
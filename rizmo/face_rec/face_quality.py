@@ -0,0 +1,98 @@
+from collections.abc import Sequence
+
+import cv2
+import numpy as np
+
+
+class FaceQualityGate:
+    """
+    Cheaply scores face crops by size, sharpness and brightness, so crops
+    that can't be reliably recognized anyway don't need to be embedded.
+
+    Sharpness is the variance of the Laplacian of the grayscale crop.
+    Crops are resized to a common size first, so the scores are computed
+    for the whole batch at once.
+    """
+
+    def __init__(
+            self,
+            min_size: int = 24,
+            min_sharpness: float = 15.,
+            min_brightness: float = 30.,
+            max_brightness: float = 230.,
+            analysis_size: int = 64,
+    ):
+        """
+        Args:
+            min_size: Minimum width and height of the face, in pixels.
+            min_sharpness: Minimum variance of the Laplacian.
+            min_brightness: Minimum mean gray level, in range 0-255.
+            max_brightness: Maximum mean gray level, in range 0-255.
+            analysis_size: Size crops are resized to before scoring.
+        """
+
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.analysis_size = analysis_size
+
+        self.passed = 0
+        self.skipped = 0
+
+    def check(self, imgs: Sequence[np.ndarray], sizes: Sequence[int] = None) -> np.ndarray:
+        """
+        Returns a bool array of which face crops pass the quality gate.
+
+        Args:
+            imgs: BGR face crops.
+            sizes: Size of each face in the original image, e.g. the smaller
+                side of its box. Defaults to the smaller side of each crop.
+        """
+
+        if not len(imgs):
+            return np.zeros(0, dtype=bool)
+
+        if sizes is None:
+            sizes = [min(img.shape[:2]) for img in imgs]
+
+        sharpness, brightness = self.get_scores(imgs)
+
+        passed = (
+                (np.asarray(sizes) >= self.min_size)
+                & (sharpness >= self.min_sharpness)
+                & (brightness >= self.min_brightness)
+                & (brightness <= self.max_brightness)
+        )
+
+        self.passed += int(passed.sum())
+        self.skipped += len(passed) - int(passed.sum())
+
+        return passed
+
+    def get_scores(self, imgs: Sequence[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the sharpness and brightness of each face crop."""
+
+        size = self.analysis_size
+        grays = np.stack([
+            cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), (size, size), interpolation=cv2.INTER_AREA)
+            for img in imgs
+        ]).astype(np.float32)
+
+        # Only score the center, which excludes any padding around aligned crops
+        grays = grays[:, size // 4:size - size // 4, size // 4:size - size // 4]
+
+        laplacian = (
+                grays[:, :-2, 1:-1] + grays[:, 2:, 1:-1]
+                + grays[:, 1:-1, :-2] + grays[:, 1:-1, 2:]
+                - 4 * grays[:, 1:-1, 1:-1]
+        )
+
+        return laplacian.var(axis=(1, 2)), grays.mean(axis=(1, 2))
+
+    def reset(self) -> None:
+        self.passed = 0
+        self.skipped = 0
+
+    def __str__(self) -> str:
+        return f'Face quality gate: passed={self.passed} skipped={self.skipped}'
@@ -0,0 +1,172 @@
+import asyncio
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+
+from rizmo.nodes.messages_py36 import Box
+
+FaceRec = tuple[str | None, float]
+
+
+@dataclass
+class FaceTrack:
+    box: Box
+    last_seen: float
+    last_checked: float = float('-inf')
+
+    recs: deque[FaceRec] = field(default_factory=deque)
+    """Most recent face recognitions of this track."""
+
+    pending: asyncio.Future | None = None
+    """Set while a recognition of this track is in progress."""
+
+    @property
+    def identity(self) -> FaceRec:
+        """
+        Name recognized most often over the recent recognitions, counting
+        not found (None) as a name too, and its mean similarity. Ties go to
+        the name recognized most recently.
+        """
+
+        if not self.recs:
+            return None, 0.
+
+        sims = defaultdict(list)
+        last_index = {}
+        for i, (name, sim) in enumerate(self.recs):
+            sims[name].append(sim)
+            last_index[name] = i
+
+        name = max(sims, key=lambda n: (len(sims[n]), last_index[n]))
+        return name, sum(sims[name]) / len(sims[name])
+
+
+class FaceTrackCache:
+    """
+    Associates face boxes across consecutive frames into tracks by IoU,
+    so a face that has already been recognized does not need to be
+    recognized again in every frame.
+    """
+
+    def __init__(
+            self,
+            min_iou: float = 0.3,
+            max_age: float = 1.,
+            recheck_interval: float = 2.,
+            min_confidence: float = 0.25,
+            confidence_half_life: float = 5.,
+            votes: int = 5,
+    ):
+        """
+        Args:
+            min_iou: Minimum IoU between a box and a track's last box to
+                associate the box with the track.
+            max_age: Tracks not seen for this many seconds are dropped.
+            recheck_interval: Tracks are recognized again at least this often,
+                in seconds.
+            min_confidence: Known tracks are recognized again once their
+                confidence has decayed below this. Should be below the
+                minimum similarity of a recognition, or weak matches are
+                recognized again on every frame.
+            confidence_half_life: Time, in seconds, for a track's confidence
+                to decay to half of its recognized similarity.
+            votes: Number of recent recognitions to vote over for the
+                identity of a track.
+        """
+
+        self.min_iou = min_iou
+        self.max_age = max_age
+        self.recheck_interval = recheck_interval
+        self.min_confidence = min_confidence
+        self.confidence_half_life = confidence_half_life
+        self.votes = votes
+
+        self.tracks: list[FaceTrack] = []
+
+        self.cached = 0
+        self.uncached = 0
+
+    def update(self, boxes: list[Box], timestamp: float) -> list[FaceTrack]:
+        """Returns the track of each box, creating new tracks as needed."""
+
+        self.tracks = [
+            track for track in self.tracks
+            if timestamp - track.last_seen <= self.max_age
+        ]
+
+        pairs = sorted(
+            (
+                (iou(box, track.box), box_i, track_i)
+                for box_i, box in enumerate(boxes)
+                for track_i, track in enumerate(self.tracks)
+            ),
+            reverse=True,
+        )
+
+        box_tracks: list[FaceTrack | None] = [None] * len(boxes)
+        matched_tracks = set()
+        for box_iou, box_i, track_i in pairs:
+            if box_iou < self.min_iou:
+                break
+
+            if box_tracks[box_i] is None and track_i not in matched_tracks:
+                box_tracks[box_i] = self.tracks[track_i]
+                matched_tracks.add(track_i)
+
+        for box_i, box in enumerate(boxes):
+            track = box_tracks[box_i]
+
+            if track is None:
+                track = FaceTrack(box, timestamp, recs=deque(maxlen=self.votes))
+                self.tracks.append(track)
+                box_tracks[box_i] = track
+            else:
+                track.box = box
+                track.last_seen = timestamp
+
+        return box_tracks
+
+    def needs_recognition(self, track: FaceTrack, timestamp: float) -> bool:
+        if track.pending is not None:
+            needed = False
+        elif timestamp - track.last_checked >= self.recheck_interval:
+            needed = True
+        else:
+            name, sim = track.identity
+            needed = name is not None and self.confidence(track, timestamp) < self.min_confidence
+
+        if needed:
+            self.uncached += 1
+        else:
+            self.cached += 1
+
+        return needed
+
+    def confidence(self, track: FaceTrack, timestamp: float) -> float:
+        _, sim = track.identity
+        age = timestamp - track.last_checked
+        return sim * 0.5 ** (age / self.confidence_half_life)
+
+    def add_recognition(self, track: FaceTrack, rec: FaceRec, timestamp: float) -> None:
+        track.recs.append(rec)
+        track.last_checked = timestamp
+
+    def reset(self) -> None:
+        self.cached = 0
+        self.uncached = 0
+
+    def __str__(self) -> str:
+        return (
+            f'Face tracks: active={len(self.tracks)} '
+            f'cached={self.cached} uncached={self.uncached}'
+        )
+
+
+def iou(a: Box, b: Box) -> float:
+    x0, y0 = max(a.x, b.x), max(a.y, b.y)
+    x1 = min(a.x + a.width, b.x + b.width)
+    y1 = min(a.y + a.height, b.y + b.height)
+
+    intersection = max(0, x1 - x0) * max(0, y1 - y0)
+    union = a.area + b.area - intersection
+
+    return intersection / union if union > 0 else 0.
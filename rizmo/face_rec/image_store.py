@@ -1,15 +1,32 @@
 from abc import ABC, abstractmethod
-from collections.abc import Sequence
-from itertools import count
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import count, islice
 from pathlib import Path
 from typing import Iterable
 
 import cv2
 import numpy as np
+from rosy.utils import require
 
+from rizmo.face_rec.curation import k_center_select, max_similarity
+from rizmo.face_rec.embedding_index import EmbeddingIndex
 
 Name = str
 
+Embedder = Callable[[list[np.ndarray]], Iterable[np.ndarray]]
+
+
+@dataclass
+class AddResult:
+    duplicate: bool = False
+    """The image was rejected as too similar to an existing image of the name."""
+    kept: bool = False
+    """The image was saved, and not deleted again by the cap on images per name."""
+    deleted: int = 0
+    """Number of images of the name deleted by the cap, including the new image if not kept."""
+
 
 class ImageStore(ABC):
     @abstractmethod
@@ -31,13 +48,73 @@ class FileImageStore(ImageStore, ABC):
             root: str | Path,
             file_type: str = 'jpg',
             imwrite_params: Sequence[int] = None,
+            read_workers: int = 4,
+            read_chunk_size: int = 32,
     ):
+        """
+        Args:
+            root: Directory to store the images in.
+            file_type: File type to write images as.
+            imwrite_params: Params passed to `cv2.imwrite`.
+            read_workers: Number of threads to decode images with.
+            read_chunk_size: Number of images per chunk when reading.
+        """
+
         self.root = Path(root)
         self.file_type = file_type
         self.imwrite_params = imwrite_params or []
+        self.read_workers = read_workers
+        self.read_chunk_size = read_chunk_size
 
         self.root.mkdir(parents=True, exist_ok=True)
 
+    def get_all(self) -> Iterable[tuple[np.ndarray, Name]]:
+        for chunk in self.get_all_chunks():
+            yield from chunk
+
+    def get_all_chunks(self) -> Iterable[list[tuple[np.ndarray, Name]]]:
+        """
+        Returns all images in chunks of up to `read_chunk_size`.
+        The next chunk is decoded in parallel while the current one is processed.
+        """
+
+        for chunk in self._read_chunks(self._get_file_paths()):
+            chunk = [(img, self._get_name(path)) for path, img in chunk if img is not None]
+            if chunk:
+                yield chunk
+
+    @abstractmethod
+    def _get_file_paths(self) -> Iterable[Path]:
+        ...
+
+    @abstractmethod
+    def _get_name(self, path: Path) -> Name:
+        ...
+
+    def _read_chunks(self, paths: Iterable[Path]) -> Iterator[list[tuple[Path, np.ndarray | None]]]:
+        paths = iter(paths)
+
+        # cv2 releases the GIL while decoding, so threads decode in parallel
+        with ThreadPoolExecutor(self.read_workers, thread_name_prefix='ImageReader') as executor:
+            def submit_chunk():
+                return [
+                    (path, executor.submit(self._read, path))
+                    for path in islice(paths, self.read_chunk_size)
+                ]
+
+            next_chunk = submit_chunk()
+            while next_chunk:
+                chunk, next_chunk = next_chunk, submit_chunk()
+                yield [(path, future.result()) for path, future in chunk]
+
+    @staticmethod
+    def _read(path: Path) -> np.ndarray | None:
+        img = cv2.imread(str(path))
+        if img is None:
+            print(f'ERROR: Could not read image: {path}')
+
+        return img
+
 
 class SingleImagePerNameFileStore(FileImageStore):
     """Stores a single image per name in the file system."""
@@ -46,30 +123,111 @@ class SingleImagePerNameFileStore(FileImageStore):
         path = self.root / f'{name}.{self.file_type}'
         cv2.imwrite(str(path), img, self.imwrite_params)
 
-    def get_all(self) -> Iterable[tuple[np.ndarray, Name]]:
-        for path in self._get_file_paths():
-            img = cv2.imread(str(path))
-            if img is None:
-                print(f'ERROR: Could not read image: {path}')
-                continue
-
-            name = path.stem
-            yield img, name
-
     def get_names(self) -> set[Name]:
         return {path.stem for path in self._get_file_paths()}
 
     def _get_file_paths(self) -> Iterable[Path]:
         return self.root.glob(f'*.{self.file_type}')
 
+    def _get_name(self, path: Path) -> Name:
+        return path.stem
+
 
 class MultiImagePerNameFileStore(FileImageStore):
-    """Stores multiple images per name in the file system."""
+    """
+    Stores multiple images per name in the file system.
+
+    If given an `EmbeddingIndex`, the embeddings of the stored images are
+    persisted too, so they only need to be computed once. The index is also
+    used to curate the images of each name:
+    - New images too similar to an existing image of the name are rejected.
+    - Each name is capped at a number of images, keeping the most diverse.
+    """
+
+    def __init__(
+            self,
+            root: str | Path,
+            file_type: str = 'jpg',
+            imwrite_params: Sequence[int] = None,
+            embedding_index: EmbeddingIndex = None,
+            legacy_file_types: Sequence[str] = (),
+            duplicate_similarity: float = None,
+            max_images_per_name: int = None,
+            **kwargs,
+    ):
+        """
+        Args:
+            root: Directory to store the images in.
+            file_type: File type to write images as.
+            imwrite_params: Params passed to `cv2.imwrite`.
+            embedding_index: Index of the embeddings of the stored images.
+            legacy_file_types: Other file types of existing images to read.
+            duplicate_similarity: When adding an image with its embedding,
+                it is rejected if its similarity to an existing image
+                of the name is at least this.
+            max_images_per_name: When adding an image with its embedding,
+                if the name has more than this many images, the least diverse
+                images are deleted.
+            **kwargs: Passed to `FileImageStore`.
+        """
+
+        super().__init__(root, file_type, imwrite_params, **kwargs)
+        self.embedding_index = embedding_index
+        self.legacy_file_types = legacy_file_types
+        self.duplicate_similarity = duplicate_similarity
+        self.max_images_per_name = max_images_per_name
+
+    def add(self, img: np.ndarray, name: Name, embedding: np.ndarray = None) -> AddResult:
+        index = self.embedding_index
+        curate = index is not None and embedding is not None
+
+        if curate and self.duplicate_similarity is not None:
+            embeddings = index.embeddings[index.get_rows(name)] if len(index) else []
+            if max_similarity(embedding, embeddings) >= self.duplicate_similarity:
+                return AddResult(duplicate=True)
 
-    def add(self, img: np.ndarray, name: Name) -> None:
         path = self._get_next_image_path(name)
         cv2.imwrite(str(path), img, self.imwrite_params)
 
+        if not curate:
+            return AddResult(kept=True)
+
+        index.append(self.root, path, name, embedding)
+        removed = self._limit_images(name)
+
+        file = path.relative_to(self.root).as_posix()
+        return AddResult(kept=file not in removed, deleted=len(removed))
+
+    def curate(self, embedder: Embedder) -> int:
+        """
+        Limits the number of images of every name, keeping the most diverse.
+        Returns the number of images deleted.
+        """
+
+        self.get_all_embeddings(embedder)
+        return sum(len(self._limit_images(name)) for name in self.get_names())
+
+    def _limit_images(self, name: Name) -> set[str]:
+        """Returns the files deleted, relative to the root."""
+
+        index = self.embedding_index
+        if self.max_images_per_name is None:
+            return set()
+
+        rows = index.get_rows(name)
+        if len(rows) <= self.max_images_per_name:
+            return set()
+
+        keep = set(k_center_select(index.embeddings[rows], self.max_images_per_name))
+        remove = {index.entries[row].file for i, row in enumerate(rows) if i not in keep}
+
+        index.remove(remove)
+        for file in remove:
+            (self.root / file).unlink(missing_ok=True)
+
+        print(f'Deleted {len(remove)} similar images of {name!r}.')
+        return remove
+
     def _get_next_image_path(self, name: Name) -> Path:
         root = self.root / name
         root.mkdir(parents=True, exist_ok=True)
@@ -81,15 +239,37 @@ class MultiImagePerNameFileStore(FileImageStore):
 
         raise RuntimeError('Unreachable')
 
-    def get_all(self) -> Iterable[tuple[np.ndarray, Name]]:
-        for path in self.root.glob(f'*/*.{self.file_type}'):
-            img = cv2.imread(str(path))
-            if img is None:
-                print(f'ERROR: Could not read image: {path}')
-                continue
+    def get_all_embeddings(self, embedder: Embedder) -> Iterable[tuple[np.ndarray, Name]]:
+        """
+        Returns the embedding of every stored image, using the embedding index.
+        Only images that are new or changed since the last call are embedded.
+        """
+
+        require(self.embedding_index is not None, 'Store has no embedding index.')
+
+        def embed_files(paths: list[Path]) -> Iterable[np.ndarray | None]:
+            for chunk in self._read_chunks(paths):
+                imgs = [img for _, img in chunk]
 
-            name = path.parent.name
-            yield img, name
+                valid_imgs = [img for img in imgs if img is not None]
+                embeddings = iter(embedder(valid_imgs) if valid_imgs else [])
+
+                yield from (None if img is None else next(embeddings) for img in imgs)
+
+        files = ((path, path.parent.name) for path in self._get_file_paths())
+        self.embedding_index.sync(self.root, files, embed_files)
+
+        return self.embedding_index.items()
 
     def get_names(self) -> set[Name]:
+        if self.embedding_index is not None:
+            return self.embedding_index.get_names()
+
         return set(d.name for d in self.root.iterdir())
+
+    def _get_file_paths(self) -> Iterable[Path]:
+        for file_type in (self.file_type, *self.legacy_file_types):
+            yield from self.root.glob(f'*/*.{file_type}')
+
+    def _get_name(self, path: Path) -> Name:
+        return path.parent.name
@@ -0,0 +1,251 @@
+from typing import Iterable, Literal
+
+import numpy as np
+from rosy.utils import require
+
+from rizmo.face_rec.vector_db import Label, NumpyCosineVectorDatabase, Vector, VectorDatabase, normalize
+
+Aggregation = Literal['max', 'top_k_mean', 'centroid']
+
+
+class IVFCosineVectorDatabase(VectorDatabase):
+    """
+    Approximate cosine similarity search using an inverted file (IVF) index:
+    vectors are clustered with spherical k-means, and a search only compares
+    against the vectors in the `n_probe` clusters closest to the query.
+
+    Until there are `min_train_size` vectors, searches are brute force.
+    New vectors are added to their closest cluster, and the clusters are
+    retrained whenever the database has doubled in size since the last
+    training.
+
+    Results can be aggregated per identity (label), so a single bad sample
+    of an identity is less likely to win:
+    - "max": Similarity of the most similar vector of the identity.
+    - "top_k_mean": Mean similarity of the `top_k` most similar vectors
+      of the identity.
+    - "centroid": Similarity to the mean of all vectors of the identity.
+    """
+
+    def __init__(
+            self,
+            n_probe: int = 8,
+            aggregation: Aggregation = 'max',
+            top_k: int = 3,
+            min_train_size: int = 1024,
+            kmeans_iters: int = 10,
+            seed: int = 0,
+    ):
+        require(n_probe >= 1, f'n_probe must be at least 1; got {n_probe}')
+        require(top_k >= 1, f'top_k must be at least 1; got {top_k}')
+
+        self.n_probe = n_probe
+        self.aggregation = aggregation
+        self.top_k = top_k
+        self.min_train_size = min_train_size
+        self.kmeans_iters = kmeans_iters
+
+        self._rng = np.random.default_rng(seed)
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self._flat)
+
+    @property
+    def labels(self) -> list[Label]:
+        return self._flat.labels
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    def add_all(self, items: Iterable[tuple[Vector, Label]]) -> None:
+        items = list(items)
+        start = len(self)
+
+        self._flat.add_all(items)
+        vectors = self._flat.vectors[start:]
+
+        self._add_identities(vectors, [label for _, label in items])
+
+        if len(self) >= self.min_train_size and len(self) >= 2 * self._trained_size:
+            self.train()
+        elif self.is_trained:
+            self._assign(vectors, start)
+
+    def clear(self) -> None:
+        self._flat = NumpyCosineVectorDatabase(np.float32)
+
+        self._identity_ids: dict[Label, int] = {}
+        self._identities: list[Label] = []
+        self._vector_identity_ids: list[int] = []
+        self._vector_identity_id_array: np.ndarray | None = None
+        self._identity_sums: np.ndarray | None = None
+        self._identity_counts: np.ndarray | None = None
+        self._identity_centroids: np.ndarray | None = None
+
+        self._centroids: np.ndarray | None = None
+        self._lists: list[list[int]] = []
+        self._list_arrays: list[np.ndarray | None] = []
+        self._trained_size = 0
+
+    def _add_identities(self, vectors: np.ndarray, labels: list[Label]) -> None:
+        for label in labels:
+            if label not in self._identity_ids:
+                self._identity_ids[label] = len(self._identities)
+                self._identities.append(label)
+
+        ids = [self._identity_ids[label] for label in labels]
+        self._vector_identity_ids.extend(ids)
+        self._vector_identity_id_array = None
+
+        capacity = 0 if self._identity_sums is None else self._identity_sums.shape[0]
+        if capacity < len(self._identities):
+            new_capacity = max(len(self._identities), 2 * capacity)
+            sums = np.zeros((new_capacity, vectors.shape[1]), dtype=np.float32)
+            counts = np.zeros(new_capacity, dtype=np.int64)
+
+            if capacity:
+                sums[:capacity] = self._identity_sums
+                counts[:capacity] = self._identity_counts
+
+            self._identity_sums, self._identity_counts = sums, counts
+
+        np.add.at(self._identity_sums, ids, vectors)
+        np.add.at(self._identity_counts, ids, 1)
+        self._identity_centroids = None
+
+    def train(self, n_lists: int = None) -> None:
+        """Clusters the vectors with spherical k-means, and rebuilds the index."""
+
+        vectors = self._flat.vectors
+        n_lists = n_lists or max(1, round(np.sqrt(len(vectors))))
+
+        # Training on a sample is much faster, and nearly as good
+        sample_size = min(len(vectors), 64 * n_lists)
+        sample = vectors[self._rng.choice(len(vectors), sample_size, replace=False)]
+
+        centroids = sample[self._rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            assignments = (sample @ centroids.T).argmax(axis=1)
+
+            counts = np.bincount(assignments, minlength=n_lists)
+            starts = np.r_[0, np.cumsum(counts)[:-1]]
+            non_empty = counts > 0
+
+            # Empty clusters keep their previous centroid
+            sorted_sample = sample[np.argsort(assignments, kind='stable')]
+            sums = np.add.reduceat(sorted_sample, starts[non_empty], axis=0)
+            centroids[non_empty] = normalize(sums)
+
+        self._centroids = centroids
+        self._lists = [[] for _ in range(n_lists)]
+        self._list_arrays = [None] * n_lists
+        self._trained_size = len(vectors)
+
+        self._assign(vectors, 0)
+
+    def _assign(self, vectors: np.ndarray, start: int) -> None:
+        assignments = (vectors @ self._centroids.T).argmax(axis=1)
+
+        for i, list_i in enumerate(assignments, start):
+            self._lists[list_i].append(i)
+            self._list_arrays[list_i] = None
+
+    def _get_list_array(self, list_i: int) -> np.ndarray:
+        array = self._list_arrays[list_i]
+        if array is None:
+            array = self._list_arrays[list_i] = np.array(self._lists[list_i], dtype=np.int64)
+
+        return array
+
+    def search(self, vectors: Iterable[Vector]) -> list[tuple[Label, float]]:
+        return [results[0] for results in self.search_identities(vectors, top_n=1)]
+
+    def search_identities(
+            self,
+            vectors: Iterable[Vector],
+            top_n: int = 1,
+    ) -> list[list[tuple[Label, float]]]:
+        """Returns the `top_n` most similar identities to each vector, most similar first."""
+
+        if not len(self):
+            raise ValueError("No vectors in the database.")
+
+        queries = normalize(vectors)
+
+        if self.aggregation == 'centroid':
+            return [self._search_centroids(query, top_n) for query in queries]
+
+        return [self._search_vectors(query, top_n) for query in queries]
+
+    def _search_centroids(self, query: np.ndarray, top_n: int) -> list[tuple[Label, float]]:
+        if self._identity_centroids is None:
+            self._identity_centroids = normalize(self._identity_sums[:len(self._identities)])
+
+        similarities = self._identity_centroids @ query
+        return self._top_identities(np.arange(len(similarities)), similarities, top_n)
+
+    def _search_vectors(self, query: np.ndarray, top_n: int) -> list[tuple[Label, float]]:
+        candidates = self._get_candidates(query)
+
+        if self._vector_identity_id_array is None:
+            self._vector_identity_id_array = np.array(self._vector_identity_ids, dtype=np.int64)
+
+        if candidates is None:
+            similarities = self._flat.vectors @ query
+            identity_ids = self._vector_identity_id_array
+        else:
+            similarities = self._flat.vectors[candidates] @ query
+            identity_ids = self._vector_identity_id_array[candidates]
+
+        if self.aggregation == 'max' or self.top_k == 1:
+            k = 1
+        elif self.aggregation == 'top_k_mean':
+            k = self.top_k
+        else:
+            raise ValueError(f'Invalid aggregation: {self.aggregation}')
+
+        # Group by identity, with the most similar vectors first in each group
+        order = np.lexsort((-similarities, identity_ids))
+        identity_ids, similarities = identity_ids[order], similarities[order]
+
+        group_starts = np.flatnonzero(np.r_[True, identity_ids[1:] != identity_ids[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, len(identity_ids)])
+        ranks = np.arange(len(identity_ids)) - np.repeat(group_starts, group_sizes)
+
+        top = ranks < k
+        sums = np.add.reduceat(np.where(top, similarities, 0.), group_starts)
+        means = sums / np.minimum(group_sizes, k)
+
+        return self._top_identities(identity_ids[group_starts], means, top_n)
+
+    def _get_candidates(self, query: np.ndarray) -> np.ndarray | None:
+        """Returns the indices of the vectors in the probed lists, or None to search all."""
+
+        if not self.is_trained or self.n_probe >= len(self._lists):
+            return None
+
+        centroid_similarities = self._centroids @ query
+        probe = np.argpartition(-centroid_similarities, self.n_probe - 1)[:self.n_probe]
+
+        candidates = np.concatenate([self._get_list_array(list_i) for list_i in probe])
+        return candidates if len(candidates) else None
+
+    def _top_identities(
+            self,
+            identity_ids: np.ndarray,
+            similarities: np.ndarray,
+            top_n: int,
+    ) -> list[tuple[Label, float]]:
+        if top_n < len(similarities):
+            top = np.argpartition(-similarities, top_n - 1)[:top_n]
+        else:
+            top = np.arange(len(similarities))
+
+        top = top[np.argsort(-similarities[top])]
+
+        return [
+            (self._identities[identity_ids[i]], float(similarities[i]))
+            for i in top
+        ]
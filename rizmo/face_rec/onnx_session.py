@@ -0,0 +1,111 @@
+import os
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal
+
+import onnxruntime as ort
+from rosy.utils import require
+
+OptimizationLevel = Literal['disable', 'basic', 'extended', 'all']
+
+OPTIMIZATION_LEVELS: dict[OptimizationLevel, ort.GraphOptimizationLevel] = {
+    'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+DEFAULT_PROVIDERS = ('CUDAExecutionProvider', 'CPUExecutionProvider')
+
+
+@dataclass
+class OnnxSessionConfig:
+    intra_op_threads: int = 0
+    """Threads used to run each operator. 0 lets ONNX Runtime decide."""
+
+    inter_op_threads: int = 0
+    """Threads used to run independent operators in parallel. 0 lets ONNX Runtime decide."""
+
+    optimization_level: OptimizationLevel = 'all'
+
+    optimized_model_dir: str | Path | None = None
+    """
+    If set, the optimized model is saved to this directory, and loaded
+    from it on subsequent startups instead of optimizing the model again.
+    """
+
+    providers: Sequence[str] | None = None
+    """Execution providers in order of preference. Defaults to CUDA if available, then CPU."""
+
+    cpu_mem_arena: bool = True
+    """
+    Whether to use a memory arena for CPU allocations. Disabling it uses less
+    memory when idle, at the cost of allocating on every run.
+    """
+
+    def get_providers(self) -> list[str]:
+        available = ort.get_available_providers()
+
+        if self.providers is None:
+            return [p for p in DEFAULT_PROVIDERS if p in available]
+
+        missing = [p for p in self.providers if p not in available]
+        require(not missing, f'ONNX Runtime providers not available: {missing}; available: {available}')
+
+        return list(self.providers)
+
+    def __str__(self) -> str:
+        return (
+            f'intra_op_threads={self.intra_op_threads} '
+            f'inter_op_threads={self.inter_op_threads} '
+            f'optimization_level={self.optimization_level} '
+            f'cpu_mem_arena={self.cpu_mem_arena}'
+        )
+
+
+def build_onnx_session(model_file: str | Path, config: OnnxSessionConfig = None) -> ort.InferenceSession:
+    """
+    Builds an ONNX Runtime inference session for the model with the given config.
+
+    If `config.optimized_model_dir` is set, the optimized model is cached there,
+    keyed by the model file name, optimization level and providers. The cache
+    is rebuilt if the model file is newer than it.
+    """
+
+    config = config or OnnxSessionConfig()
+    model_file = Path(model_file)
+    providers = config.get_providers()
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = config.intra_op_threads
+    options.inter_op_num_threads = config.inter_op_threads
+    options.execution_mode = (
+        ort.ExecutionMode.ORT_PARALLEL if config.inter_op_threads > 1
+        else ort.ExecutionMode.ORT_SEQUENTIAL
+    )
+    options.enable_cpu_mem_arena = config.cpu_mem_arena
+    options.graph_optimization_level = OPTIMIZATION_LEVELS[config.optimization_level]
+
+    if config.optimized_model_dir is None or config.optimization_level == 'disable':
+        return ort.InferenceSession(str(model_file), options, providers=providers)
+
+    cache_dir = Path(config.optimized_model_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    provider_names = '-'.join(p.removesuffix('ExecutionProvider').lower() for p in providers)
+    cache_file = cache_dir / f'{model_file.stem}.{config.optimization_level}.{provider_names}.onnx'
+
+    if cache_file.exists() and cache_file.stat().st_mtime >= model_file.stat().st_mtime:
+        # Already optimized
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        return ort.InferenceSession(str(cache_file), options, providers=providers)
+
+    # Written to a temp file first, so a crash can't leave a partial cache file
+    tmp_file = cache_file.with_suffix('.onnx.tmp')
+    options.optimized_model_filepath = str(tmp_file)
+    session = ort.InferenceSession(str(model_file), options, providers=providers)
+    os.replace(tmp_file, cache_file)
+
+    print(f'Saved optimized model to: {cache_file}')
+    return session
@@ -0,0 +1,153 @@
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from threading import Condition, Thread
+from typing import Any
+
+from rizmo.metrics import Histogram
+
+LATENCY_BOUNDS_MS = [5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+@dataclass
+class PipelineItem:
+    timestamp: float
+    """Time the item entered the pipeline, from `time.monotonic()`."""
+
+    value: Any
+
+
+class LatestQueue:
+    """
+    Bounded thread-safe queue that drops its oldest item when putting
+    to a full queue, so a slow consumer always gets the latest items
+    instead of falling further and further behind.
+
+    With `block`, putting to a full queue waits for room instead, e.g. for
+    a video file, where every frame should be processed.
+    """
+
+    def __init__(self, maxsize: int = 1, block: bool = False):
+        self.maxsize = maxsize
+        self.block = block
+        self.dropped = 0
+
+        self._items: deque[PipelineItem] = deque()
+        self._condition = Condition()
+        self._closed = False
+
+    def put(self, item: PipelineItem) -> None:
+        with self._condition:
+            if self.block:
+                self._condition.wait_for(lambda: len(self._items) < self.maxsize)
+            elif len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+
+            self._items.append(item)
+            self._condition.notify_all()
+
+    def get(self) -> PipelineItem | None:
+        """Waits for the next item. Returns None once the queue is closed and empty."""
+
+        with self._condition:
+            self._condition.wait_for(lambda: self._items or self._closed)
+            if not self._items:
+                return None
+
+            item = self._items.popleft()
+            self._condition.notify_all()
+            return item
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def reset(self) -> None:
+        self.dropped = 0
+
+
+class PipelineStage(Thread):
+    """
+    Runs `func` on each item of the input queue in its own thread,
+    and puts the results on the output queue.
+
+    A stage without an input queue is a source: `func` is called without
+    arguments, and the stage stops once it returns None. When a stage stops,
+    it closes its output queue, which stops the next stage once it has
+    processed the remaining items.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            func: Callable,
+            input_queue: LatestQueue = None,
+            output_queue: LatestQueue = None,
+    ):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+
+        self.run_times = Histogram(f'{name} run time', LATENCY_BOUNDS_MS, unit='ms')
+        """Time taken by `func` per item."""
+
+        self.latencies = Histogram(f'{name} latency', LATENCY_BOUNDS_MS, unit='ms')
+        """Time from an item entering the pipeline to it leaving this stage."""
+
+        self._t_reset = time.monotonic()
+
+    def run(self) -> None:
+        try:
+            while (item := self._next()) is not None:
+                if self.output_queue is not None:
+                    self.output_queue.put(item)
+        finally:
+            if self.output_queue is not None:
+                self.output_queue.close()
+
+    def _next(self) -> PipelineItem | None:
+        if self.input_queue is None:
+            t0 = time.monotonic()
+            value = self.func()
+            if value is None:
+                return None
+
+            item = PipelineItem(t0, value)
+        else:
+            item = self.input_queue.get()
+            if item is None:
+                return None
+
+            t0 = time.monotonic()
+            item = PipelineItem(item.timestamp, self.func(item.value))
+
+        t1 = time.monotonic()
+        self.run_times.add(1000 * (t1 - t0))
+        self.latencies.add(1000 * (t1 - item.timestamp))
+
+        return item
+
+    @property
+    def throughput(self) -> float:
+        """Items per second since the last reset."""
+        return self.run_times.count / (time.monotonic() - self._t_reset)
+
+    def reset(self) -> None:
+        self.run_times.reset()
+        self.latencies.reset()
+        self._t_reset = time.monotonic()
+
+        if self.input_queue is not None:
+            self.input_queue.reset()
+
+    def __str__(self) -> str:
+        dropped = f' dropped={self.input_queue.dropped}' if self.input_queue else ''
+        return (
+            f'{self.name}: {self.throughput:.1f}/s{dropped}\n'
+            f'  {self.run_times}\n'
+            f'  {self.latencies}'
+        )
@@ -0,0 +1,99 @@
+from typing import Iterable
+
+import numpy as np
+import torch
+from torch.nn.functional import normalize
+
+from rizmo.face_rec.vector_db import Label, Vector, VectorDatabase, top_labels
+
+
+class BruteForceCosineVectorDatabase(VectorDatabase):
+    """
+    Brute-force cosine similarity search using torch, e.g. with float16 on CUDA.
+
+    Storage is preallocated and grows by doubling, so adding vectors does not
+    copy the whole database every time.
+    """
+
+    def __init__(
+            self,
+            dtype: torch.dtype = None,
+            device: str = None,
+            initial_capacity: int = 64,
+    ):
+        self.dtype = dtype
+        self.device = device
+        self.initial_capacity = initial_capacity
+
+        self._vectors: torch.Tensor | None = None
+        self.labels: list[Label] = []
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @property
+    def vectors(self) -> torch.Tensor | None:
+        return None if self._vectors is None else self._vectors[:len(self)]
+
+    def add_all(self, items: Iterable[tuple[Vector, Label]]) -> None:
+        vectors, labels = zip(*items)
+
+        new_vectors = self._normalize(vectors)
+        start, end = len(self), len(self) + new_vectors.size(0)
+        self._reserve(end, new_vectors.size(1))
+
+        self._vectors[start:end] = new_vectors
+        self.labels.extend(labels)
+
+    def clear(self) -> None:
+        self._vectors = None
+        self.labels = []
+
+    def _reserve(self, size: int, dim: int) -> None:
+        capacity = 0 if self._vectors is None else self._vectors.size(0)
+        if size <= capacity:
+            return
+
+        capacity = max(size, 2 * capacity, self.initial_capacity)
+        vectors = torch.empty((capacity, dim), dtype=self.dtype, device=self.device)
+
+        if self._vectors is not None:
+            vectors[:len(self)] = self.vectors
+
+        self._vectors = vectors
+
+    def search(self, vectors: Iterable[Vector]) -> list[tuple[Label, float]]:
+        if self.vectors is None:
+            raise ValueError("No vectors in the database.")
+
+        similarities = self.get_similarities(vectors)
+
+        similarities, most_similar_indices = torch.max(similarities, dim=1)
+        similarities = similarities.cpu().numpy()
+        most_similar_indices = most_similar_indices.cpu().numpy()
+
+        return [
+            (self.labels[label_i], float(sim))
+            for label_i, sim in zip(most_similar_indices, similarities)
+        ]
+
+    def search_identities(
+            self,
+            vectors: Iterable[Vector],
+            top_n: int = 1,
+    ) -> list[list[tuple[Label, float]]]:
+        if self.vectors is None:
+            raise ValueError("No vectors in the database.")
+
+        similarities = self.get_similarities(vectors).float().cpu().numpy()
+        return [top_labels(sims, self.labels, top_n) for sims in similarities]
+
+    def get_similarities(self, vectors: Iterable[Vector]) -> torch.Tensor:
+        embeddings = self._normalize(vectors)
+        return embeddings @ self.vectors.T
+
+    def _normalize(self, vectors: Iterable[Vector]) -> torch.Tensor:
+        vectors = np.stack(list(vectors), axis=0)
+        vectors = torch.tensor(vectors, dtype=self.dtype, device=self.device)
+        normalize(vectors, dim=1, out=vectors)
+        return vectors
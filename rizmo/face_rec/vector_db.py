@@ -3,8 +3,7 @@ from collections.abc import Sized
 from typing import Any, Iterable
 
 import numpy as np
-import torch
-from torch.nn.functional import normalize
+from rosy.utils import require
 
 Label = Any
 Vector = np.ndarray
@@ -19,57 +18,194 @@ class VectorDatabase(Sized, ABC):
     def search(self, vectors: Iterable[Vector]) -> list[tuple[Label, float]]:
         ...
 
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Removes all the vectors. The storage is replaced, not modified,
+        so clearing a shallow copy of the database leaves the original intact.
+        """
+
+    def search_identities(
+            self,
+            vectors: Iterable[Vector],
+            top_n: int = 1,
+    ) -> list[list[tuple[Label, float]]]:
+        """
+        Returns up to `top_n` of the most similar labels to each vector,
+        most similar first. By default, only returns the single most similar.
+        """
+
+        return [[result] for result in self.search(vectors)]
+
+
+class NumpyCosineVectorDatabase(VectorDatabase):
+    """
+    Brute-force cosine similarity search using only NumPy, so it works
+    without torch, e.g. on CPU-only hosts.
+
+    Vectors are stored either as float32, or as int8 with a scale per vector,
+    which uses a quarter of the memory at a small cost in precision.
+    Storage is preallocated and grows by doubling, so adding vectors does not
+    copy the whole database every time.
+    """
 
-class BruteForceCosineVectorDatabase(VectorDatabase):
     def __init__(
             self,
-            dtype: torch.dtype = None,
-            device: str = None,
+            dtype: np.dtype = np.float32,
+            initial_capacity: int = 64,
+            chunk_size: int = 16384,
     ):
-        self.dtype = dtype
-        self.device = device
-
-        self.vectors: torch.Tensor | None = None
+        """
+        Args:
+            dtype: `np.float32` or `np.int8`.
+            initial_capacity: Number of vectors to allocate storage for
+                when the first vectors are added.
+            chunk_size: When using int8, the number of vectors to dequantize
+                at a time while searching.
+        """
+
+        self.dtype = np.dtype(dtype)
+        require(
+            self.dtype in (np.float32, np.int8),
+            f'dtype must be float32 or int8; got {self.dtype}',
+        )
+
+        self.initial_capacity = initial_capacity
+        self.chunk_size = chunk_size
+
+        self._vectors: np.ndarray | None = None
+        self._scales: np.ndarray | None = None
         self.labels: list[Label] = []
 
     def __len__(self) -> int:
         return len(self.labels)
 
+    @property
+    def vectors(self) -> np.ndarray | None:
+        return None if self._vectors is None else self._vectors[:len(self)]
+
+    @property
+    def scales(self) -> np.ndarray | None:
+        return None if self._scales is None else self._scales[:len(self)]
+
     def add_all(self, items: Iterable[tuple[Vector, Label]]) -> None:
         vectors, labels = zip(*items)
 
-        new_vectors = self._normalize(vectors)
+        new_vectors = normalize(vectors)
+        start, end = len(self), len(self) + len(new_vectors)
+        self._reserve(end, new_vectors.shape[1])
 
-        if self.vectors is None:
-            self.vectors = new_vectors
+        if self.dtype == np.int8:
+            scales = np.abs(new_vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.
+            self._vectors[start:end] = np.round(new_vectors / scales[:, None])
+            self._scales[start:end] = scales
         else:
-            self.vectors = torch.cat([self.vectors, new_vectors], dim=0)
+            self._vectors[start:end] = new_vectors
 
         self.labels.extend(labels)
 
-        assert self.vectors.size(0) == len(self.labels)
+    def clear(self) -> None:
+        self._vectors = None
+        self._scales = None
+        self.labels = []
+
+    def _reserve(self, size: int, dim: int) -> None:
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if size <= capacity:
+            return
+
+        capacity = max(size, 2 * capacity, self.initial_capacity)
+
+        vectors = np.empty((capacity, dim), dtype=self.dtype)
+        scales = np.empty(capacity, dtype=np.float32)
+
+        if self._vectors is not None:
+            vectors[:len(self)] = self.vectors
+            scales[:len(self)] = self.scales
+
+        self._vectors = vectors
+        self._scales = scales
 
     def search(self, vectors: Iterable[Vector]) -> list[tuple[Label, float]]:
-        if self.vectors is None:
+        if not len(self):
             raise ValueError("No vectors in the database.")
 
         similarities = self.get_similarities(vectors)
 
-        similarities, most_similar_indices = torch.max(similarities, dim=1)
-        similarities = similarities.cpu().numpy()
-        most_similar_indices = most_similar_indices.cpu().numpy()
+        most_similar_indices = similarities.argmax(axis=1)
+        similarities = similarities[np.arange(len(similarities)), most_similar_indices]
 
         return [
             (self.labels[label_i], float(sim))
             for label_i, sim in zip(most_similar_indices, similarities)
         ]
 
-    def get_similarities(self, vectors: Iterable[Vector]) -> torch.Tensor:
-        embeddings = self._normalize(vectors)
-        return embeddings @ self.vectors.T
+    def search_identities(
+            self,
+            vectors: Iterable[Vector],
+            top_n: int = 1,
+    ) -> list[list[tuple[Label, float]]]:
+        if not len(self):
+            raise ValueError("No vectors in the database.")
+
+        return [
+            top_labels(similarities, self.labels, top_n)
+            for similarities in self.get_similarities(vectors)
+        ]
+
+    def get_similarities(self, vectors: Iterable[Vector]) -> np.ndarray:
+        embeddings = normalize(vectors)
+
+        if self.dtype != np.int8:
+            # Faster than `embeddings @ self.vectors.T` for few embeddings
+            return (self.vectors @ embeddings.T).T
+
+        similarities = np.empty((len(embeddings), len(self)), dtype=np.float32)
+        for start in range(0, len(self), self.chunk_size):
+            end = min(start + self.chunk_size, len(self))
+            chunk = self._vectors[start:end].astype(np.float32)
+            similarities[:, start:end] = (chunk @ embeddings.T).T
+
+        similarities *= self.scales
+        return similarities
+
+
+def normalize(vectors: Iterable[Vector]) -> np.ndarray:
+    """Stacks the vectors into a float32 matrix, and L2-normalizes each row."""
+
+    vectors = np.stack(list(vectors), axis=0).astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.maximum(norms, 1e-12)
+    return vectors
+
+
+def top_labels(similarities: np.ndarray, labels: list[Label], top_n: int) -> list[tuple[Label, float]]:
+    """
+    Returns up to `top_n` distinct labels with the highest similarity,
+    and their similarity, most similar first.
+
+    Args:
+        similarities: Similarity of the query to each vector.
+        labels: Label of each vector.
+        top_n: Maximum number of labels to return.
+    """
+
+    n = len(similarities)
+
+    # Usually only a few vectors need to be sorted to find enough distinct labels
+    k = min(n, 4 * top_n)
+    while True:
+        top = np.argpartition(-similarities, k - 1)[:k] if k < n else np.arange(n)
+        top = top[np.argsort(-similarities[top], kind='stable')]
+
+        results = {}
+        for i in top:
+            results.setdefault(labels[i], float(similarities[i]))
+            if len(results) == top_n:
+                return list(results.items())
+
+        if k == n:
+            return list(results.items())
 
-    def _normalize(self, vectors: Iterable[Vector]) -> torch.Tensor:
-        vectors = np.stack(list(vectors), axis=0)
-        vectors = torch.tensor(vectors, dtype=self.dtype, device=self.device)
-        normalize(vectors, dim=1, out=vectors)
-        return vectors
+        k = min(n, 4 * k)
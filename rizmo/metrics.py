@@ -0,0 +1,125 @@
+import asyncio
+import sys
+from bisect import bisect_left
+from collections.abc import Sequence
+
+
+class Histogram:
+    """Counts how many values fall into each bucket, e.g. for reporting latencies."""
+
+    def __init__(self, name: str, bounds: Sequence[float], unit: str = ''):
+        """
+        Args:
+            name: Name of the measured value, used when printing.
+            bounds: Upper bounds (inclusive) of the buckets. Values greater
+                than the last bound are counted in a final overflow bucket.
+            unit: Unit of the values, used when printing.
+        """
+
+        self.name = name
+        self.bounds = sorted(bounds)
+        self.unit = unit
+
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.
+        self.max = float('-inf')
+
+    def add(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.
+
+    def reset(self) -> None:
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0.
+        self.max = float('-inf')
+
+    def __str__(self) -> str:
+        if not self.count:
+            return f'{self.name}: n=0'
+
+        buckets = [
+            f'<={bound:g}: {count}'
+            for bound, count in zip(self.bounds, self.counts)
+            if count
+        ]
+        if self.counts[-1]:
+            buckets.append(f'>{self.bounds[-1]:g}: {self.counts[-1]}')
+
+        return (
+            f'{self.name}: n={self.count} '
+            f'mean={self.mean:.3g}{self.unit} max={self.max:.3g}{self.unit}; '
+            + ', '.join(buckets)
+        )
+
+
+async def print_periodically(interval: float, *stats, reset: bool = True) -> None:
+    """
+    Prints the stats every `interval` seconds, forever.
+
+    Stats with a `reset()` method are reset after printing if `reset` is true,
+    so each report only covers the last interval.
+    """
+
+    while True:
+        await asyncio.sleep(interval)
+
+        for stat in stats:
+            print(stat)
+
+            if reset and hasattr(stat, 'reset'):
+                stat.reset()
+
+
+def get_memory_size(obj) -> int:
+    """
+    Returns the approximate memory size of the object and all objects it
+    references, in bytes, e.g. of a model cache.
+
+    NumPy arrays and PyTorch tensors count the size of their whole underlying
+    buffer, once, since views keep it alive. Classes and modules are skipped.
+    """
+
+    # Keeps the seen objects alive, so their IDs aren't reused
+    seen = {}
+    size = 0
+    stack = [obj]
+
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen[id(obj)] = obj
+
+        if hasattr(obj, 'untyped_storage'):
+            storage = obj.untyped_storage()
+            if ('storage', storage.data_ptr()) not in seen:
+                seen[('storage', storage.data_ptr())] = storage
+                size += storage.nbytes()
+            continue
+
+        if hasattr(obj, 'nbytes') and hasattr(obj, 'base'):
+            base = obj if obj.base is None else obj.base
+            if id(base) not in seen:
+                seen[id(base)] = base
+                size += getattr(base, 'nbytes', 0)
+            continue
+
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__') and not callable(obj):
+            stack.append(vars(obj))
+
+    return size
@@ -8,32 +8,39 @@ Followed instructions here:
 
 import asyncio
 import logging
-from argparse import Namespace
-from collections import deque
+from argparse import ArgumentParser, Namespace
 from collections.abc import Callable
-from dataclasses import dataclass, field
-from queue import Queue
 from threading import Thread
 
-import numpy as np
 import torch
 from rosy import Node, build_node_from_args
 from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, GenerationConfig, pipeline
 from voicebox.audio import Audio
 
+from rizmo.audio.transcription import (
+    PRE_BUFFER_DURATION_S,
+    LocalAgreement,
+    TranscriptionQueue,
+    TranscriptionRequest,
+    UtteranceCollector,
+    Word,
+)
+from rizmo.audio.trim import SpeechTrimmer
+from rizmo.audio.voice_segments import VoiceSegmentReceiver
+from rizmo.metrics import print_periodically
 from rizmo.node_args import get_rizmo_node_arg_parser
 from rizmo.nodes.topics import Topic
 from rizmo.signal import graceful_shutdown_on_sigterm
 
-PRE_BUFFER_DURATION_S = 1.
-"""How much previous audio to prepend to the audio buffer when voice is detected."""
-
 
 class ASR(Thread):
     def __init__(
             self,
             pipe,
             handle_transcript: Callable[[str], None],
+            handle_partial_transcript: Callable[[str], None] = None,
+            trimmer: SpeechTrimmer = None,
+            queue: TranscriptionQueue = None,
             name='ASR',
             daemon=True,
             **kwargs,
@@ -42,25 +49,51 @@ class ASR(Thread):
 
         self.pipe = pipe
         self.handle_transcript = handle_transcript
-        self.queue = Queue()
+        self.handle_partial_transcript = handle_partial_transcript
+        self.trimmer = trimmer
+        self.queue = queue if queue is not None else TranscriptionQueue()
+
+        self._agreement = LocalAgreement(utterance=-1)
 
     def run(self) -> None:
-        while (audio := self.queue.get()) is not None:
+        while (request := self.queue.get()) is not None:
             try:
-                self._handle_audio(audio)
+                self._handle_request(request)
             except Exception:
                 logging.exception('Error transcribing audio.')
-            finally:
-                self.queue.task_done()
-
-    def _handle_audio(self, audio: Audio) -> None:
-        sample = dict(
-            array=audio.signal.copy(),
-            sampling_rate=audio.sample_rate,
-        )
 
+    def _handle_request(self, request: TranscriptionRequest) -> None:
+        if request.utterance != self._agreement.utterance:
+            self._agreement = LocalAgreement(request.utterance)
+
+        # Only the audio after the committed words needs transcribing
+        audio = request.audio
+        start = round(self._agreement.committed_time * audio.sample_rate)
+        audio = Audio(audio.signal[start:], audio.sample_rate)
+
+        if request.final:
+            # Trimmed only when final, since the word times of the partial
+            # transcriptions must be relative to the committed time.
+            # The tail after committed words is never rejected, since the
+            # utterance is known to be speech.
+            speech = self.trimmer(
+                audio,
+                noise=max(0, request.pre_roll - start),
+                reject=not self._agreement.committed_text,
+            ) if self.trimmer else audio
+
+            if speech is None:
+                print('[No speech]')
+                return
+
+            self.handle_transcript(self._agreement.finalize(self._transcribe(speech)))
+        elif self.handle_partial_transcript:
+            partial_transcript = self._agreement.update(self._transcribe_words(audio))
+            self.handle_partial_transcript(partial_transcript)
+
+    def _transcribe(self, audio: Audio) -> str:
         result = self.pipe(
-            sample,
+            self._get_sample(audio),
             generate_kwargs={
                 'generation_config': GenerationConfig(
                     max_new_tokens=self._get_max_new_tokens(audio.len_seconds),
@@ -70,9 +103,31 @@ class ASR(Thread):
             },
         )
 
-        transcript = result['text'].strip()
+        return result['text'].strip()
+
+    def _transcribe_words(self, audio: Audio) -> list[Word]:
+        # The model's own generation config is kept, since it has the
+        # alignment heads needed for word timestamps.
+        result = self.pipe(
+            self._get_sample(audio),
+            return_timestamps='word',
+            generate_kwargs={
+                'max_new_tokens': self._get_max_new_tokens(audio.len_seconds),
+                'language': 'english',
+            },
+        )
+
+        return [
+            Word(chunk['text'], chunk['timestamp'][1])
+            for chunk in result['chunks']
+            if chunk['timestamp'][1] is not None
+        ]
 
-        self.handle_transcript(transcript)
+    def _get_sample(self, audio: Audio) -> dict:
+        return dict(
+            array=audio.signal.copy(),
+            sampling_rate=audio.sample_rate,
+        )
 
     def _get_max_new_tokens(
             self,
@@ -92,27 +147,15 @@ class ASR(Thread):
         return min(max(min_tokens, token_limit), max_tokens)
 
     def stop(self):
-        self.queue.put(None)
+        self.queue.stop()
 
 
-class MaxDurationAudioBuffer:
-    def __init__(self, max_duration: float):
-        self.max_duration = max_duration
-        self._buffer = deque()
-
-    def __iter__(self):
-        return iter(self._buffer)
-
-    def append(self, audio: Audio) -> None:
-        self._buffer.append(audio)
-
-        duration = sum(a.len_seconds for a in self._buffer)
-        while duration > self.max_duration:
-            removed_audio = self._buffer.popleft()
-            duration -= removed_audio.len_seconds
-
-
-def build_asr_thread(handle_transcript: Callable[[str], None]):
+def build_asr_thread(
+        handle_transcript: Callable[[str], None],
+        handle_partial_transcript: Callable[[str], None] = None,
+        trimmer: SpeechTrimmer = None,
+        queue: TranscriptionQueue = None,
+):
     device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
     print(f'Device: {device}')
 
@@ -138,7 +181,7 @@ def build_asr_thread(handle_transcript: Callable[[str], None]):
         dtype=dtype,
     )
 
-    asr = ASR(pipe, handle_transcript)
+    asr = ASR(pipe, handle_transcript, handle_partial_transcript, trimmer, queue)
     asr.start()
     return asr
 
@@ -152,6 +195,7 @@ async def main(args: Namespace):
 
 async def _main(args: Namespace, node: Node):
     transcript_topic = node.get_topic(Topic.TRANSCRIPT)
+    partial_transcript_topic = node.get_topic(Topic.PARTIAL_TRANSCRIPT)
 
     loop = asyncio.get_event_loop()
 
@@ -163,58 +207,47 @@ async def _main(args: Namespace, node: Node):
             loop,
         ).result()
 
-    asr = build_asr_thread(handle_transcript)
+    def handle_partial_transcript(partial_transcript: str) -> None:
+        print(f'... {partial_transcript!r}')
 
-    @dataclass
-    class State:
-        most_recent_audios: list[Audio] = field(
-            default_factory=lambda: MaxDurationAudioBuffer(max_duration=PRE_BUFFER_DURATION_S),
-        )
-        audio_buffer: list[Audio] = field(default_factory=list)
-        self_speaking: bool = False
+        asyncio.run_coroutine_threadsafe(
+            partial_transcript_topic.send(partial_transcript),
+            loop,
+        ).result()
+
+    trimmer = None if args.no_trim else SpeechTrimmer()
+    queue = TranscriptionQueue(args.max_queue, args.max_age, args.merge_duration)
+    asr = build_asr_thread(handle_transcript, handle_partial_transcript, trimmer, queue)
 
-    state = State()
+    collector = UtteranceCollector(args.min_duration, partial_interval=args.partial_interval)
 
     async def handle_voice_detected(topic, data):
         audio, _, voice_detected = data
 
-        state.most_recent_audios.append(audio)
-        audio_buffer = state.audio_buffer
-
-        # Do not transcribe while speaking
-        if state.self_speaking:
-            if audio_buffer:
-                print('[Speaking; ASR disabled]')
-                audio_buffer.clear()
-
-            return
-
-        if voice_detected:
-            if not audio_buffer:
-                print('Transcribing... ')
-                audio_buffer.extend(state.most_recent_audios)
-            else:
-                audio_buffer.append(audio)
-            return
-
-        if audio_buffer:
-            full_audio_data = np.concatenate([a.signal for a in audio_buffer]).flatten()
-            sample_rate = audio_buffer[0].sample_rate
-            audio_buffer.clear()
-
-            full_audio = Audio(full_audio_data, sample_rate)
-
-            if full_audio.len_seconds >= args.min_duration:
-                asr.queue.put(full_audio)
-            else:
-                print('[Too short]')
+        request = collector.add(audio, voice_detected)
+        if request is not None:
+            asr.queue.put(request)
 
     async def handle_speaking(topic, speaking: bool) -> None:
-        state.self_speaking = speaking
+        collector.self_speaking = speaking
+
+    if args.voice_segments:
+        receiver = VoiceSegmentReceiver(handle_voice_detected, pre_roll=PRE_BUFFER_DURATION_S)
+        await node.listen(Topic.AUDIO, receiver.handle_audio)
+        await node.listen(Topic.VOICE_SEGMENT, receiver.handle_event)
+    else:
+        await node.listen(Topic.VOICE_DETECTED, handle_voice_detected)
 
-    await node.listen(Topic.VOICE_DETECTED, handle_voice_detected)
     await node.listen(Topic.SPEAKING, handle_speaking)
 
+    if args.stats_interval > 0:
+        stats_task = asyncio.create_task(print_periodically(
+            args.stats_interval,
+            queue,
+            queue.wait_times,
+            *([trimmer] if trimmer else []),
+        ))
+
     try:
         await node.forever()
     except KeyboardInterrupt:
@@ -223,6 +256,33 @@ async def _main(args: Namespace, node: Node):
         asr.stop()
 
 
+def add_queue_args(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        '--max-queue',
+        type=int,
+        default=4,
+        help='Maximum number of utterances waiting to be transcribed; '
+             'the oldest are dropped. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--max-age',
+        type=float,
+        default=10.,
+        help='Utterances waiting longer than this to be transcribed, in seconds, '
+             'are dropped. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--merge-duration',
+        type=float,
+        default=10.,
+        help='Utterances waiting to be transcribed are merged into one '
+             'transcription of up to this many seconds. 0 to disable. '
+             'Default: %(default)s',
+    )
+
+
 def parse_args() -> Namespace:
     parser = get_rizmo_node_arg_parser(__file__)
 
@@ -233,6 +293,40 @@ def parse_args() -> Namespace:
         help='Minimum duration of audio, in seconds, to transcribe. Default: %(default)s',
     )
 
+    parser.add_argument(
+        '--partial-interval',
+        type=float,
+        default=0.,
+        help='While voice continues, transcribe the utterance so far this often, '
+             'in seconds, and publish partial transcripts. The words that two '
+             'partial transcripts agree on are not transcribed again, so the '
+             'final transcript is ready sooner. 0 to disable. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--voice-segments',
+        action='store_true',
+        help='Get voice from voice segment events and the audio topic, '
+             'for a VAD run with --voice-segments.',
+    )
+
+    parser.add_argument(
+        '--no-trim',
+        action='store_true',
+        help='Transcribe utterances as they are, instead of trimming the '
+             'silence at their edges, and rejecting those with too little speech.',
+    )
+
+    add_queue_args(parser)
+
+    parser.add_argument(
+        '--stats-interval',
+        type=float,
+        default=60.,
+        help='How often to print stats, e.g. of the ASR queue, and rejected '
+             'utterances, in seconds. 0 to disable. Default: %(default)s',
+    )
+
     return parser.parse_args()
 
 
@@ -0,0 +1,114 @@
+"""
+Measures the latency of audio messages, from the capture of their first
+sample in the mic node, to their arrival here on the `AUDIO` topic, and
+after VAD on the `VOICE_DETECTED` topic.
+
+Messages lost between the mic and here are counted from gaps in the
+sequence numbers of the audio messages.
+
+"Voice onset" is the latency of the first `VOICE_DETECTED` message of each
+utterance, i.e. how long it takes for the start of speech to be detected.
+With `--voice-segments` VADs, it is the latency of the voice start events
+on the `VOICE_SEGMENT` topic, and "VAD latency" is of all events.
+
+The mic node timestamps audio with its wall-clock time, so the clocks of
+the hosts must be synchronized, e.g. with NTP.
+"""
+
+import asyncio
+import logging
+import time
+from argparse import Namespace
+from dataclasses import dataclass
+
+from rosy import Node, build_node_from_args
+
+from rizmo.metrics import Histogram, print_periodically
+from rizmo.node_args import get_rizmo_node_arg_parser
+from rizmo.nodes.topics import Topic
+from rizmo.signal import graceful_shutdown_on_sigterm
+
+LATENCY_BOUNDS_MS = [10, 20, 50, 100, 200, 300, 500, 1000, 2000]
+
+
+async def main(args: Namespace) -> None:
+    logging.basicConfig(level=args.log)
+
+    async with await build_node_from_args(args=args) as node:
+        await _main(args, node)
+
+
+async def _main(args: Namespace, node: Node) -> None:
+    audio_latencies = Histogram('Audio latency', LATENCY_BOUNDS_MS, unit='ms')
+    vad_latencies = Histogram('VAD latency', LATENCY_BOUNDS_MS, unit='ms')
+    onset_latencies = Histogram('Voice onset latency', LATENCY_BOUNDS_MS, unit='ms')
+
+    @dataclass
+    class LostMessages:
+        count: int = 0
+        last_sequence: int | None = None
+
+        def __str__(self) -> str:
+            return f'Lost audio messages: {self.count}'
+
+    lost = LostMessages()
+    voice_detected = False
+
+    async def handle_audio(topic, data) -> None:
+        audio, timestamp = data
+        audio_latencies.add(1000 * (time.time() - timestamp))
+
+        # The sequence restarts from 0 when the mic node restarts
+        if lost.last_sequence is not None and audio.sequence > lost.last_sequence:
+            lost.count += audio.sequence - lost.last_sequence - 1
+        lost.last_sequence = audio.sequence
+
+    async def handle_voice_detected(topic, data) -> None:
+        nonlocal voice_detected
+
+        audio, timestamp, voice_detected_ = data
+        latency = 1000 * (time.time() - timestamp)
+
+        vad_latencies.add(latency)
+        if voice_detected_ and not voice_detected:
+            onset_latencies.add(latency)
+
+        voice_detected = voice_detected_
+
+    async def handle_voice_segment(topic, event) -> None:
+        latency = 1000 * (time.time() - event.timestamp)
+
+        vad_latencies.add(latency)
+        if event.voice_detected:
+            onset_latencies.add(latency)
+
+    await node.listen(Topic.AUDIO, handle_audio)
+    await node.listen(Topic.VOICE_DETECTED, handle_voice_detected)
+    await node.listen(Topic.VOICE_SEGMENT, handle_voice_segment)
+
+    await print_periodically(
+        args.interval,
+        audio_latencies,
+        vad_latencies,
+        onset_latencies,
+        lost,
+        reset=False,
+    )
+
+
+def parse_args() -> Namespace:
+    parser = get_rizmo_node_arg_parser(__file__)
+
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=10.,
+        help='How often to print the latencies, in seconds. Default: %(default)s',
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    graceful_shutdown_on_sigterm()
+    asyncio.run(main(parse_args()))
@@ -8,9 +8,16 @@ from itertools import groupby
 import numpy as np
 from rosy import build_node_from_args
 
-from rizmo.asyncio import bind
-from rizmo.face_rec.face_finder import build_face_finder
+from rizmo.asyncio import OrderedTasks, bind
+from rizmo.face_rec.batcher import FaceFinderBatcher
+from rizmo.face_rec.embedding_index import EmbeddingIndex
+from rizmo.face_rec.face_finder import CascadeFaceFinder, build_face_finder
+from rizmo.face_rec.face_quality import FaceQualityGate
+from rizmo.face_rec.face_tracker import FaceTrack, FaceTrackCache
 from rizmo.face_rec.image_store import MultiImagePerNameFileStore, Name
+from rizmo.face_rec.onnx_session import OnnxSessionConfig
+from rizmo.image_codec import JpegImageCodec
+from rizmo.metrics import print_periodically
 from rizmo.node_args import get_rizmo_node_arg_parser
 from rizmo.nodes.messages import FaceDetections, FaceRecognition, FaceRecognitions
 from rizmo.nodes.services import Service
@@ -18,6 +25,7 @@ from rizmo.nodes.topics import Topic
 from rizmo.signal import graceful_shutdown_on_sigterm
 
 FACE_STORE_ROOT: str = './var/faces'
+FACE_EMBEDDINGS_ROOT: str = './var/face_embeddings'
 
 logger = logging.getLogger(__name__)
 
@@ -36,21 +44,113 @@ async def _main(args: Namespace, node) -> None:
 
     state = State()
 
-    face_finder = build_face_finder(
-        embedding_model=args.embedding_model,
+    face_finder_kwargs = dict(
         face_db_device=args.face_db_device,
+        face_db_dtype=args.face_db_dtype,
+        face_db_backend=args.face_db_backend,
+        face_db_index=args.face_db_index,
+        face_db_probes=args.face_db_probes,
+        face_db_aggregation=args.face_db_aggregation,
         min_similarity=args.min_similarity,
+        session_config=OnnxSessionConfig(
+            intra_op_threads=args.onnx_intra_op_threads,
+            inter_op_threads=args.onnx_inter_op_threads,
+            optimization_level=args.onnx_optimization_level,
+            optimized_model_dir=args.onnx_optimized_model_dir,
+            providers=args.onnx_providers,
+            cpu_mem_arena=not args.onnx_disable_cpu_mem_arena,
+        ),
     )
 
-    face_store = MultiImagePerNameFileStore(
-        FACE_STORE_ROOT,
-        file_type='bmp',
+    if args.embedding_model == 'cascade':
+        face_finder = CascadeFaceFinder(
+            fast=build_face_finder('w600k_mbf', **face_finder_kwargs),
+            accurate=build_face_finder('w600k_r50', **face_finder_kwargs),
+            margin=args.cascade_margin,
+            min_gap=args.cascade_min_gap,
+        )
+
+        # The first model's embeddings are used to curate the face store
+        model_finders = {
+            'w600k_r50': face_finder.accurate,
+            'w600k_mbf': face_finder.fast,
+        }
+    else:
+        face_finder = build_face_finder(args.embedding_model, **face_finder_kwargs)
+        model_finders = {args.embedding_model: face_finder}
+
+    def build_face_store(model_name: str, curate: bool) -> MultiImagePerNameFileStore:
+        return MultiImagePerNameFileStore(
+            FACE_STORE_ROOT,
+            file_type='png',
+            embedding_index=EmbeddingIndex(
+                FACE_EMBEDDINGS_ROOT,
+                model_name=model_name,
+            ),
+            legacy_file_types=('bmp',),
+            duplicate_similarity=args.duplicate_similarity if curate else None,
+            max_images_per_name=args.max_images_per_name if curate else None,
+        )
+
+    # One store per model, over the same images, each with its own embedding index
+    face_stores = {
+        model_name: build_face_store(model_name, curate=i == 0)
+        for i, model_name in enumerate(model_finders)
+    }
+    face_store = next(iter(face_stores.values()))
+    embedder = next(iter(model_finders.values()))
+
+    def load_face_embeddings() -> None:
+        for model_name, finder in model_finders.items():
+            finder.set_face_embeddings(face_stores[model_name].get_all_embeddings(finder.get_embeddings))
+
+    load_face_embeddings()
+
+    batcher = FaceFinderBatcher(
+        face_finder,
+        max_batch_size=args.max_batch_size,
+        max_delay=args.max_batch_delay_ms / 1000,
+    )
+    batcher.start()
+
+    face_tracks = FaceTrackCache(
+        min_iou=args.track_min_iou,
+        recheck_interval=args.track_recheck_interval,
+        min_confidence=args.track_min_confidence,
+        votes=args.track_votes,
+    )
+
+    quality_gate = FaceQualityGate(
+        min_size=args.min_face_size,
+        min_sharpness=args.min_face_sharpness,
+        min_brightness=args.min_face_brightness,
+        max_brightness=args.max_face_brightness,
     )
 
-    face_finder.add_faces(face_store.get_all())
+    if args.stats_interval > 0:
+        stats = [batcher.batch_sizes, batcher.latencies, face_tracks, quality_gate]
+        if isinstance(face_finder, CascadeFaceFinder):
+            stats.append(face_finder)
+
+        stats_task = asyncio.create_task(print_periodically(args.stats_interval, *stats))
+
+    # Keep references to pending tasks so they aren't garbage collected
+    pending_tasks = set()
+
+    # Recognitions are sent in the order of their detections, even if those
+    # of an earlier message take longer than those of a later one
+    face_rec_sends = OrderedTasks()
+
+    codec = JpegImageCodec()
+
+    def decode_face_imgs(face_detections: FaceDetections) -> list[np.ndarray]:
+        return [
+            codec.decode(face.image) if isinstance(face.image, bytes) else face.image
+            for face in face_detections.faces
+        ]
 
     async def handle_faces_detected(topic, face_detections: FaceDetections) -> None:
-        face_imgs = [face.image for face in face_detections.faces]
+        face_imgs = decode_face_imgs(face_detections)
 
         if state.save_face and len(face_imgs) == 1:
             face_name, future = state.save_face
@@ -58,13 +158,66 @@ async def _main(args: Namespace, node) -> None:
 
             face_img = face_imgs[0]
 
-            await bind(future, save_face(face_img, face_name))
+            # Saved in a thread, so recognition isn't held up by embedding,
+            # writing the image, and maybe reloading the face databases
+            task = asyncio.create_task(bind(future, save_face(face_img, face_name)))
+            pending_tasks.add(task)
+            task.add_done_callback(pending_tasks.discard)
+
+        timestamp = face_detections.timestamp
+        tracks = face_tracks.update([face.box for face in face_detections.faces], timestamp)
+
+        # Only recognize faces that are new or uncertain
+        to_recognize = [
+            (track, face_img, face)
+            for track, face_img, face in zip(tracks, face_imgs, face_detections.faces)
+            if face_tracks.needs_recognition(track, timestamp)
+        ]
 
-        face_recs = await asyncio.to_thread(
-            face_finder.find_faces,
-            face_imgs,
+        # Low quality faces are deferred until a better frame of them arrives
+        if to_recognize:
+            passed = quality_gate.check(
+                [face_img for _, face_img, _ in to_recognize],
+                sizes=[min(face.box.width, face.box.height) for _, _, face in to_recognize],
+            )
+
+            to_recognize = [
+                (track, face_img)
+                for (track, face_img, _), passed_ in zip(to_recognize, passed)
+                if passed_
+            ]
+
+        if to_recognize:
+            # Don't wait for the results here, so faces from the next messages
+            # can be batched together with these ones.
+            face_recs = await batcher.submit([face_img for _, face_img in to_recognize])
+
+            recognize_task = asyncio.create_task(
+                update_tracks([track for track, _ in to_recognize], face_recs, timestamp)
+            )
+            for track, _ in to_recognize:
+                track.pending = recognize_task
+
+        face_rec_sends.add(
+            asyncio.gather(*{track.pending for track in tracks if track.pending}),
+            lambda _: send_face_recs(face_detections, tracks),
         )
 
+    async def update_tracks(
+            tracks: list[FaceTrack],
+            face_recs: asyncio.Future[list[tuple[str | None, float]]],
+            timestamp: float,
+    ) -> None:
+        try:
+            for track, face_rec in zip(tracks, await face_recs):
+                face_tracks.add_recognition(track, face_rec, timestamp)
+        finally:
+            for track in tracks:
+                track.pending = None
+
+    async def send_face_recs(face_detections: FaceDetections, tracks: list[FaceTrack]) -> None:
+        face_recs = [track.identity for track in tracks]
+
         # The same name may occur multiple times; take the highest similarity
         face_recs = [
             max(group)
@@ -88,10 +241,33 @@ async def _main(args: Namespace, node) -> None:
 
         await faces_recognized_topic.send(face_recs)
 
+    # Face store changes are made one at a time
+    store_lock = asyncio.Lock()
+
     async def save_face(face_img: np.ndarray, face_name: str) -> str:
+        async with store_lock:
+            return await asyncio.to_thread(save_face_sync, face_img, face_name)
+
+    def save_face_sync(face_img: np.ndarray, face_name: str) -> str:
         print(f'Saving face image of size {face_img.shape} with name: {face_name}')
-        face_store.add(face_img, face_name)
-        face_finder.add_face(face_img, face_name)
+        embedding = embedder.get_embeddings([face_img])[0]
+
+        result = face_store.add(face_img, face_name, embedding)
+        if result.duplicate:
+            return 'duplicate; face is too similar to an existing image'
+
+        if result.deleted:
+            # Deleted images must stop matching too, so reload from the stores
+            load_face_embeddings()
+        else:
+            # Other models' embedding indexes catch up on the next startup
+            for finder in model_finders.values():
+                finder_embedding = embedding if finder is embedder else finder.get_embeddings([face_img])[0]
+                finder.add_face_embeddings([(finder_embedding, face_name)])
+
+        if not result.kept:
+            return 'not kept; face is less diverse than the existing images'
+
         return 'success'
 
     async def handle_face_command(service, action: str, **kwargs):
@@ -105,6 +281,14 @@ async def _main(args: Namespace, node) -> None:
             names = face_store.get_names()
             return sorted(names)
 
+        elif action == 'curate':
+            async with store_lock:
+                deleted = await asyncio.to_thread(face_store.curate, embedder.get_embeddings)
+                if deleted:
+                    await asyncio.to_thread(load_face_embeddings)
+
+            return f'deleted {deleted} images'
+
         else:
             raise ValueError(f'Invalid action: {action}')
 
@@ -112,7 +296,10 @@ async def _main(args: Namespace, node) -> None:
     await node.add_service(Service.FACE_COMMAND, handle_face_command)
     await node.listen(Topic.FACES_DETECTED, handle_faces_detected)
 
-    await node.forever()
+    try:
+        await node.forever()
+    finally:
+        await batcher.stop()
 
 
 def parse_args() -> Namespace:
@@ -121,8 +308,71 @@ def parse_args() -> Namespace:
     parser.add_argument(
         '--embedding-model',
         default='w600k_r50',
-        choices=('w600k_r50', 'w600k_mbf'),
-        help='Face embedding model to use for face recognition. Default: %(default)s',
+        choices=('w600k_r50', 'w600k_mbf', 'cascade'),
+        help='Face embedding model to use for face recognition. "cascade" uses '
+             '"w600k_mbf" first, and "w600k_r50" only for faces whose result '
+             'is ambiguous. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--cascade-margin',
+        type=float,
+        default=0.05,
+        help='With the "cascade" model, faces whose similarity is within this '
+             'of --min-similarity are re-recognized with the accurate model. '
+             'Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--cascade-min-gap',
+        type=float,
+        default=0.05,
+        help='With the "cascade" model, faces whose second most similar identity '
+             'is within this of the most similar are re-recognized with the '
+             'accurate model. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--onnx-intra-op-threads',
+        type=int,
+        default=0,
+        help='Number of threads ONNX Runtime uses to run each operator of the '
+             'face embedding model. 0 lets ONNX Runtime decide. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--onnx-inter-op-threads',
+        type=int,
+        default=0,
+        help='Number of threads ONNX Runtime uses to run independent operators '
+             'in parallel. 0 lets ONNX Runtime decide. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--onnx-optimization-level',
+        default='all',
+        choices=('disable', 'basic', 'extended', 'all'),
+        help='ONNX Runtime graph optimization level. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--onnx-optimized-model-dir',
+        help='If given, e.g. "./var/onnx_cache", the optimized face embedding '
+             'model is cached in this directory, so later startups are faster.',
+    )
+
+    parser.add_argument(
+        '--onnx-providers',
+        nargs='+',
+        help='ONNX Runtime execution providers to use, in order of preference, '
+             'e.g. "CPUExecutionProvider". Defaults to CUDA if available, then CPU.',
+    )
+
+    parser.add_argument(
+        '--onnx-disable-cpu-mem-arena',
+        action='store_true',
+        help='Disable the ONNX Runtime CPU memory arena, which uses less memory '
+             'when idle, but allocates memory on every run.',
     )
 
     parser.add_argument(
@@ -134,6 +384,49 @@ def parse_args() -> Namespace:
              'Default: %(default)s',
     )
 
+    parser.add_argument(
+        '--face-db-dtype',
+        default='auto',
+        choices=('auto', 'float32', 'float16', 'int8'),
+        help='Data type of the face database vectors. "auto" will use "float16" '
+             'on CUDA, and "float32" on CPU. "int8" is only supported on CPU. '
+             'Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--face-db-backend',
+        default='auto',
+        choices=('auto', 'torch', 'numpy'),
+        help='Implementation of the face database. "numpy" only supports CPU, '
+             'but does not need torch. "auto" will use "torch" if it is installed, '
+             'unless the dtype is "int8". Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--face-db-index',
+        default='brute_force',
+        choices=('brute_force', 'ivf'),
+        help='Face database search index. "ivf" is an approximate index for '
+             'large galleries, and always runs on CPU with NumPy. '
+             'Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--face-db-probes',
+        type=int,
+        default=8,
+        help='Number of clusters to search with the "ivf" index. '
+             'More is slower but more accurate. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--face-db-aggregation',
+        default='max',
+        choices=('max', 'top_k_mean', 'centroid'),
+        help='How the "ivf" index scores each identity from its face samples. '
+             'Default: %(default)s',
+    )
+
     parser.add_argument(
         '--min-similarity',
         type=float,
@@ -141,6 +434,112 @@ def parse_args() -> Namespace:
         help='Minimum similarity threshold for face recognition. Default: %(default)s',
     )
 
+    parser.add_argument(
+        '--duplicate-similarity',
+        type=float,
+        default=0.95,
+        help='Added faces are rejected if their similarity to an existing '
+             'image of the name is at least this. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--max-images-per-name',
+        type=int,
+        default=20,
+        help='Maximum number of face images to keep per name; the most '
+             'diverse are kept. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--max-batch-size',
+        type=int,
+        default=16,
+        help='Faces from consecutive messages are embedded together in batches '
+             'of up to this many faces. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--max-batch-delay-ms',
+        type=float,
+        default=5.,
+        help='Maximum time to wait for more faces to fill a batch, '
+             'in milliseconds. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--stats-interval',
+        type=float,
+        default=60.,
+        help='How often to print face recognition stats, in seconds. '
+             '0 to disable. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--min-face-size',
+        type=int,
+        default=24,
+        help='Faces smaller than this many pixels wide or high are not '
+             'recognized. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--min-face-sharpness',
+        type=float,
+        default=15.,
+        help='Faces with a Laplacian variance less than this are too blurry '
+             'to be recognized. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--min-face-brightness',
+        type=float,
+        default=30.,
+        help='Faces with a mean gray level (0-255) less than this are not '
+             'recognized. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--max-face-brightness',
+        type=float,
+        default=230.,
+        help='Faces with a mean gray level (0-255) greater than this are not '
+             'recognized. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--track-min-iou',
+        type=float,
+        default=0.3,
+        help='Minimum IoU between face boxes in consecutive frames for them '
+             'to be considered the same face. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--track-recheck-interval',
+        type=float,
+        default=2.,
+        help='Tracked faces are recognized again at least this often, in seconds. '
+             '0 to recognize every face in every frame. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--track-min-confidence',
+        type=float,
+        default=0.25,
+        help='Tracked faces are recognized again once their confidence decays '
+             'below this. Should be below --min-similarity, or faces matched '
+             'just above it are recognized again on every frame. '
+             'Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--track-votes',
+        type=int,
+        default=5,
+        help='Number of recent recognitions of a tracked face to vote over '
+             'for its identity. Default: %(default)s',
+    )
+
     return parser.parse_args()
 
 
@@ -104,7 +104,9 @@ class FaceDetections:
 
 @dataclass
 class FaceDetection:
-    image: np.ndarray
+    image: np.ndarray | bytes
+    """Face image crop; either a BGR image, or JPEG-encoded bytes."""
+
     confidence: float
     box: Box
 
@@ -1,17 +1,24 @@
 import asyncio
 import logging
-from abc import abstractmethod
+import time
 from argparse import Namespace
-from collections.abc import Callable
+from collections import deque
 from threading import Thread
 from typing import Optional
 
 import numpy as np
 import sounddevice as sd
 from rosy import build_node_from_args
-from voicebox.audio import Audio
 
+from rizmo.audio.aggregator import FrameAggregator
+from rizmo.audio.codec import EncodedAudio
+from rizmo.audio.filter import build_band_filter
+from rizmo.audio.processing import FixedGain, Gain, Gate, Limiter, LimitedMaxPowerGainControl, ProcessingChain
+from rizmo.audio.ring_buffer import BlockRingBuffer
+from rizmo.audio.vad import build_vad
+from rizmo.audio.voice_segments import VoiceSegmentEvent
 from rizmo.config import config
+from rizmo.metrics import Histogram, print_periodically
 from rizmo.node_args import get_rizmo_node_arg_parser
 from rizmo.nodes.topics import Topic
 from rizmo.signal import graceful_shutdown_on_sigterm
@@ -21,57 +28,6 @@ CONFERENCE_MIC = 'eMeet M0: USB Audio'
 DEFAULT_MIC = CONFERENCE_MIC
 
 
-class GainControl:
-    @abstractmethod
-    def get_gain(self, indata: np.ndarray, sample_rate: int) -> float:
-        ...
-
-
-class FixedGain(GainControl):
-    def __init__(self, gain: float = 1.):
-        self.gain = gain
-
-    def get_gain(self, indata: np.ndarray, sample_rate: int) -> float:
-        return self.gain
-
-
-class LimitedMaxPowerGainControl(GainControl):
-    """
-    Increases the gain exponentially until the max power of the signal
-    reaches the target power.
-    """
-
-    def __init__(
-            self,
-            target_power: float = 1.,
-            max_gain: float = 100.,
-            alpha: float = 2.,
-    ):
-        self.target_power = target_power
-        self.max_gain = max_gain
-        self.alpha = alpha
-
-        self._dt = 0.
-
-    def get_gain(self, indata: np.ndarray, sample_rate: int) -> float:
-        samples = indata.shape[0]
-        self._dt += samples / sample_rate
-
-        # Calculate max_exp instead of limiting gain post-calc to avoid overflows
-        max_exp = np.log2(self.max_gain + 1)
-        exp = min(self.alpha * self._dt, max_exp)
-        gain = 2 ** exp - 1
-
-        power = np.abs(indata).max()
-
-        gained_power = gain * power
-        if gained_power > self.target_power:
-            gain = self.target_power / (power + 1e-6)
-            self._dt = np.log2(gain + 1) / self.alpha
-
-        return gain
-
-
 class Microphone(Thread):
     def __init__(
             self,
@@ -92,10 +48,15 @@ class Microphone(Thread):
         self.device = device
         self.channels = channels
 
+        # Counted instead of printed, to keep the callback fast
+        self.input_overflows = 0
+        self.input_underflows = 0
+
     def run(self) -> None:
         def input_stream_callback(indata: np.ndarray, frames: int, timestamp, status):
             if status:
-                print(f"Warning: {status}", flush=True)
+                self.input_overflows += status.input_overflow
+                self.input_underflows += status.input_underflow
 
             self.block_handler(indata, frames, timestamp, status)
 
@@ -109,44 +70,11 @@ class Microphone(Thread):
             while True:
                 sd.sleep(1000)
 
-
-class Gate:
-    def __init__(
-            self,
-            threshold: float,
-            attack: float,
-            signal_transform: Callable[[np.ndarray, int], np.ndarray],
-            debug: bool = False,
-    ):
-        self.threshold = threshold
-        self.attack = attack
-        self.signal_transform = signal_transform
-        self.debug = debug
-
-        self._gate_closed_time = 0.
-
-    def __call__(self, signal: np.ndarray, sample_rate: int) -> np.ndarray:
-        input_power = np.abs(signal).max()
-
-        transformed_signal = self.signal_transform(signal, sample_rate)
-
-        if input_power >= self.threshold:
-            if self.debug:
-                print(f'Gate open; threshold={self.threshold}')
-
-            self._gate_closed_time = 0.
-        else:
-            samples = signal.shape[0]
-            self._gate_closed_time += samples / sample_rate
-
-            gain = 1. / (2 ** (self._gate_closed_time * self.attack))
-
-            if self.debug:
-                print(f'Gate closed; threshold={self.threshold}; gain={gain}')
-
-            transformed_signal *= gain
-
-        return transformed_signal
+    def __str__(self) -> str:
+        return (
+            f'Microphone: input_overflows={self.input_overflows} '
+            f'input_underflows={self.input_underflows}'
+        )
 
 
 async def main(
@@ -161,37 +89,132 @@ async def main(
 
 async def _main(args: Namespace, node, channels: int) -> None:
     audio_topic = node.get_topic(Topic.AUDIO)
+    voice_detected_topic = node.get_topic(Topic.VOICE_DETECTED)
+    voice_segment_topic = node.get_topic(Topic.VOICE_SEGMENT)
 
     loop = asyncio.get_event_loop()
 
-    gain_control = LimitedMaxPowerGainControl()
     if args.gain == 'auto':
         gain_control = LimitedMaxPowerGainControl()
     else:
         gain = float(args.gain)
         gain_control = FixedGain(gain)
 
-    limiter = lambda signal: np.clip(signal, -1, 1)
-
-    def signal_transform(signal, sample_rate_):
-        return limiter(signal * gain_control.get_gain(signal, args.sample_rate))
-
-    gate = Gate(
-        threshold=0.,  # Disabled
-        # threshold=0.001,  # Built-in webcam mic
-        # threshold=0.02,  # USB webcam mic
-        attack=16.,
-        signal_transform=signal_transform,
+    band_filter = build_band_filter(args.sample_rate, args.highpass, args.lowpass, channels=channels)
+
+    process_block = ProcessingChain([
+        *([band_filter] if band_filter else []),
+        Gain(gain_control),
+        Limiter(),
+        Gate(
+            threshold=0.,  # Disabled
+            # threshold=0.001,  # Built-in webcam mic
+            # threshold=0.02,  # USB webcam mic
+            attack=16.,
+        ),
+    ])
+
+    ring_buffer = BlockRingBuffer(args.ring_size, args.block_size, channels)
+    block_ready = asyncio.Event()
+
+    latencies = Histogram('Mic latency', [5, 10, 20, 50, 100, 200, 500, 1000], unit='ms')
+    """Time from the mic callback to the block being sent."""
+
+    aggregator = FrameAggregator(
+        args.block_size,
+        args.blocks_per_message,
+        channels,
+        onset_ratio=args.onset_ratio or None,
     )
 
     def mic_callback(indata: np.ndarray, frames: int, timestamp, status):
-        indata = gate(indata, args.sample_rate)
-        audio = Audio(indata, args.sample_rate)
+        # Runs on the PortAudio thread, so it must not block;
+        # the blocks are processed and sent by `send_blocks`.
+
+        # Wall-clock time of the first sample, so latency can be measured by other nodes
+        capture_time = time.time() - (timestamp.currentTime - timestamp.inputBufferAdcTime)
+
+        if ring_buffer.write(indata, capture_time):
+            loop.call_soon_threadsafe(block_ready.set)
+
+    vad = build_vad(args.vad) if args.vad != 'none' else None
+    voice_detected = False
+
+    pre_roll = deque()
+    """Most recent messages without voice, sent when voice is detected."""
+
+    pre_roll_messages = round(args.pre_roll * args.sample_rate / (args.block_size * args.blocks_per_message))
+
+    sequence = 0
+
+    async def send_audio(indata: np.ndarray, capture_time: float, voice_detected_: bool = None) -> None:
+        """Sends the audio, and if `voice_detected_` is given, the VAD result for it."""
+
+        nonlocal sequence
+
+        audio = EncodedAudio.encode(indata, args.sample_rate, sequence, args.encoding)
+        sequence += 1
+
+        await audio_topic.send((audio, capture_time))
+
+        if voice_detected_ is None:
+            pass
+        elif not args.voice_segments:
+            await voice_detected_topic.send((audio, capture_time, voice_detected_))
+        elif voice_detected_ != voice_detected:
+            offset = 0 if voice_detected_ else len(audio)
+            await voice_segment_topic.send(VoiceSegmentEvent(voice_detected_, audio.sequence, offset, capture_time))
+
+    async def send_voice(indata: np.ndarray, capture_time: float, voice_detected_: bool) -> None:
+        """Sends the message only while voice is detected, preceded by the pre-roll."""
+
+        nonlocal voice_detected
 
-        asyncio.run_coroutine_threadsafe(
-            audio_topic.send((audio, timestamp.inputBufferAdcTime)),
-            loop,
-        ).result()
+        if voice_detected_:
+            if not voice_detected:
+                print('Voice detected: True')
+
+            while pre_roll:
+                await send_audio(*pre_roll.popleft(), voice_detected_=False)
+
+            await send_audio(indata, capture_time, voice_detected_=True)
+        elif voice_detected:
+            print('Voice detected: False')
+
+            # Send the end of the voice, so receivers know it ended
+            await send_audio(indata, capture_time, voice_detected_=False)
+        elif pre_roll_messages:
+            pre_roll.append((indata, capture_time))
+            if len(pre_roll) > pre_roll_messages:
+                pre_roll.popleft()
+
+        voice_detected = voice_detected_
+
+    async def send_blocks() -> None:
+        while True:
+            await block_ready.wait()
+            block_ready.clear()
+
+            for block in ring_buffer.read_all():
+                message = aggregator.add(block.signal, block.timestamp)
+                if message is None:
+                    continue
+
+                indata, capture_time = message
+
+                # Detect voice before the gain changes the level of the noise
+                voice_detected_ = vad.detect(indata, args.sample_rate) if vad else None
+
+                indata = process_block(indata, args.sample_rate)
+
+                if vad is None:
+                    await send_audio(indata, capture_time)
+                else:
+                    await send_voice(indata, capture_time, voice_detected_)
+
+                latencies.add(1000 * (time.monotonic() - block.write_time))
+
+    send_task = asyncio.create_task(send_blocks())
 
     if args.device is None:
         device = None
@@ -215,6 +238,14 @@ async def _main(args: Namespace, node, channels: int) -> None:
     )
     mic.start()
 
+    if args.stats_interval > 0:
+        stats_task = asyncio.create_task(print_periodically(
+            args.stats_interval,
+            mic,
+            ring_buffer,
+            latencies,
+        ))
+
     await node.forever()
 
 
@@ -243,7 +274,92 @@ def parse_args() -> Namespace:
         '--block-size', '-b',
         type=int,
         default=config.mic_block_size,
-        help='The block size of the microphone samples. Default: %(default)s',
+        help='The number of samples per block captured from the microphone. '
+             'Small blocks, e.g. 10-30 ms worth, have the lowest latency. '
+             'Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--blocks-per-message',
+        type=int,
+        default=config.mic_blocks_per_message,
+        help='Number of captured blocks sent per audio message. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--onset-ratio',
+        type=float,
+        default=4.,
+        help='A block whose peak is this many times the noise floor, e.g. the '
+             'start of speech, is sent immediately with any blocks before it, '
+             'instead of waiting for the rest of the message. 0 to disable. '
+             'Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--highpass',
+        type=float,
+        default=0.,
+        help='Filter out frequencies below this, in Hz, e.g. to remove rumble. '
+             '0 to disable. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--lowpass',
+        type=float,
+        default=0.,
+        help='Filter out frequencies above this, in Hz, e.g. to remove motor '
+             'noise. 0 to disable. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--vad',
+        default='none',
+        choices=('none', 'energy'),
+        help='Voice activity detector to run inline. If set, audio is only sent '
+             'while voice is detected, with the pre-roll before it, and is also '
+             'sent on the voice detected topic, so the VAD node is not needed. '
+             'Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--voice-segments',
+        action='store_true',
+        help='With --vad, send voice segment events when voice starts and stops, '
+             'instead of sending the audio again on the voice detected topic.',
+    )
+
+    parser.add_argument(
+        '--pre-roll',
+        type=float,
+        default=1.,
+        help='With --vad, how much audio from before voice is detected to send '
+             'with it, in seconds. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--encoding',
+        default='pcm16',
+        choices=('float32', 'pcm16', 'mulaw', 'lossless'),
+        help='Wire format of the audio messages. "pcm16" is half the size of '
+             '"float32"; "lossless" compresses "pcm16" further; "mulaw" is a '
+             'quarter of the size of "float32", but lossy. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--ring-size',
+        type=int,
+        default=64,
+        help='Number of blocks buffered between the mic callback and sending. '
+             'Blocks are dropped if it is full. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--stats-interval',
+        type=float,
+        default=60.,
+        help='How often to print mic stats, in seconds. 0 to disable. '
+             'Default: %(default)s',
     )
 
     parser.add_argument(
@@ -159,6 +159,9 @@ async def _main(node, stdscr):
         audio, timestamp, voice_detected = data
         screen.addstr(7, f'Voice detected: {voice_detected}')
 
+    async def handle_voice_segment(topic, event) -> None:
+        screen.addstr(7, f'Voice detected: {event.voice_detected}')
+
     async def handle_transcript(topic, data) -> None:
         screen.addstr(8, f'Transcript: {data!r}')
 
@@ -173,6 +176,7 @@ async def _main(node, stdscr):
     await node.listen(Topic.TRACKING, handle_tracking)
     await node.listen(Topic.AUDIO, handle_audio)
     await node.listen(Topic.VOICE_DETECTED, handle_voice_detected)
+    await node.listen(Topic.VOICE_SEGMENT, handle_voice_segment)
     await node.listen(Topic.TRANSCRIPT, handle_transcript)
     await node.listen(Topic.SAY, handle_say)
 
@@ -12,6 +12,7 @@ from PIL import Image as PILImage
 from rosy import build_node_from_args
 
 from rizmo.config import IS_RIZMO
+from rizmo.face_rec.face_crop import extract_aligned_face
 from rizmo.image_codec import JpegImageCodec
 from rizmo.node_args import get_rizmo_node_arg_parser
 from rizmo.nodes.messages import FaceDetection, FaceDetections
@@ -173,10 +174,10 @@ async def main(args: Namespace):
     logging.basicConfig(level=args.log)
 
     async with await build_node_from_args(args=args) as node:
-        await _main(node)
+        await _main(args, node)
 
 
-async def _main(node) -> None:
+async def _main(args: Namespace, node) -> None:
     obj_det_topic = node.get_topic(Topic.OBJECTS_DETECTED)
     faces_detected_topic = node.get_topic(Topic.FACES_DETECTED)
 
@@ -201,6 +202,7 @@ async def _main(node) -> None:
         )
 
     codec = JpegImageCodec()
+    face_codec = JpegImageCodec(quality=args.face_jpeg_quality)
 
     @obj_det_topic.depends_on_listener()
     async def handle_image_raw(topic, data):
@@ -235,19 +237,34 @@ async def _main(node) -> None:
         if not faces or not await faces_detected_topic.has_listeners():
             return
 
-        face_imgs = (extract_image_fragment(image, face.box) for face in faces)
+        if args.aligned_faces:
+            faces = await asyncio.to_thread(get_aligned_faces, image, faces)
+        else:
+            faces = [
+                FaceDetection(
+                    extract_image_fragment(image, face.box),
+                    confidence=face.confidence,
+                    box=face.box,
+                ) for face in faces
+            ]
 
-        faces = [
+        faces = FaceDetections(timestamp, image_size, faces)
+        await faces_detected_topic.send(faces)
+
+    def get_aligned_faces(image: np.ndarray, faces: list[Detection]) -> list[FaceDetection]:
+        return [
             FaceDetection(
-                face_img,
+                face_codec.encode(extract_aligned_face(
+                    image,
+                    face.box,
+                    size=args.aligned_face_size,
+                    margin=args.face_margin,
+                )),
                 confidence=face.confidence,
                 box=face.box,
-            ) for face, face_img in zip(faces, face_imgs)
+            ) for face in faces
         ]
 
-        faces = FaceDetections(timestamp, image_size, faces)
-        await faces_detected_topic.send(faces)
-
     def extract_image_fragment(
             image: np.ndarray,
             box: Box,
@@ -274,6 +291,36 @@ async def _main(node) -> None:
 
 def parse_args() -> Namespace:
     parser = get_rizmo_node_arg_parser(__file__)
+
+    parser.add_argument(
+        '--aligned-faces',
+        action='store_true',
+        help='Send face crops that are already square, padded, and resized '
+             'for the face embedding model, as JPEG bytes.',
+    )
+
+    parser.add_argument(
+        '--aligned-face-size',
+        type=int,
+        default=112,
+        help='Width and height of aligned face crops. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--face-margin',
+        type=float,
+        default=0.,
+        help='Fraction of the face box size to add around each side of '
+             'aligned face crops. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--face-jpeg-quality',
+        type=int,
+        default=90,
+        help='JPEG quality of aligned face crops. Default: %(default)s. Range: 0-100',
+    )
+
     return parser.parse_args()
 
 
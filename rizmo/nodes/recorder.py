@@ -3,11 +3,12 @@ import logging
 import wave
 from argparse import Namespace
 
-import numpy as np
 from rosy import build_node_from_args
 from rosy.utils import require
-from voicebox.audio import Audio
 
+from rizmo.audio.codec import EncodedAudio, encode_pcm16
+from rizmo.audio.filter import build_band_filter
+from rizmo.audio.voice_segments import VoiceSegmentReceiver
 from rizmo.config import config
 from rizmo.node_args import get_rizmo_node_arg_parser
 from rizmo.nodes.topics import Topic
@@ -22,8 +23,10 @@ async def main(args: Namespace) -> None:
 
 
 async def _main(args: Namespace, node) -> None:
+    band_filter = build_band_filter(args.sample_rate, args.highpass, args.lowpass)
+
     async def handle_audio(topic, data) -> None:
-        audio: Audio = data[0]
+        audio: EncodedAudio = data[0]
         await save_audio(audio)
 
     async def handle_voice_detected(topic, data) -> None:
@@ -31,7 +34,7 @@ async def _main(args: Namespace, node) -> None:
         if voice_detected:
             await save_audio(audio)
 
-    async def save_audio(audio: Audio) -> None:
+    async def save_audio(audio: EncodedAudio) -> None:
         require(
             audio.sample_rate == args.sample_rate,
             f'Expected sample rate {args.sample_rate}, got {audio.sample_rate}',
@@ -39,9 +42,10 @@ async def _main(args: Namespace, node) -> None:
 
         print('.', end='', flush=True)
 
-        wav_data = audio.signal * 32767
-        wav_data = wav_data.astype(np.int16)
-        wav_file.writeframes(wav_data.tobytes())
+        if band_filter:
+            wav_file.writeframes(encode_pcm16(band_filter(audio.signal)))
+        else:
+            wav_file.writeframes(audio.to_pcm16_bytes())
 
     print(f'Writing audio to {str(args.file_name)!r}...')
     with wave.open(args.file_name, 'wb') as wav_file:
@@ -49,7 +53,11 @@ async def _main(args: Namespace, node) -> None:
         wav_file.setsampwidth(2)
         wav_file.setframerate(args.sample_rate)
 
-        if args.voice_only:
+        if args.voice_only and args.voice_segments:
+            receiver = VoiceSegmentReceiver(handle_voice_detected, pre_roll=0.)
+            await node.listen(Topic.AUDIO, receiver.handle_audio)
+            await node.listen(Topic.VOICE_SEGMENT, receiver.handle_event)
+        elif args.voice_only:
             await node.listen(Topic.VOICE_DETECTED, handle_voice_detected)
         else:
             await node.listen(Topic.AUDIO, handle_audio)
@@ -79,6 +87,27 @@ def parse_args() -> Namespace:
         help='Only record audio when voice is detected.',
     )
 
+    parser.add_argument(
+        '--voice-segments',
+        action='store_true',
+        help='With --voice-only, get voice from voice segment events and the '
+             'audio topic, for a VAD run with --voice-segments.',
+    )
+
+    parser.add_argument(
+        '--highpass',
+        type=float,
+        default=0.,
+        help='Filter out frequencies below this, in Hz. 0 to disable. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--lowpass',
+        type=float,
+        default=0.,
+        help='Filter out frequencies above this, in Hz. 0 to disable. Default: %(default)s',
+    )
+
     return parser.parse_args()
 
 
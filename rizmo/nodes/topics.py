@@ -9,9 +9,11 @@ class Topic:
     NEW_IMAGE_COMPRESSED = 'new_image_compressed'
     NEW_IMAGE_RAW = 'new_image_raw'
     OBJECTS_DETECTED = 'objects_detected'
+    PARTIAL_TRANSCRIPT = 'partial_transcript'
     SAY = 'say'
     SERVO_COMMAND = 'servo_command'
     SPEAKING = 'speaking'
     TRACKING = 'tracking'
     TRANSCRIPT = 'transcript'
     VOICE_DETECTED = 'voice_detected'
+    VOICE_SEGMENT = 'voice_segment'
@@ -1,21 +1,31 @@
 """
 Voice Activity Detection (VAD) node.
 
-Setup:
-- `pip install funasr modelscope torchaudio`
+Backends:
+- "fsmn": The `funasr` `fsmn-vad` model, on the GPU.
+  Setup: `pip install funasr modelscope torchaudio`
+- "energy": A lightweight energy and spectral flux detector, on the CPU.
+  It can also run inline in the mic node, with `mic --vad energy`.
+
+By default, every audio message is republished on the `VOICE_DETECTED`
+topic. With `--voice-segments`, only compact `VoiceSegmentEvent`s are
+published on the `VOICE_SEGMENT` topic when voice starts and stops, and
+consumers combine them with the `AUDIO` messages they receive themselves,
+so the audio is only sent once.
 """
 
 import asyncio
 import logging
 from argparse import Namespace
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 
 import numpy as np
-from funasr import AutoModel
 from rosy import build_node_from_args
-from voicebox.audio import Audio as VoiceboxAudio
-from voicebox.effects import Filter
 
+from rizmo.audio.filter import StreamingSosFilter
+from rizmo.audio.vad import build_vad
+from rizmo.audio.voice_segments import VoiceSegmentEvent
+from rizmo.metrics import print_periodically
 from rizmo.node_args import get_rizmo_node_arg_parser
 from rizmo.nodes.topics import Topic
 from rizmo.signal import graceful_shutdown_on_sigterm
@@ -25,70 +35,82 @@ async def main(args: Namespace) -> None:
     logging.basicConfig(level=args.log)
 
     async with await build_node_from_args(args=args) as node:
-        await _main(node)
+        await _main(args, node)
 
 
-async def _main(node) -> None:
-    voice_detected_topic = node.get_topic(Topic.VOICE_DETECTED)
+async def _main(args: Namespace, node) -> None:
+    output_topic = node.get_topic(Topic.VOICE_SEGMENT if args.voice_segments else Topic.VOICE_DETECTED)
 
-    vad_model = AutoModel(
-        model='fsmn-vad',
-        device='cuda',
-    )
+    vad = build_vad(args.backend)
 
     @dataclass
     class State:
-        model_cache: dict = field(default_factory=dict)
         voice_detected: bool = False
+        motor_noise_filter: StreamingSosFilter | None = None
+        sample_rate: int | None = None
 
     state = State()
 
-    motor_noise_filter = Filter.build('lowpass', freq=3000, order=6)
-
     def filter_motor_noise(signal_: np.ndarray, sample_rate: int) -> np.ndarray:
-        return motor_noise_filter(VoiceboxAudio(signal_, sample_rate)).signal
+        if sample_rate != state.sample_rate:
+            state.motor_noise_filter = StreamingSosFilter.build('lowpass', 3000, sample_rate, order=6)
+            state.sample_rate = sample_rate
 
-    @voice_detected_topic.depends_on_listener()
+        # The signal was decoded just for this node, and only the encoded
+        # audio is forwarded, so it can be filtered in place.
+        return state.motor_noise_filter(signal_, out=signal_)
+
+    @output_topic.depends_on_listener()
     async def handle_audio(topic, data):
         audio, timestamp = data
-        block_size = audio.signal.shape[0]
-        indata = audio.signal.squeeze()
-        chunk_size_ms = int(round(1000 * block_size / audio.sample_rate))
-
-        indata = filter_motor_noise(indata, audio.sample_rate)
-
-        res = await asyncio.to_thread(
-            vad_model.generate,
-            input=indata,
-            cache=state.model_cache,
-            is_final=False,
-            chunk_size=chunk_size_ms,
-        )
-
-        voice_detected = state.voice_detected
-        for detection in res[0]['value']:
-            if detection[0] != -1:
-                voice_detected = True
-            elif detection[1] != -1:
-                voice_detected = False
-
-        if voice_detected != state.voice_detected:
+
+        indata = filter_motor_noise(audio.signal, audio.sample_rate)
+
+        voice_detected = await asyncio.to_thread(vad.detect, indata, audio.sample_rate)
+
+        voice_changed = voice_detected != state.voice_detected
+        if voice_changed:
             print('Voice detected:', voice_detected)
             state.voice_detected = voice_detected
 
-            # Elements of cache['stats'] seem to grow without bound;
-            # clear it so it will be re-initialized and memory freed.
-            if not voice_detected:
-                state.model_cache.clear()
-
-        await voice_detected_topic.send((audio, timestamp, voice_detected))
+        if not args.voice_segments:
+            await output_topic.send((audio, timestamp, voice_detected))
+        elif voice_changed:
+            offset = 0 if voice_detected else len(audio)
+            await output_topic.send(VoiceSegmentEvent(voice_detected, audio.sequence, offset, timestamp))
 
     await node.listen(Topic.AUDIO, handle_audio)
+
+    if args.stats_interval > 0:
+        stats_task = asyncio.create_task(print_periodically(args.stats_interval, vad))
+
     await node.forever()
 
 
 def parse_args() -> Namespace:
     parser = get_rizmo_node_arg_parser(__file__)
+
+    parser.add_argument(
+        '--backend',
+        default='fsmn',
+        choices=('fsmn', 'energy'),
+        help='VAD to use. "fsmn" needs a GPU; "energy" runs anywhere. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--voice-segments',
+        action='store_true',
+        help='Publish voice segment events instead of republishing the audio.',
+    )
+
+    parser.add_argument(
+        '--stats-interval',
+        type=float,
+        default=60.,
+        help='How often to print VAD stats, e.g. the size of the model cache, '
+             'in seconds. 0 to disable. Default: %(default)s',
+    )
+
     return parser.parse_args()
 
 
@@ -0,0 +1,186 @@
+"""
+Voice Activity Detection (VAD) and Automatic Speech Recognition (ASR) node.
+
+Runs the `vad` and `asr` nodes in one process, so the audio of each
+utterance is handed straight from the VAD to the ASR thread, instead of
+every message being sent from one node to the other over the mesh.
+Run it instead of both, on the same host, e.g. potato.
+
+It still publishes `VOICE_DETECTED` (or `VOICE_SEGMENT`, with
+`--voice-segments`) for other nodes, which costs nothing while no node
+is listening, and `TRANSCRIPT`, and `PARTIAL_TRANSCRIPT` with
+`--partial-interval`.
+"""
+
+import asyncio
+import logging
+from argparse import Namespace
+from dataclasses import dataclass
+
+import numpy as np
+from rosy import Node, build_node_from_args
+
+from rizmo.audio.filter import StreamingSosFilter
+from rizmo.audio.transcription import TranscriptionQueue, UtteranceCollector
+from rizmo.audio.trim import SpeechTrimmer
+from rizmo.audio.vad import build_vad
+from rizmo.audio.voice_segments import VoiceSegmentEvent
+from rizmo.metrics import print_periodically
+from rizmo.node_args import get_rizmo_node_arg_parser
+from rizmo.nodes.asr import add_queue_args, build_asr_thread
+from rizmo.nodes.topics import Topic
+from rizmo.signal import graceful_shutdown_on_sigterm
+
+
+async def main(args: Namespace):
+    logging.basicConfig(level=args.log)
+
+    async with await build_node_from_args(args=args) as node:
+        await _main(args, node)
+
+
+async def _main(args: Namespace, node: Node):
+    voice_topic = node.get_topic(Topic.VOICE_SEGMENT if args.voice_segments else Topic.VOICE_DETECTED)
+    transcript_topic = node.get_topic(Topic.TRANSCRIPT)
+    partial_transcript_topic = node.get_topic(Topic.PARTIAL_TRANSCRIPT)
+
+    loop = asyncio.get_event_loop()
+
+    def handle_transcript(transcript: str) -> None:
+        print(repr(transcript))
+
+        asyncio.run_coroutine_threadsafe(
+            transcript_topic.send(transcript),
+            loop,
+        ).result()
+
+    def handle_partial_transcript(partial_transcript: str) -> None:
+        print(f'... {partial_transcript!r}')
+
+        asyncio.run_coroutine_threadsafe(
+            partial_transcript_topic.send(partial_transcript),
+            loop,
+        ).result()
+
+    trimmer = None if args.no_trim else SpeechTrimmer()
+    queue = TranscriptionQueue(args.max_queue, args.max_age, args.merge_duration)
+    asr = build_asr_thread(handle_transcript, handle_partial_transcript, trimmer, queue)
+    vad = build_vad(args.backend)
+    collector = UtteranceCollector(args.min_duration, partial_interval=args.partial_interval)
+
+    @dataclass
+    class State:
+        voice_detected: bool = False
+        motor_noise_filter: StreamingSosFilter | None = None
+        sample_rate: int | None = None
+
+    state = State()
+
+    def filter_motor_noise(signal_: np.ndarray, sample_rate: int) -> np.ndarray:
+        if sample_rate != state.sample_rate:
+            state.motor_noise_filter = StreamingSosFilter.build('lowpass', 3000, sample_rate, order=6)
+            state.sample_rate = sample_rate
+
+        # Not in place, unlike in the VAD node, since the decoded signal is
+        # also what the ASR transcribes
+        return state.motor_noise_filter(signal_)
+
+    async def handle_audio(topic, data):
+        audio, timestamp = data
+
+        indata = filter_motor_noise(audio.signal, audio.sample_rate)
+        voice_detected = await asyncio.to_thread(vad.detect, indata, audio.sample_rate)
+
+        voice_changed = voice_detected != state.voice_detected
+        if voice_changed:
+            print('Voice detected:', voice_detected)
+            state.voice_detected = voice_detected
+
+        request = collector.add(audio, voice_detected)
+        if request is not None:
+            asr.queue.put(request)
+
+        if not args.voice_segments:
+            await voice_topic.send((audio, timestamp, voice_detected))
+        elif voice_changed:
+            offset = 0 if voice_detected else len(audio)
+            await voice_topic.send(VoiceSegmentEvent(voice_detected, audio.sequence, offset, timestamp))
+
+    async def handle_speaking(topic, speaking: bool) -> None:
+        collector.self_speaking = speaking
+
+    await node.listen(Topic.AUDIO, handle_audio)
+    await node.listen(Topic.SPEAKING, handle_speaking)
+
+    if args.stats_interval > 0:
+        stats_task = asyncio.create_task(print_periodically(
+            args.stats_interval,
+            vad,
+            queue,
+            queue.wait_times,
+            *([trimmer] if trimmer else []),
+        ))
+
+    try:
+        await node.forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        asr.stop()
+
+
+def parse_args() -> Namespace:
+    parser = get_rizmo_node_arg_parser(__file__)
+
+    parser.add_argument(
+        '--backend',
+        default='fsmn',
+        choices=('fsmn', 'energy'),
+        help='VAD to use. "fsmn" needs a GPU; "energy" runs anywhere. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--min-duration',
+        type=float,
+        default=1.5,
+        help='Minimum duration of audio, in seconds, to transcribe. Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--partial-interval',
+        type=float,
+        default=0.,
+        help='While voice continues, transcribe the utterance so far this often, '
+             'in seconds, and publish partial transcripts. 0 to disable. '
+             'Default: %(default)s',
+    )
+
+    parser.add_argument(
+        '--voice-segments',
+        action='store_true',
+        help='Publish voice segment events instead of republishing the audio.',
+    )
+
+    parser.add_argument(
+        '--no-trim',
+        action='store_true',
+        help='Transcribe utterances as they are, instead of trimming the '
+             'silence at their edges, and rejecting those with too little speech.',
+    )
+
+    add_queue_args(parser)
+
+    parser.add_argument(
+        '--stats-interval',
+        type=float,
+        default=60.,
+        help='How often to print stats, e.g. the size of the VAD model cache, '
+             'and of the ASR queue, in seconds. 0 to disable. Default: %(default)s',
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    graceful_shutdown_on_sigterm()
+    asyncio.run(main(parse_args()))
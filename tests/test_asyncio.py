@@ -0,0 +1,53 @@
+import asyncio
+
+from rizmo.asyncio import OrderedTasks
+
+
+def test_finished_in_order_added():
+    async def run() -> tuple[list[int], list[int]]:
+        tasks = OrderedTasks()
+        ready, sent = [], []
+
+        async def recognize(message: int, delay: float) -> int:
+            await asyncio.sleep(delay)
+            ready.append(message)
+            return message
+
+        async def send(message: int) -> None:
+            sent.append(message)
+
+        # The recognition of the first message finishes after the second is ready
+        tasks.add(recognize(1, delay=0.05), send)
+        last = tasks.add(recognize(2, delay=0.), send)
+
+        await last
+        return ready, sent
+
+    ready, sent = asyncio.run(run())
+
+    assert ready == [2, 1]
+    assert sent == [1, 2]
+
+
+def test_failed_task_does_not_block_the_next():
+    async def run() -> list[int]:
+        tasks = OrderedTasks()
+        sent = []
+
+        async def fail() -> int:
+            await asyncio.sleep(0.01)
+            raise RuntimeError('Recognition failed')
+
+        async def ready() -> int:
+            return 2
+
+        async def send(message: int) -> None:
+            sent.append(message)
+
+        first = tasks.add(fail(), send)
+        await tasks.add(ready(), send)
+
+        assert isinstance(first.exception(), RuntimeError)
+        return sent
+
+    assert asyncio.run(run()) == [2]
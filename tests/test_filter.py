@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from scipy.signal import sosfilt
+
+from rizmo.audio.filter import StreamingSosFilter
+
+SAMPLE_RATE = 16000
+
+
+def _signal(samples: int, channels: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((samples, channels)).astype(np.float32)
+
+
+def _filter() -> StreamingSosFilter:
+    return StreamingSosFilter.build('bandpass', (100, 3000), SAMPLE_RATE, order=6, channels=2)
+
+
+@pytest.mark.parametrize('block_size', [1, 320, 1600, 4096])
+@pytest.mark.parametrize('in_place', [False, True])
+def test_streaming_matches_whole_signal(block_size: int, in_place: bool):
+    filter_ = _filter()
+    signal = _signal(3 * 4096, channels=2)
+    expected = sosfilt(filter_.sos.astype(np.float64), signal, axis=0)
+
+    blocks = [signal[i:i + block_size].copy() for i in range(0, len(signal), block_size)]
+    filtered = np.concatenate([
+        filter_(block, out=block) if in_place else filter_(block).copy()
+        for block in blocks
+    ])
+
+    np.testing.assert_allclose(filtered, expected, atol=1e-4)
+
+
+def test_mono_block_shape_is_kept():
+    filter_ = StreamingSosFilter.build('lowpass', 3000, SAMPLE_RATE, order=6)
+    signal = _signal(1600, channels=1).reshape(-1)
+    expected = sosfilt(filter_.sos.astype(np.float64), signal)
+
+    filtered = np.concatenate([filter_(signal[:800]).copy(), filter_(signal[800:]).copy()])
+
+    assert filtered.shape == signal.shape
+    np.testing.assert_allclose(filtered, expected, atol=1e-4)
+
+
+def test_reset_clears_state():
+    filter_ = _filter()
+    signal = _signal(1600, channels=2)
+
+    first = filter_(signal).copy()
+    filter_.reset()
+    second = filter_(signal).copy()
+
+    np.testing.assert_array_equal(first, second)
@@ -0,0 +1,253 @@
+import time
+
+import numpy as np
+import pytest
+from voicebox.audio import Audio
+
+from rizmo.audio.codec import EncodedAudio
+from rizmo.audio.transcription import (
+    LocalAgreement,
+    TranscriptionQueue,
+    TranscriptionRequest,
+    UtteranceCollector,
+    Word,
+)
+
+SAMPLE_RATE = 16000
+
+
+def words(*words_: tuple[str, float]) -> list[Word]:
+    return [Word(text, end) for text, end in words_]
+
+
+def test_first_transcription_commits_nothing():
+    agreement = LocalAgreement(utterance=1)
+
+    partial = agreement.update(words((' Hello', 0.5), (' there', 1.)))
+
+    assert partial == 'Hello there'
+    assert agreement.committed_text == ''
+    assert agreement.committed_time == 0.
+
+
+def test_agreed_words_are_committed():
+    agreement = LocalAgreement(utterance=1)
+
+    agreement.update(words((' Hello', 0.5), (' there', 1.)))
+    partial = agreement.update(words((' Hello', 0.5), (' there', 1.), (' general', 1.6)))
+
+    assert partial == 'Hello there general'
+    assert agreement.committed_text == ' Hello there'
+    assert agreement.committed_time == 1.
+
+
+def test_last_word_is_not_committed():
+    agreement = LocalAgreement(utterance=1)
+
+    agreement.update(words((' Hello', 0.5), (' there', 1.)))
+    agreement.update(words((' Hello', 0.5), (' there', 1.)))
+
+    # It may have been cut off by the end of the audio
+    assert agreement.committed_text == ' Hello'
+    assert agreement.committed_time == 0.5
+
+
+def test_commits_accumulate_across_passes():
+    agreement = LocalAgreement(utterance=1)
+
+    agreement.update(words((' One', 0.4), (' two', 0.8), (' three', 1.2)))
+    agreement.update(words((' One', 0.4), (' two', 0.8), (' three', 1.3)))
+    assert agreement.committed_text == ' One two'
+    assert agreement.committed_time == pytest.approx(0.8)
+
+    # Later transcriptions only cover the audio after the committed time
+    partial = agreement.update(words((' three', 0.5), (' four', 0.9)))
+    assert partial == 'One two three four'
+    assert agreement.committed_time == pytest.approx(1.3)
+
+    partial = agreement.update(words((' four', 0.4), (' five', 0.9)))
+
+    assert partial == 'One two three four five'
+    assert agreement.committed_text == ' One two three four'
+    assert agreement.committed_time == pytest.approx(1.7)
+
+
+def test_disagreement_stops_the_commit():
+    agreement = LocalAgreement(utterance=1)
+
+    agreement.update(words((' I', 0.2), (' scream', 0.6), (' for', 0.8), (' you', 1.)))
+    agreement.update(words((' I', 0.2), (' screamed', 0.6), (' for', 0.8), (' you', 1.)))
+
+    assert agreement.committed_text == ' I'
+
+
+def test_case_and_punctuation_are_ignored():
+    agreement = LocalAgreement(utterance=1)
+
+    agreement.update(words((' hello,', 0.5), (' world', 1.)))
+    agreement.update(words((' Hello', 0.5), (' world.', 1.), (' Again', 1.5)))
+
+    assert agreement.committed_text == ' Hello world.'
+
+
+def test_finalize_appends_the_rest():
+    agreement = LocalAgreement(utterance=1)
+
+    agreement.update(words((' Hello', 0.5), (' there', 1.)))
+    agreement.update(words((' Hello', 0.5), (' there', 1.)))
+
+    assert agreement.finalize('there, friend.') == 'Hello there, friend.'
+    assert LocalAgreement(utterance=2).finalize('Hi.') == 'Hi.'
+
+
+def request(
+        utterance: int,
+        duration: float = 1.,
+        start: int | None = None,
+        final: bool = True,
+        created: float = None,
+) -> TranscriptionRequest:
+    samples = round(duration * SAMPLE_RATE)
+    signal = np.arange(samples, dtype=np.float32) + (start or 0)
+
+    return TranscriptionRequest(
+        Audio(signal, SAMPLE_RATE),
+        utterance,
+        final=final,
+        start=start,
+        created=time.monotonic() if created is None else created,
+    )
+
+
+def test_finals_come_before_the_latest_partial():
+    queue = TranscriptionQueue(merge_duration=0.)
+
+    queue.put(request(1, final=False))
+    queue.put(request(1))
+    queue.put(request(2, final=False))
+    queue.put(request(2, duration=2., final=False))
+
+    final = queue.get()
+    partial = queue.get()
+
+    assert (final.utterance, final.final) == (1, True)
+    assert (partial.utterance, partial.final, partial.audio.len_seconds) == (2, False, 2.)
+    assert len(queue) == 0
+
+
+def test_final_supersedes_partial():
+    queue = TranscriptionQueue()
+
+    queue.put(request(1, final=False))
+    queue.put(request(1))
+
+    assert queue.get().final
+    assert len(queue) == 0
+
+
+def test_oldest_dropped_when_full():
+    queue = TranscriptionQueue(max_size=2, merge_duration=0.)
+
+    for utterance in range(3):
+        queue.put(request(utterance))
+
+    assert [queue.get().utterance for _ in range(2)] == [1, 2]
+    assert queue.overflow_drops == 1
+
+
+def test_stale_dropped():
+    queue = TranscriptionQueue(max_age=10., merge_duration=0.)
+
+    queue.put(request(1, created=time.monotonic() - 11.))
+    queue.put(request(2))
+
+    assert queue.get().utterance == 2
+    assert queue.stale_drops == 1
+
+
+def test_consecutive_finals_merged_up_to_duration():
+    queue = TranscriptionQueue(merge_duration=2.5)
+
+    queue.put(request(1, start=0))
+    queue.put(request(2, start=2 * SAMPLE_RATE))
+    queue.put(request(3, start=4 * SAMPLE_RATE))
+
+    merged = queue.get()
+    assert merged.utterance == 1
+    assert merged.audio.len_seconds == 2.
+    assert queue.merges == 1
+
+    assert queue.get().utterance == 3
+
+
+def test_merge_skips_shared_audio():
+    queue = TranscriptionQueue()
+
+    # The second starts half a second before the first ends, e.g. with its pre-roll
+    queue.put(request(1, start=0))
+    queue.put(request(2, start=SAMPLE_RATE // 2))
+
+    merged = queue.get()
+
+    np.testing.assert_array_equal(merged.audio.signal, np.arange(1.5 * SAMPLE_RATE))
+
+
+def test_not_merged_without_start():
+    queue = TranscriptionQueue()
+
+    queue.put(request(1))
+    queue.put(request(2))
+
+    assert queue.get().utterance == 1
+    assert queue.get().utterance == 2
+
+
+def test_collected_utterances_merge_without_repeating_audio():
+    collector = UtteranceCollector(min_duration=0., pre_buffer_duration=0.35)
+    queue = TranscriptionQueue()
+    block_size = SAMPLE_RATE // 10
+
+    # The pre-roll of the second utterance starts in the first
+    voice = [False] * 5 + [True] * 5 + [False] + [True] * 5 + [False]
+    for i, voice_detected in enumerate(voice):
+        signal = np.arange(i * block_size, (i + 1) * block_size, dtype=np.float32)
+
+        if (request_ := collector.add(Audio(signal, SAMPLE_RATE), voice_detected)) is not None:
+            queue.put(request_)
+
+    merged = queue.get()
+
+    # From the pre-roll of the first utterance to the end of the second
+    np.testing.assert_array_equal(merged.audio.signal, np.arange(3 * block_size, 16 * block_size))
+    assert merged.pre_roll == 2 * block_size
+
+
+def test_repeated_messages_are_not_collected_again():
+    collector = UtteranceCollector(min_duration=0., pre_buffer_duration=0.35)
+    queue = TranscriptionQueue()
+    block_size = SAMPLE_RATE // 10
+
+    def add(sequence: int, voice_detected: bool) -> None:
+        signal = np.arange(sequence * block_size, (sequence + 1) * block_size, dtype=np.float32)
+        audio = EncodedAudio.encode(signal.reshape(-1, 1), SAMPLE_RATE, sequence, encoding='float32')
+
+        if (request_ := collector.add(audio, voice_detected)) is not None:
+            queue.put(request_)
+
+    for sequence in range(5):
+        add(sequence, False)
+
+    for start, stop in ((5, 9), (11, 15)):
+        for sequence in range(start, stop + 1):
+            add(sequence, True)
+
+        # The message voice stopped in is passed again, to end the voice
+        add(stop, False)
+
+        if stop == 9:
+            add(10, False)
+
+    merged = queue.get()
+
+    np.testing.assert_array_equal(merged.audio.signal, np.arange(3 * block_size, 16 * block_size))
+    assert merged.pre_roll == 2 * block_size
@@ -0,0 +1,60 @@
+import numpy as np
+from voicebox.audio import Audio
+
+from rizmo.audio.trim import SpeechTrimmer
+
+SAMPLE_RATE = 16000
+
+
+def _tone(duration: float, amplitude: float) -> np.ndarray:
+    t = np.arange(round(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 200 * t)).astype(np.float32)
+
+
+def _noise(duration: float, amplitude: float = 0.001) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return (amplitude * rng.standard_normal(round(duration * SAMPLE_RATE))).astype(np.float32)
+
+
+def test_trims_silence_around_speech():
+    trimmer = SpeechTrimmer(margin=0.)
+    signal = np.concatenate([_noise(1.), _tone(1., 0.1), _noise(1.)])
+
+    speech = trimmer(Audio(signal, SAMPLE_RATE), noise=SAMPLE_RATE)
+
+    assert abs(speech.len_seconds - 1.) < 0.05
+
+
+def test_all_speech_is_not_rejected():
+    trimmer = SpeechTrimmer()
+
+    speech = trimmer(Audio(_tone(2., 0.1), SAMPLE_RATE))
+
+    assert speech is not None
+    assert speech.len_seconds == 2.
+
+
+def test_noise_is_rejected():
+    trimmer = SpeechTrimmer()
+
+    assert trimmer(Audio(_noise(2.), SAMPLE_RATE), noise=SAMPLE_RATE) is None
+    assert trimmer.rejected == 1
+
+
+def test_noise_floor_from_pre_roll():
+    trimmer = SpeechTrimmer(margin=0.)
+
+    # Louder than the absolute noise floor allows, but quieter than the speech
+    noise = _noise(1., amplitude=0.02)
+    signal = np.concatenate([noise, _tone(1., 0.3), noise])
+
+    speech = trimmer(Audio(signal, SAMPLE_RATE), noise=len(noise))
+
+    assert abs(speech.len_seconds - 1.) < 0.05
+
+
+def test_not_rejected_if_reject_is_false():
+    trimmer = SpeechTrimmer()
+    audio = Audio(_noise(0.5), SAMPLE_RATE)
+
+    assert trimmer(audio, reject=False) is audio
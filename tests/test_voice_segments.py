@@ -0,0 +1,147 @@
+import asyncio
+
+import numpy as np
+
+from rizmo.audio.codec import EncodedAudio
+from rizmo.audio.transcription import TranscriptionQueue, UtteranceCollector
+from rizmo.audio.voice_segments import VoiceSegmentEvent, VoiceSegmentReceiver
+
+SAMPLE_RATE = 16000
+BLOCK_SIZE = 1600
+"""Samples per message, i.e. 0.1 seconds."""
+
+
+class Recorder:
+    def __init__(self, pre_roll: float = 1.):
+        self.passed: list[tuple[int, bool]] = []
+        self.lengths: list[int] = []
+        self.receiver = VoiceSegmentReceiver(self.handle, pre_roll=pre_roll)
+
+    async def handle(self, topic, data) -> None:
+        audio, _, voice_detected = data
+        self.passed.append((audio.sequence, voice_detected))
+        self.lengths.append(len(audio))
+
+    async def audio(self, sequence: int) -> None:
+        # Numbered samples, so repeated audio can be found
+        signal = np.arange(sequence * BLOCK_SIZE, (sequence + 1) * BLOCK_SIZE, dtype=np.float32).reshape(-1, 1)
+        audio = EncodedAudio.encode(signal, SAMPLE_RATE, sequence)
+        await self.receiver.handle_audio('audio', (audio, float(sequence)))
+
+    async def event(self, voice_detected: bool, sequence: int) -> None:
+        offset = 0 if voice_detected else BLOCK_SIZE
+        await self.receiver.handle_event('voice_segment', VoiceSegmentEvent(voice_detected, sequence, offset, 0.))
+
+
+def test_events_after_their_audio():
+    async def run(recorder: Recorder) -> None:
+        for sequence in range(3):
+            await recorder.audio(sequence)
+
+        await recorder.audio(3)
+        await recorder.event(True, 3)
+        await recorder.audio(4)
+        await recorder.audio(5)
+        await recorder.event(False, 5)
+
+    recorder = Recorder()
+    asyncio.run(run(recorder))
+
+    # The voice ends with the stop event, without waiting for more audio,
+    # or repeating the audio of the message it stopped in
+    assert recorder.passed == [(0, False), (1, False), (2, False), (3, True), (4, True), (5, True), (5, False)]
+    assert recorder.lengths[-1] == 0
+
+
+def test_events_before_their_audio():
+    async def run(recorder: Recorder) -> None:
+        for sequence in range(3):
+            await recorder.audio(sequence)
+
+        await recorder.event(True, 3)
+        await recorder.audio(3)
+        await recorder.audio(4)
+        await recorder.event(False, 5)
+        await recorder.audio(5)
+        await recorder.audio(6)
+
+    recorder = Recorder()
+    asyncio.run(run(recorder))
+
+    assert recorder.passed == [(0, False), (1, False), (2, False), (3, True), (4, True), (5, False)]
+
+
+def test_pre_roll_is_limited():
+    async def run(recorder: Recorder) -> None:
+        for sequence in range(10):
+            await recorder.audio(sequence)
+
+        await recorder.event(True, 10)
+        await recorder.audio(10)
+
+    recorder = Recorder(pre_roll=0.3)
+    asyncio.run(run(recorder))
+
+    assert recorder.passed == [(7, False), (8, False), (9, False), (10, True)]
+
+
+def test_lost_stop_message_ends_voice_at_next_message():
+    async def run(recorder: Recorder) -> None:
+        await recorder.event(True, 0)
+        await recorder.audio(0)
+        await recorder.event(False, 1)
+        await recorder.audio(2)
+
+    recorder = Recorder()
+    asyncio.run(run(recorder))
+
+    assert recorder.passed == [(0, True), (2, False)]
+
+
+def test_sequence_restart_resets():
+    async def run(recorder: Recorder) -> None:
+        await recorder.event(True, 5)
+        await recorder.audio(5)
+
+        # The mic node restarted
+        await recorder.audio(0)
+        await recorder.audio(1)
+        await recorder.event(True, 1)
+        await recorder.event(False, 2)
+        await recorder.audio(2)
+
+    recorder = Recorder()
+    asyncio.run(run(recorder))
+
+    assert recorder.passed == [(5, True), (0, False), (1, True), (2, False)]
+
+
+def test_collected_utterances_do_not_repeat_audio():
+    collector = UtteranceCollector(min_duration=0., pre_buffer_duration=0.35)
+    queue = TranscriptionQueue()
+
+    class CollectingRecorder(Recorder):
+        async def handle(self, topic, data) -> None:
+            audio, _, voice_detected = data
+            if (request := collector.add(audio, voice_detected)) is not None:
+                queue.put(request)
+
+    async def run(recorder: Recorder) -> None:
+        for sequence in range(5):
+            await recorder.audio(sequence)
+
+        # Each event arrives after its audio, like from a VAD
+        for start, stop in ((5, 9), (11, 15)):
+            for sequence in range(start, stop + 1):
+                await recorder.audio(sequence)
+                if sequence == start:
+                    await recorder.event(True, start)
+
+            await recorder.event(False, stop)
+            await recorder.audio(stop + 1)
+
+    asyncio.run(run(CollectingRecorder(pre_roll=0.35)))
+
+    # The second utterance's pre-roll overlaps the first, and both are merged
+    merged = queue.get()
+    np.testing.assert_array_equal(merged.audio.signal, np.arange(3 * BLOCK_SIZE, 16 * BLOCK_SIZE))